@@ -432,6 +432,21 @@ pass""",
                 s='first\\nsecond\\nthird'
         2=Pass @ 5.0  -  5.4""")
 
+def test_ranges_dont_depend_on_neighbours():
+    source = dedent("""\
+        x = f([c[1:], {d: e}], g(h)(i), k=-m.n)
+        if p and q:
+            r = 'õ' + s  # comment
+        """)
+    root = ast.parse(source)
+    ast_utils.mark_text_ranges(root, source)
+    
+    texts = sorted(ast_utils.extract_text_range(source, node) for node in ast.walk(root)
+                   if isinstance(node, ast.expr) and not isinstance(node, ast.Slice))
+    assert texts == ["'õ'", "'õ' + s", '-m.n', '1', '[c[1:], {d: e}]', 'c', 'c[1:]', 'd', 'e', 
+                     'f', 'f([c[1:], {d: e}], g(h)(i), k=-m.n)', 'g', 'g(h)', 'g(h)(i)', 
+                     'h', 'i', 'm', 'm.n', 'p', 'p and q', 'q', 'r', 's', 'x', '{d: e}']
+
 def check_marked_ast(source, expected_pretty_ast
                      #,expected_for_py_34=None
                      ):
@@ -0,0 +1,115 @@
+"""
+Measures syntax coloring latency of opening generated files of increasing
+size and typing in the middle of them. Typing ordinary code should cost 
+roughly the same in every file. Opening a file or a triple-quoted string 
+gets colored in time slices, so the longest step should also stay short.
+
+Needs a display.
+
+Run with:
+    python tests/benchmarks/coloring_benchmark.py
+"""
+import time
+import tkinter as tk
+import tkinter.font as tk_font
+
+from thonny.globals import register_workbench
+from thonny.plugins.coloring import CodeViewSyntaxColorer
+from thonny.workbench import WorkbenchEvent
+
+FUNCTION_TEMPLATE = '''
+def function_{0}(a, b="text {0}", *args, **kw):
+    """Docstring of function {0}
+    spanning 2 lines"""
+    result = [a + i for i in range(10)] # comment with "quotes"
+    if isinstance(b, str) and kw.get('flag', False):
+        return (a, b[1:], result)
+    return print("Value:", result, sep='')
+
+'''
+
+TYPED_CODE = "x = len('abc') # comment\n"
+
+
+class BenchmarkWorkbench:
+    def get_option(self, name):
+        return True
+
+
+def create_source(line_count):
+    parts = []
+    while len(parts) * FUNCTION_TEMPLATE.count("\n") < line_count:
+        parts.append(FUNCTION_TEMPLATE.format(len(parts)))
+    return "".join(parts)
+
+
+def complete_coloring(root, colorer):
+    """Processes Tk events until background coloring is done. 
+    Returns total time and the time of the longest step"""
+    start = time.perf_counter()
+    longest_step = 0
+    while colorer._background_job is not None:
+        step_start = time.perf_counter()
+        root.tk.dooneevent()
+        longest_step = max(longest_step, time.perf_counter() - step_start)
+    return time.perf_counter() - start, longest_step
+
+
+def type_text(root, text, colorer, index, chars):
+    """Inserts chars one by one and returns seconds spent 
+    for the first coloring step and the longest step after each of them"""
+    durations = []
+    for ch in chars:
+        index = text.index(index)
+        text.insert(index, ch)
+        start = time.perf_counter()
+        colorer.schedule_update(WorkbenchEvent("TextInsert", index=index, text=ch,
+                                               tags=(), text_widget=text))
+        text.update_idletasks()
+        first_step = time.perf_counter() - start
+        _, longest_step = complete_coloring(root, colorer)
+        durations.append(max(first_step, longest_step))
+        index = index + "+1c"
+    return durations
+
+
+def measure(root, source):
+    text = tk.Text(root)
+    text.pack()
+    font = tk_font.nametofont("TkFixedFont")
+    colorer = CodeViewSyntaxColorer(text, font, font)
+    text.insert("1.0", source)
+    start = time.perf_counter()
+    colorer.schedule_update(WorkbenchEvent("TextInsert", index="1.0", text=source,
+                                           tags=(), text_widget=text))
+    text.update_idletasks()
+    first_step = time.perf_counter() - start
+    total_time, longest_step = complete_coloring(root, colorer)
+
+    middle = "%d.0" % (source.count("\n") // 2)
+    text.see(middle)
+    typing = type_text(root, text, colorer, middle, TYPED_CODE)
+    opening = type_text(root, text, colorer, middle, '"""')
+    text.destroy()
+    return (first_step, first_step + total_time, max(first_step, longest_step), 
+            typing, opening)
+
+
+def run_benchmarks():
+    root = tk.Tk()
+    register_workbench(BenchmarkWorkbench())
+
+    print("{:>8} {:>11} {:>10} {:>11} {:>11} {:>11} {:>13}".format(
+        "Lines", "Open 1st ms", "Open all s", "Open max ms",
+        "Typing ms", "Typing max", "Quotes max ms"))
+    for line_count in [1000, 5000, 10000, 20000]:
+        first_step, total_time, longest_step, typing, opening = measure(
+            root, create_source(line_count))
+        print("{:>8} {:>11.2f} {:>10.3f} {:>11.2f} {:>11.2f} {:>11.2f} {:>13.2f}".format(
+            line_count, first_step * 1000, total_time, longest_step * 1000, 
+            sum(typing) / len(typing) * 1000, max(typing) * 1000, max(opening) * 1000))
+
+    root.destroy()
+
+if __name__ == "__main__":
+    run_benchmarks()
@@ -0,0 +1,105 @@
+"""
+Compares the time of running a CPU-bound program with Run, with Debug
+(stepping out of the main module, ie. all code gets traced, but the debugger
+doesn't stop), with Debug running to a breakpoint at the last line
+and the time of single step-over commands in a loop body.
+
+The program spends most of its time in the standard library, which the
+debugger should skip cheaply.
+
+Run with:
+    python tests/benchmarks/debugger_benchmark.py [python_executable]
+"""
+import os.path
+import sys
+import tempfile
+import time
+
+from debugger_driver import DebuggerDriver
+
+PROGRAM = """
+import json
+import re
+from collections import OrderedDict
+
+def work(n):
+    total = 0
+    for i in range(n):
+        data = OrderedDict([("a", i), ("b", [i] * 5)])
+        total += len(json.dumps(data))
+        total += len(re.findall(r"\\d", str(i)))
+    return total
+
+result = 0
+for i in range(10):
+    result += work(1000)
+print(result)
+"""
+
+STEP_COUNT = 200
+
+def measure(executable, filename):
+    # frontend starts new process with the script as argument for Run and Debug
+    driver = DebuggerDriver(executable, filename)
+    try:
+        start = time.perf_counter()
+        msg = driver.run("Run", PROGRAM)
+        assert msg["message_type"] == "ToplevelResult", msg
+        run_time = time.perf_counter() - start
+    finally:
+        driver.close()
+
+    driver = DebuggerDriver(executable, filename)
+    try:
+        start = time.perf_counter()
+        msg = driver.run("Debug", PROGRAM)
+        while msg["message_type"] == "DebuggerProgress":
+            msg = driver.send_debugger_command("out")
+        debug_time = time.perf_counter() - start
+    finally:
+        driver.close()
+
+    driver = DebuggerDriver(executable, filename)
+    try:
+        last_line = PROGRAM.splitlines().index("print(result)") + 1
+        start = time.perf_counter()
+        msg = driver.run("Debug", PROGRAM, breakpoints={filename : [last_line]})
+        assert driver.stack[-1].last_event_focus.lineno == last_line, msg
+        breakpoint_time = time.perf_counter() - start
+    finally:
+        driver.close()
+
+    driver = DebuggerDriver(executable, filename)
+    try:
+        msg = driver.run("Debug", PROGRAM)
+        # step into the loop in work
+        while driver.stack[-1].code_name != "work" or driver.stack[-1].last_event_focus.lineno < 9:
+            msg = driver.send_debugger_command("step")
+
+        start = time.perf_counter()
+        for _ in range(STEP_COUNT):
+            msg = driver.send_debugger_command("exec")
+            assert msg["message_type"] == "DebuggerProgress", msg
+        step_time = (time.perf_counter() - start) / STEP_COUNT
+    finally:
+        driver.close()
+
+    return run_time, debug_time, breakpoint_time, step_time
+
+
+def run_benchmarks(executable):
+    with tempfile.TemporaryDirectory() as temp_dir:
+        filename = os.path.join(temp_dir, "cpu_bound.py")
+        with open(filename, "w") as fp:
+            fp.write(PROGRAM)
+
+        run_time, debug_time, breakpoint_time, step_time = measure(executable, filename)
+
+    print("Run:           {:8.3f} s".format(run_time))
+    print("Debug:         {:8.3f} s ({:.1f}x)".format(debug_time, debug_time / run_time))
+    print("To breakpoint: {:8.3f} s ({:.1f}x)".format(breakpoint_time, 
+                                                     breakpoint_time / run_time))
+    print("Step over:     {:8.2f} ms/step".format(step_time * 1000))
+
+if __name__ == "__main__":
+    run_benchmarks(sys.argv[1] if len(sys.argv) > 1 else sys.executable)
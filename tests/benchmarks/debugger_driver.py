@@ -0,0 +1,84 @@
+"""
+Headless debugger driver for benchmarks.
+
+Starts the backend the same way as CPythonProxy does for Run and Debug
+(backend_launcher.py with the script as argument, message protocol chosen by
+the backend's ready message) and talks to it with the same messages as the
+debugger plugin. Records latency and size of the messages answering the commands.
+"""
+import os.path
+import subprocess
+import tempfile
+import time
+
+from thonny.common import ToplevelCommand, DebuggerCommand, SUPPORTED_PROTOCOLS,\
+    MESSAGE_PROTOCOLS_ENV_VAR, TEXT_PROTOCOL, read_message, read_message_bytes,\
+    decode_message, write_message, update_stack
+
+LAUNCHER = os.path.join(os.path.dirname(__file__), "..", "..",
+                        "thonny", "shared", "backend_launcher.py")
+
+
+class DebuggerDriver:
+    def __init__(self, executable, filename, args=[]):
+        env = os.environ.copy()
+        env["PYTHONIOENCODING"] = "ASCII"
+        env["PYTHONUNBUFFERED"] = "1"
+        env.setdefault("THONNY_USER_DIR", tempfile.mkdtemp())
+        env[MESSAGE_PROTOCOLS_ENV_VAR] = ",".join(SUPPORTED_PROTOCOLS)
+        self._filename = filename
+        self._args = args
+        self._proc = subprocess.Popen([executable, "-u", "-B", LAUNCHER, filename] + args,
+                                      stdin=subprocess.PIPE,
+                                      stdout=subprocess.PIPE,
+                                      stderr=subprocess.DEVNULL,
+                                      env=env)
+        ready = read_message(self._proc.stdout, TEXT_PROTOCOL)
+        assert ready is not None, "Backend didn't start"
+        self._protocol = ready["message_protocol"]
+
+        self.stack = [] # complete FrameInfo-s, as seen by the debugger plugin
+        self._code_sources = {}
+        self.latencies = [] # seconds from sending a command until the answer
+        self.message_sizes = [] # bytes of all messages on the way to the answer
+
+    def run(self, command_name, source, **kw):
+        """Sends Run or Debug command for the program
+        and returns first message expecting an answer"""
+        return self.send(ToplevelCommand(command=command_name,
+                                         source=source,
+                                         filename=self._filename,
+                                         full_filename=self._filename,
+                                         args=self._args,
+                                         **kw))
+
+    def send_debugger_command(self, command, **kw):
+        """Sends command about the topmost frame of the latest stack"""
+        frame = self.stack[-1]
+        return self.send(DebuggerCommand(command, frame_id=frame.id, state=frame.last_event,
+                                         focus=frame.last_event_focus, **kw))
+
+    def send(self, cmd):
+        """Sends the command and returns next message which expects an answer
+        (ie. it's not program output or progress reported on the fly)"""
+        start = time.perf_counter()
+        write_message(self._proc.stdin, cmd, self._protocol)
+        size = 0
+        while True:
+            data = read_message_bytes(self._proc.stdout, self._protocol)
+            assert data is not None, "Backend died"
+            size += len(data)
+            msg = decode_message(data, self._protocol)
+
+            if msg["message_type"] == "DebuggerProgress":
+                self.stack = update_stack(self.stack, msg["stack"], self._code_sources)
+
+            if (msg["message_type"] != "ProgramOutput"
+                and msg.get("command_context") != "running"):
+                self.latencies.append(time.perf_counter() - start)
+                self.message_sizes.append(size)
+                return msg
+
+    def close(self):
+        self._proc.kill()
+        self._proc.wait()
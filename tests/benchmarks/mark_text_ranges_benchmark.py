@@ -0,0 +1,53 @@
+"""
+Measures the time of ast_utils.mark_text_ranges on generated sources
+of increasing size. Time per line should stay roughly constant.
+
+Run with:
+    python tests/benchmarks/mark_text_ranges_benchmark.py
+"""
+import ast
+import time
+
+from thonny import ast_utils
+
+FUNCTION_TEMPLATE = '''
+def function_{0}(a, b=[1, 2, 3], *args, **kw):
+    """Docstring of function {0}"""
+    result = {{"key" : [a + i * b[0] for i in range(10)], "size" : len(args)}}
+    if result["size"] > 2 and kw.get("flag", False):
+        return (a, b[1:], result["key"][::-1])
+    else:
+        print("Value:", result, sep="")
+    return f(g(h(a, [b, (a, {{b}})]), kw), -a).attribute[0]
+
+'''
+
+# generated code tends to have long expressions
+EXPRESSION_TEMPLATE = "value_{0} = [" + ", ".join(["(x + {0}) * y"] * 30) + "]\n"
+
+def create_source(function_count):
+    parts = []
+    for i in range(function_count):
+        parts.append(FUNCTION_TEMPLATE.format(i))
+        parts.append(EXPRESSION_TEMPLATE.format(i))
+    return "".join(parts)
+
+
+def measure(source):
+    root = ast.parse(source)
+    start = time.perf_counter()
+    ast_utils.mark_text_ranges(root, source)
+    return time.perf_counter() - start
+
+
+def run_benchmarks():
+    print("{:>8} {:>10} {:>12}".format("Lines", "Time (s)", "us/line"))
+    for function_count in [50, 100, 200, 400, 800]:
+        source = create_source(function_count)
+        line_count = source.count("\n")
+        duration = measure(source)
+        print("{:>8} {:>10.3f} {:>12.1f}".format(line_count, duration,
+                                                 duration / line_count * 1e6))
+
+if __name__ == "__main__":
+    run_benchmarks()
@@ -0,0 +1,89 @@
+"""
+Measures encoding and decoding speed and size of typical backend messages
+with all supported message protocols.
+
+Run with:
+    python tests/benchmarks/message_protocol_benchmark.py
+"""
+import io
+import time
+
+from thonny.common import FrameInfo, TextRange, SUPPORTED_PROTOCOLS,\
+    encode_message, read_message
+
+SOURCE = "".join("x%d = f(x%d, [1, 2, 3], 'abc')\n" % (i, i-1) for i in range(60))
+
+
+def create_program_output_message(i):
+    return {"message_type" : "ProgramOutput",
+            "stream_name" : "stdout",
+            "data" : "Iteration %d of the loop\n" % i,
+            "cwd" : "/home/student/projects"}
+
+def create_debugger_progress_message(i):
+    stack = []
+    for depth in range(5):
+        local_vars = {}
+        for j in range(10):
+            local_vars["var%d" % j] = {"id" : 140000000 + j,
+                                       "repr" : repr(list(range(j))),
+                                       "type_name" : "list"}
+        focus = TextRange(depth + 1, 4, depth + 1, 20)
+        stack.append(FrameInfo(
+            id=139000000 + depth,
+            filename="/home/student/projects/prog.py",
+            module_name="__main__",
+            code_name="f" if depth else "<module>",
+            locals=local_vars,
+            source=SOURCE,
+            firstlineno=1,
+            last_event="after_expression",
+            last_event_args={"text_range" : (depth + 1, 4, depth + 1, 20),
+                             "node_tags" : "class=Call,last_child,child_of_statement",
+                             "value" : {"id" : 1400000, "repr" : str(i), "type_name" : "int"},
+                             "parent_range" : (depth + 1, 0, depth + 1, 22)},
+            last_event_focus=focus))
+
+    return {"message_type" : "DebuggerProgress",
+            "command" : "step",
+            "stack" : stack,
+            "exception" : None,
+            "exception_msg" : None,
+            "exception_lower_stack_description" : None,
+            "value" : {"id" : 1400000, "repr" : str(i), "type_name" : "int"},
+            "command_context" : "waiting_debugger_command",
+            "cwd" : "/home/student/projects"}
+
+
+def measure(create_message, protocol, count):
+    messages = [create_message(i) for i in range(count)]
+
+    start = time.perf_counter()
+    encoded = [encode_message(msg, protocol) for msg in messages]
+    encoding_time = time.perf_counter() - start
+
+    stream = io.BytesIO(b"".join(encoded))
+    start = time.perf_counter()
+    for _ in range(count):
+        assert read_message(stream, protocol) is not None
+    decoding_time = time.perf_counter() - start
+
+    total_bytes = sum(map(len, encoded))
+    return (count / encoding_time, count / decoding_time, total_bytes / count)
+
+
+def run_benchmarks():
+    print("{:<20} {:<10} {:>14} {:>14} {:>12}".format(
+        "Message", "Protocol", "encode msg/s", "decode msg/s", "bytes/msg"))
+
+    for name, create_message, count in [
+        ("ProgramOutput", create_program_output_message, 50000),
+        ("DebuggerProgress", create_debugger_progress_message, 500),
+        ]:
+        for protocol in SUPPORTED_PROTOCOLS:
+            encode_speed, decode_speed, size = measure(create_message, protocol, count)
+            print("{:<20} {:<10} {:>14.0f} {:>14.0f} {:>12.0f}".format(
+                name, protocol, encode_speed, decode_speed, size))
+
+if __name__ == "__main__":
+    run_benchmarks()
@@ -0,0 +1,125 @@
+"""
+Steps through sample programs with scripted debugger commands and reports
+per-command latency, size of messages and total time for each program
+and command. Meant for catching performance regressions in FancyTracer.
+
+Each scenario repeats one command until the program completes
+(or MAX_COMMANDS is reached). "line" runs repeatedly to given line.
+
+Run with:
+    python tests/benchmarks/stepping_benchmark.py [python_executable]
+"""
+import os.path
+import sys
+import tempfile
+import time
+
+from debugger_driver import DebuggerDriver
+
+PROGRAMS = {
+    "recursion" : ("""
+def fact(n):
+    if n <= 1:
+        return 1
+    result = n * fact(n - 1)
+    return result
+
+values = [fact(30), fact(20)]
+print(values)
+""", 5),
+
+    "loops" : ("""
+total = 0
+rows = []
+for i in range(10):
+    row = []
+    for j in range(5):
+        total += i * j
+        row.append(total % 7)
+    rows.append(row)
+print(total, rows)
+""", 7),
+
+    "long_arguments" : ("""
+def combine(a, b, c, d, e, f, g, h, i, j, k, l, m, n, o, p):
+    return a + b + c + d + e + f + g + h + i + j + k + l + m + n + o + p
+
+results = []
+for x in range(5):
+    results.append(combine(x, 1, 2, 3, 4, 5, 6, 7, 8, 9, x * 2, 11, 12, 13, 14, x + 15))
+print(results)
+""", 3),
+
+    "comprehensions" : ("""
+words = ["alpha", "beta", "gamma", "delta", "epsilon"] * 3
+lengths = {w : len(w) for w in words}
+upper = [w.upper() for w in words if len(w) > 4]
+text = ", ".join(sorted(set(upper)))
+print(lengths, text)
+""", 5),
+
+    "classes" : ("""
+class Account:
+    def __init__(self, owner, balance=0):
+        self.owner = owner
+        self.balance = balance
+
+    def deposit(self, amount):
+        self.balance += amount
+        return self.balance
+
+accounts = [Account("owner%d" % i) for i in range(5)]
+for account in accounts:
+    account.deposit(10)
+    account.deposit(len(account.owner))
+print(sum(a.balance for a in accounts))
+""", 9),
+}
+
+COMMANDS = ["step", "exec", "out", "run_to_before", "line"]
+
+MAX_COMMANDS = 2000
+
+
+def measure(executable, filename, source, command, line):
+    driver = DebuggerDriver(executable, filename)
+    try:
+        start = time.perf_counter()
+        msg = driver.run("Debug", source)
+        while (msg["message_type"] == "DebuggerProgress"
+               and len(driver.latencies) < MAX_COMMANDS):
+            if command == "line":
+                msg = driver.send_debugger_command("line", target_filename=filename,
+                                                   target_lineno=line)
+            else:
+                msg = driver.send_debugger_command(command)
+        total_time = time.perf_counter() - start
+
+        # first answer comes after starting the program
+        return total_time, driver.latencies[1:], driver.message_sizes[1:]
+    finally:
+        driver.close()
+
+
+def run_benchmarks(executable):
+    print("{:<16} {:<14} {:>8} {:>9} {:>9} {:>9} {:>9} {:>9}".format(
+        "Program", "Command", "Commands", "Total s", "Mean ms", "Max ms", "Mean KB", "Max KB"))
+
+    with tempfile.TemporaryDirectory() as temp_dir:
+        for name in sorted(PROGRAMS):
+            source, line = PROGRAMS[name]
+            filename = os.path.join(temp_dir, name + ".py")
+            with open(filename, "w") as fp:
+                fp.write(source)
+
+            for command in COMMANDS:
+                total_time, latencies, sizes = measure(executable, filename, source,
+                                                       command, line)
+                count = max(len(latencies), 1)
+                print("{:<16} {:<14} {:>8} {:>9.3f} {:>9.2f} {:>9.2f} {:>9.1f} {:>9.1f}".format(
+                    name, command, len(latencies), total_time,
+                    sum(latencies) / count * 1000, max(latencies, default=0) * 1000,
+                    sum(sizes) / count / 1024, max(sizes, default=0) / 1024))
+
+if __name__ == "__main__":
+    run_benchmarks(sys.argv[1] if len(sys.argv) > 1 else sys.executable)
@@ -0,0 +1,55 @@
+import collections
+
+from thonny.shared.thonny.backend import bounded_repr
+
+
+def test_small_values_get_normal_repr():
+    recursive = [1, 2]
+    recursive.append(recursive)
+    recursive_tuple = ([],)
+    recursive_tuple[0].append(recursive_tuple)
+    for value in [1, "õun", b"\x00", (1,), (), set(), frozenset({1}), {1, 2},
+                  {"a" : [1, (2, 3)], 4 : {5}}, recursive, recursive_tuple, 
+                  3.5, None, bytearray(b"ab")]:
+        assert bounded_repr(value, 1000) == repr(value)
+
+
+def test_large_values_get_cut():
+    for value in [list(range(10**6)), "x" * 10**6, {i : i for i in range(10**5)},
+                  [[1] * 1000] * 1000, (frozenset([1, 2]),) * 10**5]:
+        result = bounded_repr(value, 100)
+        assert len(result) == 100
+        assert result == repr(value)[:97] + "..."
+
+
+def test_budget_is_exact_limit():
+    assert bounded_repr("abc", 5) == "'abc'"
+    assert bounded_repr("abcd", 5) == "'a..."
+    assert bounded_repr([1, 2, 3], 9) == "[1, 2, 3]"
+    assert bounded_repr([1, 2, 3], 8) == "[1, 2..."
+
+
+def test_cut_strings_keep_quotes_of_full_repr():
+    for value in ["x" * 100 + "'", "'" + "x" * 100 + '"', 
+                  b"x" * 100 + b"'", bytearray(b"'" + b"x" * 100 + b'"')]:
+        assert bounded_repr(value, 50) == repr(value)[:47] + "..."
+
+
+def test_container_subclasses():
+    Point = collections.namedtuple("Point", ["x", "y"])
+    
+    class MyList(list):
+        pass
+    
+    class MySet(set):
+        pass
+    
+    small_values = [Point(1, [2]), collections.OrderedDict([("a", 1)]), 
+                    collections.defaultdict(list, {1 : [2]}), collections.Counter("abca"),
+                    collections.Counter(), MyList([1, 2]), MySet({1}), MySet()]
+    for value in small_values:
+        assert bounded_repr(value, 1000) == repr(value)
+    
+    assert bounded_repr(MyList(range(10**6)), 100) == repr(list(range(100)))[:97] + "..."
+    assert (bounded_repr(collections.OrderedDict.fromkeys(range(10**6)), 30) 
+            == "OrderedDict({0: None, 1: No...")
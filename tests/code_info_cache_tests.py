@@ -0,0 +1,23 @@
+import gc
+
+from thonny.shared.thonny.backend import _cache_code_info
+
+
+def test_entry_doesnt_keep_code_alive():
+    cache = {}
+    code = compile("x = 1", "<test>", "exec")
+    _cache_code_info(cache, code, True)
+    assert cache[id(code)][1] is True
+    
+    del code
+    gc.collect()
+    assert cache == {}
+
+
+def test_cleared_cache_can_be_filled_again():
+    cache = {}
+    code = compile("x = 1", "<test>", "exec")
+    _cache_code_info(cache, code, 1)
+    cache.clear()
+    _cache_code_info(cache, code, 2)
+    assert cache[id(code)][1] == 2
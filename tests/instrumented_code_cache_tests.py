@@ -0,0 +1,81 @@
+import marshal
+import os
+import tempfile
+
+from thonny.shared.thonny.backend import InstrumentedCodeCache
+
+
+def create_counting_compiler():
+    calls = []
+    def create_code(source, filename, mode):
+        calls.append(source)
+        return compile(source, filename, mode)
+    
+    return create_code, calls
+
+
+def test_code_gets_created_once_per_source():
+    with tempfile.TemporaryDirectory() as temp_dir:
+        create_code, calls = create_counting_compiler()
+        
+        code1 = InstrumentedCodeCache(temp_dir, 10).get_code("x = 1", "a.py", "exec", create_code)
+        # another backend process
+        code2 = InstrumentedCodeCache(temp_dir, 10).get_code("x = 1", "a.py", "exec", create_code)
+        InstrumentedCodeCache(temp_dir, 10).get_code("x = 2", "a.py", "exec", create_code)
+        InstrumentedCodeCache(temp_dir, 10).get_code("x = 1", "b.py", "exec", create_code)
+        
+        assert calls == ["x = 1", "x = 2", "x = 1"]
+        assert code1 == code2
+        assert code2.co_filename == "a.py"
+
+
+def test_least_recently_used_entries_get_removed():
+    with tempfile.TemporaryDirectory() as temp_dir:
+        create_code, calls = create_counting_compiler()
+        cache = InstrumentedCodeCache(temp_dir, 2)
+        for i in range(3):
+            cache.get_code("x = %d" % i, "a.py", "exec", create_code)
+            # make modification times distinguishable
+            for name in os.listdir(temp_dir):
+                path = os.path.join(temp_dir, name)
+                os.utime(path, (os.stat(path).st_mtime - 10,) * 2)
+        
+        assert len(os.listdir(temp_dir)) == 2
+        cache.get_code("x = 0", "a.py", "exec", create_code)
+        assert calls == ["x = 0", "x = 1", "x = 2", "x = 0"]
+
+
+def test_broken_entry_gets_recreated():
+    with tempfile.TemporaryDirectory() as temp_dir:
+        create_code, calls = create_counting_compiler()
+        cache = InstrumentedCodeCache(temp_dir, 10)
+        cache.get_code("x = 1", "a.py", "exec", create_code)
+        for name in os.listdir(temp_dir):
+            with open(os.path.join(temp_dir, name), "wb") as fp:
+                fp.write(b"\xff\x00")
+        
+        code = cache.get_code("x = 1", "a.py", "exec", create_code)
+        assert calls == ["x = 1", "x = 1"]
+        namespace = {}
+        exec(code, namespace)
+        assert namespace["x"] == 1
+
+
+def test_entry_of_unexpected_form_gets_recreated():
+    with tempfile.TemporaryDirectory() as temp_dir:
+        calls = []
+        def create_code(source, filename, mode):
+            calls.append(source)
+            return compile(source, filename, mode), []
+        def is_valid(result):
+            return isinstance(result, tuple) and len(result) == 2
+        
+        cache = InstrumentedCodeCache(temp_dir, 10)
+        cache.get_code("x = 1", "a.py", "exec", create_code, is_valid)
+        for name in os.listdir(temp_dir):
+            with open(os.path.join(temp_dir, name), "wb") as fp:
+                marshal.dump([1, 2, 3], fp)
+        
+        code, _ = cache.get_code("x = 1", "a.py", "exec", create_code, is_valid)
+        assert calls == ["x = 1", "x = 1"]
+        assert code.co_filename == "a.py"
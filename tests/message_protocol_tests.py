@@ -0,0 +1,38 @@
+import io
+import pickle
+
+from thonny.common import TextRange, FrameInfo, ToplevelCommand,\
+    TEXT_PROTOCOL, BINARY_PROTOCOL, choose_message_protocol,\
+    encode_message, read_message
+
+MESSAGE = {"message_type" : "DebuggerProgress",
+           "stack" : [FrameInfo(id=1, locals={"x" : {"id" : 2, "repr" : "'õun'", "type_name" : "str"}},
+                                last_event_focus=TextRange(1, 0, 1, 5))],
+           "values" : [1.5, None, True, (1, 2), {3, 4}, b"\x00\xff"],
+           "cwd" : "/tmp"}
+
+
+def test_roundtrip_with_both_protocols():
+    for protocol in [TEXT_PROTOCOL, BINARY_PROTOCOL]:
+        stream = io.BytesIO(encode_message(MESSAGE, protocol)
+                            + encode_message(ToplevelCommand(command="Run"), protocol))
+        assert read_message(stream, protocol) == MESSAGE
+        assert read_message(stream, protocol) == ToplevelCommand(command="Run")
+        assert read_message(stream, protocol) is None
+
+
+def test_binary_protocol_rejects_unknown_classes():
+    payload = pickle.dumps(io.StringIO, protocol=4)
+    stream = io.BytesIO(len(payload).to_bytes(4, "big") + payload)
+    try:
+        read_message(stream, BINARY_PROTOCOL)
+    except pickle.UnpicklingError:
+        pass
+    else:
+        raise AssertionError("Forbidden class was unpickled")
+
+
+def test_protocol_negotiation():
+    assert choose_message_protocol("binary1,text") == BINARY_PROTOCOL
+    assert choose_message_protocol("binary99,text") == TEXT_PROTOCOL
+    assert choose_message_protocol("") == TEXT_PROTOCOL
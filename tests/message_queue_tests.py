@@ -0,0 +1,56 @@
+import threading
+import time
+
+from thonny.running import MessageQueue
+
+
+def _output(data, stream_name="stdout"):
+    return {"message_type" : "ProgramOutput", "stream_name" : stream_name, "data" : data}
+
+def _contents(queue):
+    result = []
+    while len(queue) > 0:
+        msg = queue.popleft()
+        result.append(msg.get("elided_chars", msg.get("data")))
+    return result
+
+
+def test_keep_tail_replaces_older_output_with_marker():
+    queue = MessageQueue(10, "keep_tail")
+    queue.append(_output("abcdef"))
+    queue.append({"message_type" : "InputRequest"})
+    queue.append(_output("ghijkl"))
+    queue.append(_output("mn"))
+
+    assert _contents(queue) == [4, "ef", None, "ghijkl", "mn"]
+
+
+def test_keep_tail_with_too_long_message():
+    queue = MessageQueue(5, "keep_tail")
+    queue.append(_output("abc"))
+    queue.append(_output("0123456789"))
+    assert _contents(queue) == [8, "56789"]
+
+
+def test_marker_stays_in_place_of_dropped_output():
+    queue = MessageQueue(4, "keep_tail")
+    queue.append(_output("abcdef"))
+    queue.append({"message_type" : "InputRequest"})
+    queue.append(_output("gh"))
+    queue.append(_output("ijkl"))
+    assert _contents(queue) == [6, None, 2, "ijkl"]
+
+
+def test_block_waits_until_output_is_consumed():
+    queue = MessageQueue(10, "block")
+    queue.append(_output("abcdefgh"))
+
+    def consume():
+        time.sleep(0.1)
+        queue.popleft()
+
+    threading.Thread(target=consume).start()
+    start_time = time.time()
+    queue.append(_output("xyz"))
+    assert time.time() - start_time >= 0.09
+    assert _contents(queue) == ["xyz"]
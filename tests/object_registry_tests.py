@@ -0,0 +1,58 @@
+from thonny.shared.thonny.backend import ObjectRegistry
+
+
+class Thing:
+    pass
+
+
+def test_least_recently_used_objects_get_evicted():
+    registry = ObjectRegistry(3)
+    values = [[i] for i in range(4)]
+    ids = [registry.add(value) for value in values[:3]]
+    registry.get(ids[0])
+    registry.add(values[3])
+
+    assert ids[0] in registry
+    assert ids[1] not in registry
+    assert [value for _, value in registry.items()] == [[2], [0], [3]]
+
+
+def test_weakly_referenced_objects_die_with_program_references():
+    registry = ObjectRegistry(10)
+    thing = Thing()
+    object_id = registry.add(thing)
+    assert registry.get(object_id) is thing
+
+    del thing
+    assert object_id not in registry
+    assert registry.get_size() == 0
+
+
+def test_pinned_objects_survive_eviction_and_program():
+    registry = ObjectRegistry(1)
+    thing = Thing()
+    object_id = registry.add(thing)
+    registry.set_pinned("inspector", [object_id])
+    registry.add([1])
+
+    del thing
+    assert object_id in registry
+    assert registry.get_size() == 2
+
+    registry.set_pinned("inspector", [])
+    assert object_id not in registry
+
+
+def test_pinned_values_get_replaced_by_owner():
+    registry = ObjectRegistry(10)
+    things = [Thing(), Thing()]
+    ids = [id(thing) for thing in things]
+    registry.set_pinned_values("debugger", things)
+    registry.set_pinned_values("shell", things[1:])
+
+    del things
+    assert all(object_id in registry for object_id in ids)
+
+    registry.set_pinned_values("debugger", [])
+    assert ids[0] not in registry
+    assert ids[1] in registry
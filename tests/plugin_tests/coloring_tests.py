@@ -1,6 +1,8 @@
 import tkinter
 
-from thonny.plugins.coloring import SyntaxColorer
+from thonny.globals import register_workbench
+from thonny.plugins.coloring import SyntaxColorer, CodeViewSyntaxColorer
+from thonny.workbench import WorkbenchEvent
 import tkinter.font as tk_font
 
 
@@ -39,8 +41,42 @@ def test_open_closed_strings():
     print("test passed")
 
 
+class _ColoringWorkbench:
+    def get_option(self, name):
+        return True
+
+
+def _get_ranges(text_widget, tag):
+    ranges = text_widget.tag_ranges(tag)
+    return set([(str(ranges[i]), str(ranges[i+1])) for i in range(0, len(ranges), 2)])
+
+
+def test_typed_triple_quotes_recolor_following_lines():
+    register_workbench(_ColoringWorkbench())
+    text_widget = tkinter.Text()
+    font = tk_font.nametofont("TkDefaultFont")
+    colorer = CodeViewSyntaxColorer(text_widget, font, font)
+
+    text_widget.insert("1.0", "a = 1\nb = 2\nc = 3\n")
+    colorer.schedule_update(WorkbenchEvent("TextInsert", index="1.0", text="a = 1\nb = 2\nc = 3\n"))
+    text_widget.update_idletasks()
+    assert _get_ranges(text_widget, "STRING_OPEN3") == set()
+
+    text_widget.insert("2.0", '"""')
+    colorer.schedule_update(WorkbenchEvent("TextInsert", index="2.0", text='"""'))
+    text_widget.update_idletasks()
+    assert _get_ranges(text_widget, "STRING_OPEN3") == {("2.0", "5.0")}
+
+    text_widget.insert("3.5", '"""')
+    colorer.schedule_update(WorkbenchEvent("TextInsert", index="3.5", text='"""'))
+    text_widget.update_idletasks()
+    assert _get_ranges(text_widget, "STRING_OPEN3") == set()
+    assert _get_ranges(text_widget, "STRING_CLOSED3") == {("2.0", "3.8")}
+
+
 def run_tests():
     test_open_closed_strings()
+    test_typed_triple_quotes_recolor_following_lines()
 
 if __name__ == "__main__":
     print("Test input: ")
@@ -1,6 +1,7 @@
 import tkinter
 
 from thonny.plugins.locals_marker import LocalsHighlighter
+from thonny.text_analysis import get_text_analysis
 
 TEST_STR1 = """num_cars = 3
 def foo():
@@ -26,7 +27,8 @@ def test_regular_closed():
 
     highlighter = LocalsHighlighter(text_widget)
 
-    actual_local = highlighter.get_positions()
+    snapshot = get_text_analysis(text_widget).get_snapshot()
+    actual_local = highlighter.get_positions_correct_but_using_private_parts(snapshot)
 
     assert actual_local == expected_local
     print("Passed.")
@@ -1,5 +1,10 @@
+import threading
+import time
 import tkinter
-from thonny.plugins.highlight_names import NameHighlighter
+
+from thonny.globals import register_workbench
+from thonny.plugins.highlight_names import BaseNameHighlighter, VariablesHighlighter
+from thonny.text_analysis import get_text_analysis
 
 
 TEST_STR1 = """def foo():
@@ -85,13 +90,13 @@ def _assert_returns_correct_indices(insert_pos_groups, expected_indices, input_s
     text_widget = tkinter.Text()
     text_widget.insert("end", input_str)
 
-    nh = NameHighlighter()
-    nh.text = text_widget
+    nh = VariablesHighlighter(text_widget)
+    snapshot = get_text_analysis(text_widget).get_snapshot()
     for i, group in enumerate(insert_pos_groups):
         for insert_pos in group:
-            text_widget.mark_set("insert", insert_pos)
+            line, column = map(int, insert_pos.split("."))
 
-            actual = nh.get_positions()
+            actual = nh.get_positions_at(snapshot, (line, column))
             expected = expected_indices[i]
 
             assert actual == expected, "\nInsert position: %s" \
@@ -100,5 +105,123 @@ def _assert_returns_correct_indices(insert_pos_groups, expected_indices, input_s
         print("\rPassed %d of %d" % (i+1, len(insert_pos_groups)), end="")
     print()
 
+
+
+class _HighlightingWorkbench:
+    def get_option(self, name):
+        return True
+
+
+class _WordHighlighter(BaseNameHighlighter):
+    """Highlights the word at cursor and records the requests. 
+    Worker waits until proceed is set."""
+    def __init__(self, text):
+        super().__init__(text)
+        self.requests = []
+        self.proceed = threading.Event()
+        self.proceed.set()
+        
+    def get_positions_at(self, snapshot, pos):
+        self.requests.append((snapshot.revision, pos))
+        self.proceed.wait()
+        
+        line = snapshot.source.splitlines()[pos[0]-1]
+        start = end = pos[1]
+        while start > 0 and line[start-1].isalnum():
+            start -= 1
+        while end < len(line) and line[end].isalnum():
+            end += 1
+        
+        return {("%d.%d" % (pos[0], start), "%d.%d" % (pos[0], end))}
+
+
+def _create_highlighter(content):
+    register_workbench(_HighlightingWorkbench())
+    text_widget = tkinter.Text()
+    text_widget.insert("1.0", content)
+    return _WordHighlighter(text_widget)
+
+def _move_cursor(highlighter, index):
+    highlighter.text.mark_set("insert", index)
+    highlighter.schedule_update()
+
+def _wait_until(highlighter, condition):
+    deadline = time.time() + 5
+    while not condition():
+        assert time.time() < deadline
+        highlighter.text.update()
+        time.sleep(0.01)
+
+def _wait_until_done(highlighter):
+    _wait_until(highlighter, lambda: highlighter._update_job is None 
+                                     and not highlighter._worker.is_busy())
+
+def _get_name_ranges(highlighter):
+    ranges = highlighter.text.tag_ranges("NAME")
+    return [(str(ranges[i]), str(ranges[i+1])) for i in range(0, len(ranges), 2)]
+
+
+def test_quick_cursor_moves_give_one_request():
+    highlighter = _create_highlighter("first second third\n")
+    highlighter.proceed.clear()
+    for index in ["1.1", "1.7", "1.14"]:
+        _move_cursor(highlighter, index)
+    # nothing is started before cursor has stayed still for a while
+    assert not highlighter._worker.is_busy()
+    
+    highlighter.proceed.set()
+    _wait_until_done(highlighter)
+    
+    assert highlighter.requests == [(0, (1, 14))]
+    assert _get_name_ranges(highlighter) == [("1.13", "1.18")]
+
+
+def test_only_latest_waiting_request_is_processed():
+    highlighter = _create_highlighter("first second third\n")
+    highlighter.proceed.clear()
+    _move_cursor(highlighter, "1.1")
+    _wait_until(highlighter, lambda: len(highlighter.requests) == 1)
+    
+    for index in ["1.7", "1.14"]:
+        _move_cursor(highlighter, index)
+        _wait_until(highlighter, lambda: highlighter._update_job is None)
+    highlighter.proceed.set()
+    _wait_until_done(highlighter)
+    
+    assert highlighter.requests == [(0, (1, 1)), (0, (1, 14))]
+    assert _get_name_ranges(highlighter) == [("1.13", "1.18")]
+
+
+def test_result_for_old_revision_is_discarded():
+    highlighter = _create_highlighter("first second\n")
+    highlighter.proceed.clear()
+    _move_cursor(highlighter, "1.1")
+    _wait_until(highlighter, lambda: len(highlighter.requests) == 1)
+    
+    highlighter.text.insert("1.0", "zeroth ")
+    highlighter.text.event_generate("<<TextChange>>")
+    highlighter.proceed.set()
+    _wait_until_done(highlighter)
+    
+    assert _get_name_ranges(highlighter) == []
+
+
+def test_highlighting_is_reused_within_same_name():
+    highlighter = _create_highlighter("first second\n")
+    _move_cursor(highlighter, "1.7")
+    _wait_until_done(highlighter)
+    
+    for index in ["1.6", "1.9", "1.12"]:
+        _move_cursor(highlighter, index)
+        _wait_until_done(highlighter)
+    assert len(highlighter.requests) == 1
+    assert _get_name_ranges(highlighter) == [("1.6", "1.12")]
+    
+    _move_cursor(highlighter, "1.2")
+    _wait_until_done(highlighter)
+    assert highlighter.requests[1:] == [(0, (1, 2))]
+    assert _get_name_ranges(highlighter) == [("1.0", "1.5")]
+
+
 if __name__ == "__main__":
     run_tests()
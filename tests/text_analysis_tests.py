@@ -0,0 +1,82 @@
+import threading
+
+from thonny.text_analysis import TextAnalysis
+
+
+class _Text:
+    """Provides the part of Text interface which TextAnalysis uses"""
+    def __init__(self, content):
+        self.content = content
+        self.get_count = 0
+        self.handlers = []
+
+    def get(self, index1, index2):
+        assert (index1, index2) == ("1.0", "end")
+        self.get_count += 1
+        return self.content + "\n"
+
+    def bind(self, sequence, handler, add=None):
+        assert sequence == "<<TextChange>>"
+        self.handlers.append(handler)
+
+    def set_content(self, content):
+        self.content = content
+        for handler in self.handlers:
+            handler(None)
+
+
+def test_results_are_computed_once_per_revision():
+    text = _Text("x = (1, 2)")
+    analysis = TextAnalysis(text)
+
+    assert analysis.get_tokens() is analysis.get_tokens()
+    assert analysis.get_ast() is analysis.get_ast()
+    assert text.get_count == 1
+    
+    text.set_content("y = 3")
+    assert analysis.revision == 1
+    assert [token.string for token in analysis.get_tokens()][:3] == ["utf-8", "y", "="]
+    assert text.get_count == 2
+
+
+def test_cached_computations_are_distinguished_by_key():
+    analysis = TextAnalysis(_Text("pass"))
+    
+    assert analysis.get_cached("a", lambda analysis: 1) == 1
+    assert analysis.get_cached("b", lambda analysis: 2) == 2
+    assert analysis.get_cached("a", lambda analysis: 3) == 1
+
+
+def test_code_with_errors():
+    analysis = TextAnalysis(_Text("x = (1,\n    2\n  y = 3 +"))
+    
+    assert analysis.get_ast() is None
+    # tokens are given until the error
+    assert [token.string for token in analysis.get_tokens()][1:5] == ["x", "=", "(", "1"]
+
+
+def test_snapshot_is_shared_within_revision():
+    text = _Text("x = 1")
+    analysis = TextAnalysis(text)
+    
+    snapshot = analysis.get_snapshot()
+    assert snapshot is analysis.get_snapshot()
+    assert (snapshot.revision, snapshot.source) == (0, "x = 1\n")
+    
+    text.set_content("x = 2")
+    assert analysis.get_snapshot() is not snapshot
+    assert (analysis.get_snapshot().revision, snapshot.revision) == (1, 0)
+
+
+def test_jedi_module_is_parsed_once_per_snapshot():
+    snapshot = TextAnalysis(_Text("def f(x):\n    return x")).get_snapshot()
+    modules = []
+    threads = [threading.Thread(target=lambda: modules.append(snapshot.get_jedi_module()))
+               for _ in range(3)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    
+    assert len(modules) == 3
+    assert modules[0] is modules[1] is modules[2]
@@ -0,0 +1,47 @@
+import tkinter
+
+from thonny.tktextext import merge_ranges, get_tag_range_changes, set_tag_ranges,\
+    remove_tag_ranges
+
+
+def test_merge_ranges_joins_overlapping_and_touching_ranges():
+    assert merge_ranges([("2.0", "2.4"), ("1.5", "1.9"), ("1.8", "2.0"), ("3.1", "3.1")]) \
+        == [("1.5", "2.4")]
+
+
+def test_merge_ranges_compares_positions_numerically():
+    assert merge_ranges([("10.0", "10.2"), ("9.10", "9.12"), ("9.2", "9.3")]) \
+        == [("9.2", "9.3"), ("9.10", "9.12"), ("10.0", "10.2")]
+
+
+def test_unchanged_ranges_are_not_removed_nor_added():
+    old_ranges = [("1.0", "1.3"), ("2.4", "2.8"), ("5.0", "5.2")]
+    new_ranges = [("1.0", "1.3"), ("2.4", "2.6"), ("7.0", "7.1")]
+
+    assert get_tag_range_changes(old_ranges, new_ranges) \
+        == ([("2.4", "2.8"), ("5.0", "5.2")], [("2.4", "2.6"), ("7.0", "7.1")])
+
+
+def test_adjacent_new_ranges_match_merged_old_range():
+    # Tk reports touching ranges of a tag as one range
+    assert get_tag_range_changes([("1.0", "1.6")], [("1.0", "1.3"), ("1.3", "1.6")]) == ([], [])
+
+
+def test_several_ranges_are_removed_at_once():
+    text = tkinter.Text()
+    text.insert("1.0", "# first\n# second\n# third\n")
+    text.tag_add("COMMENT", "1.0", "1.7", "2.0", "2.8", "3.0", "3.7")
+
+    remove_tag_ranges(text, "COMMENT", [("1.0", "1.7"), ("3.0", "3.7")])
+
+    assert [str(index) for index in text.tag_ranges("COMMENT")] == ["2.0", "2.8"]
+
+
+def test_set_tag_ranges_drops_several_old_ranges():
+    text = tkinter.Text()
+    text.insert("1.0", "# first\n# second\n# third\n")
+    text.tag_add("COMMENT", "1.0", "1.7", "2.0", "2.8", "3.0", "3.7")
+
+    set_tag_ranges(text, {"COMMENT" : [("2.0", "2.8")]})
+
+    assert [str(index) for index in text.tag_ranges("COMMENT")] == ["2.0", "2.8"]
@@ -0,0 +1,39 @@
+from thonny.common import FrameInfo, TextRange, update_stack
+
+
+def _create_new_frame_export(frame_id, code_id, **kw):
+    return FrameInfo(id=frame_id, filename="prog.py", module_name="__main__",
+                     code_name="f", code_id=code_id, firstlineno=1,
+                     locals={}, last_event="before_statement",
+                     last_event_args={}, last_event_focus=TextRange(1, 0, 1, 5), **kw)
+
+
+def test_source_is_taken_from_earlier_frame_of_same_code():
+    code_sources = {}
+    stack = update_stack([], [_create_new_frame_export(1, 10, source="x = 1\n")], code_sources)
+    stack = update_stack(stack, [FrameInfo(id=1),
+                                 _create_new_frame_export(2, 10)], code_sources)
+
+    assert [frame_info.source for frame_info in stack] == ["x = 1\n", "x = 1\n"]
+
+
+def test_unchanged_frames_keep_their_frame_info():
+    code_sources = {}
+    stack = update_stack([], [_create_new_frame_export(1, 10, source=""),
+                              _create_new_frame_export(2, 20, source="")], code_sources)
+    new_stack = update_stack(stack, [FrameInfo(id=1),
+                                     FrameInfo(id=2, locals={"x" : "1"})], code_sources)
+
+    assert new_stack[0] is stack[0]
+    assert new_stack[1] is not stack[1]
+    assert new_stack[1].locals == {"x" : "1"}
+    assert new_stack[1].last_event == "before_statement"
+
+
+def test_finished_frames_are_dropped():
+    code_sources = {}
+    stack = update_stack([], [_create_new_frame_export(1, 10, source=""),
+                              _create_new_frame_export(2, 20, source="")], code_sources)
+
+    assert [frame_info.id for frame_info in update_stack(stack, [FrameInfo(id=1)],
+                                                         code_sources)] == [1]
@@ -336,6 +336,16 @@ class EditorNotebook(ttk.Notebook):
         
         return all_saved
     
+    def get_breakpoints(self):
+        """Returns breakpoint line numbers of named editors, keyed by filename"""
+        result = {}
+        for editor in self.winfo_children():
+            filename = editor.get_filename()
+            if filename:
+                result[filename] = sorted(editor.get_code_view().get_breakpoints())
+        
+        return result
+    
     def remember_recent_file(self, filename):
         recents = get_workbench().get_option("file.recent_files")
         if filename in recents:
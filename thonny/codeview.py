@@ -151,6 +151,11 @@ class CodeView(tktextext.TextFrame):
         
         # TODO: propose_remove_line_numbers on paste??
         
+        # breakpoints are kept as a tag on a character of the line (first one when set),
+        # so that they move together with the code and disappear with deleted lines
+        self._margin.tag_configure("breakpoint", background="#E04040", foreground="white")
+        self._margin_press_lineno = None
+        
         self.text.bind("<<TextChange>>", self._on_text_changed, True)
         
     def get_content(self):
@@ -167,6 +172,49 @@ class CodeView(tktextext.TextFrame):
     def _on_text_changed(self, event):
         self.update_line_numbers()
         self.update_margin_line()
+        self._update_breakpoint_marks()
+    
+    def on_margin_click(self, event=None):
+        tktextext.TextFrame.on_margin_click(self, event)
+        try:
+            lineno = int(self._margin.index("@%s,%s" % (event.x, event.y)).split(".")[0])
+        except tk.TclError:
+            return
+        
+        if event.type == "4": # ButtonPress
+            self._margin_press_lineno = lineno
+        elif lineno == self._margin_press_lineno:
+            # click without dragging over other lines
+            self.toggle_breakpoint(lineno)
+    
+    def toggle_breakpoint(self, lineno):
+        if lineno in self.get_breakpoints():
+            self.text.tag_remove("breakpoint", "%d.0" % lineno, "%d.0" % (lineno + 1))
+        else:
+            self.text.tag_add("breakpoint", "%d.0" % lineno)
+        
+        self._update_breakpoint_marks()
+        self.event_generate("<<BreakpointsChanged>>")
+    
+    def get_breakpoints(self):
+        """Returns line numbers (counted from the first line of the text)"""
+        result = set()
+        ranges = self.text.tag_ranges("breakpoint")
+        for i in range(0, len(ranges), 2):
+            # Tagged character may have moved from the start of the line
+            # (eg. when typing at column 0). Range spans several lines when
+            # tagged characters get adjacent (eg. on empty lines), then each
+            # of these lines contains tagged characters.
+            first_line = int(str(ranges[i]).split(".")[0])
+            last_line = int(self.text.index("%s -1c" % ranges[i+1]).split(".")[0])
+            result.update(range(first_line, last_line + 1))
+        
+        return result
+    
+    def _update_breakpoint_marks(self):
+        self._margin.tag_remove("breakpoint", "1.0", "end")
+        for lineno in self.get_breakpoints():
+            self._margin.tag_add("breakpoint", "%d.0" % lineno, "%d.end" % lineno)
     
     def select_lines(self, first_line, last_line):
         self.text.tag_remove("sel", "1.0", tk.END)
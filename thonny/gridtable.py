@@ -5,8 +5,13 @@ import math
 from thonny.globals import get_workbench
 
 class GridTable(tk.Frame):
+    """Shows only the data rows fitting on the screen.
+    
+    Data rows are kept in a dict (row number -> row). If request_rows is given,
+    then it gets called with (first, last) whenever some rows near the visible 
+    part are missing. The answer should be given to set_data_rows."""
     def __init__(self, master, header_rows, data_row_count, footer_row_count,
-                      frozen_column_count):
+                      frozen_column_count, request_rows=None, prefetch_margin=50):
         tk.Frame.__init__(self, master)
         
         self.header_widgets = {}
@@ -27,20 +32,69 @@ class GridTable(tk.Frame):
         self.header_row_count = len(header_rows)
         self.footer_row_count = footer_row_count
         self.frozen_column_count = frozen_column_count
+        
+        self.request_rows = request_rows
+        self.prefetch_margin = prefetch_margin
+        self.data_rows_are_stale = False
+        self._last_request = None
     
         self.update_header_rows()
     
     def set_data(self, data_rows):
-        # self.data_rows.update(data_rows) # dict version
-        self.data_rows = data_rows
+        """Sets all data rows (given as list)"""
+        self.data_rows = dict(enumerate(data_rows))
         self.data_row_count = len(data_rows)
+        self.data_rows_are_stale = False
         self.update_screen_data()
     
+    def set_data_rows(self, data_row_count, first_row_no, data_rows):
+        """Adds (or replaces) some of the data rows"""
+        if self.data_rows_are_stale:
+            self.data_rows = {}
+            self.data_rows_are_stale = False
+        
+        self.data_row_count = data_row_count
+        for i, row in enumerate(data_rows):
+            self.data_rows[first_row_no + i] = row
+        
+        self.first_visible_data_row_no = max(min(self.first_visible_data_row_no, 
+                                                 self.data_row_count - 1), 0)
+        self.update_screen_data()
+    
+    def invalidate_data_rows(self):
+        """Existing rows remain visible until new rows arrive, but they 
+        get requested again"""
+        self.data_rows_are_stale = True
+        self._last_request = None
+        self.request_missing_rows()
+    
+    def request_missing_rows(self):
+        if self.request_rows is None:
+            return
+        
+        first = max(self.first_visible_data_row_no - self.prefetch_margin, 0)
+        last = min(self.first_visible_data_row_no + self.visible_data_row_count 
+                   + self.prefetch_margin, self.data_row_count)
+        if (not self.data_rows_are_stale
+            and all(i in self.data_rows for i in range(first, last))):
+            return
+        
+        if (first, last) != self._last_request:
+            self._last_request = (first, last)
+            self.request_rows(first, last)
+    
+    def set_header_rows(self, header_rows):
+        assert len(header_rows) == self.header_row_count
+        self.header_rows = header_rows
+        for row_no in range(self.header_row_count):
+            for col_no in range(self.column_count):
+                self.get_header_widget(row_no, col_no).configure(
+                    text=self.get_header_value(row_no, col_no))
     
     def update_header_rows(self):
         for row_no in range(self.header_row_count):
             for col_no in range(self.column_count):
-                w = self.get_header_widget(self.screen_row_count, col_no)
+                w = self.get_header_widget(row_no, col_no)
                 w.grid(row=row_no, column=col_no, sticky="nsew", pady=(0,1), padx=(0,1))
                 w.configure(text=self.get_header_value(row_no, col_no))
  
@@ -70,7 +124,7 @@ class GridTable(tk.Frame):
         return tk.Label(self, anchor="e", padx=7, text="")
     
     def set_first_visible_data_row_no(self, n):
-        self.first_visible_data_row_no = max(min(n, self.data_row_count), 0)
+        self.first_visible_data_row_no = max(min(n, self.data_row_count - 1), 0)
         self.update_screen_data()
     
     def _clear_screen_row(self, row_no):
@@ -109,7 +163,7 @@ class GridTable(tk.Frame):
         self.update_screen_widgets(self.winfo_height())
         for screen_row_no in range(self.header_row_count, self.screen_row_count):
             data_row_no = self.first_visible_data_row_no + screen_row_no - self.header_row_count
-            if data_row_no == self.data_row_count:
+            if data_row_no >= self.data_row_count:
                 break
             
             for col_no in range(self.column_count):
@@ -119,16 +173,16 @@ class GridTable(tk.Frame):
                     w.configure(text="")
                 else:
                     w.configure(text=str(value))
+        
+        self.request_missing_rows()
     
     def get_data_value(self, row_no, col_no):
-        """ lazy dict version:
         assert 0 <= row_no < self.data_row_count
         if row_no in self.data_rows:
             return self.data_rows[row_no][col_no]
         else:
-            return ""
-        """
-        return self.data_rows[row_no][col_no]
+            # not fetched yet
+            return None
                 
     def get_header_value(self, row_no, col_no):
         return self.header_rows[row_no][col_no]
@@ -192,7 +246,15 @@ class ScrollableGridTable(ttk.Frame):
     def debug(self, event=None):
         print("DE", self.vscrollbar.get())
     
+    def set_data_rows(self, data_row_count, first_row_no, data_rows):
+        self.grid_table.set_data_rows(data_row_count, first_row_no, data_rows)
+        self._update_vertical_scrollbar()
+    
     def _update_vertical_scrollbar(self):
+        if self.grid_table.data_row_count == 0:
+            self.vscrollbar.set(0, 1)
+            return
+        
         first = self.grid_table.first_visible_data_row_no / self.grid_table.data_row_count
         last = first + self.grid_table.visible_data_row_count / self.grid_table.data_row_count
         #print(first, last, self.grid_table.visible_data_row_count)
@@ -1,3 +1,9 @@
+import threading
+
+# Jedi is not thread-safe (it has module level caches), therefore all Jedi calls
+# in Thonny process should be made while holding this lock
+jedi_lock = threading.RLock()
+
 def get_module_node(script):
     if hasattr(script, "_get_module_node"):
         return script._get_module_node()
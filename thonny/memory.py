@@ -1,6 +1,8 @@
 # -*- coding: utf-8 -*-
  
+import bisect
 import tkinter as tk
+from tkinter import ttk
 import tkinter.font as tk_font
 
 from thonny.ui_utils import TreeFrame
@@ -41,11 +43,169 @@ class MemoryFrame(TreeFrame):
             object_id = parse_object_id(id_str)
             get_workbench().event_generate("ObjectSelect", object_id=object_id)
     
+
+class VirtualMemoryFrame(MemoryFrame):
+    """MemoryFrame for long lists of rows, which are fetched from the backend
+    in windows. Tree contains one item per visible row and the scrollbar 
+    is managed here, not by the tree.
+    
+    Subclasses must implement request_rows and format_row and pass responses
+    to set_rows. Rows are cached per generation, invalidate_rows starts a new one
+    (eg. when the program has made progress). Cached rows remain visible until
+    fresh ones arrive."""
+    
+    def __init__(self, master, columns, prefetch_margin=50):
+        MemoryFrame.__init__(self, master, columns)
+        self._prefetch_margin = prefetch_margin
+        
+        self.tree.configure(yscrollcommand="")
+        self.vert_scrollbar["command"] = self._on_scrollbar
+        self.tree.bind("<Configure>", self._on_resize, True)
+        self.tree.bind("<MouseWheel>", self._on_mousewheel, True)
+        self.tree.bind("<Button-4>", lambda e: self.scroll_to(self._first_row - 3), True)
+        self.tree.bind("<Button-5>", lambda e: self.scroll_to(self._first_row + 3), True)
+        
+        self._first_row = 0
+        self._visible_row_count = 10
+        self._total_count = 0
+        self._rows = {} # row index -> row data
+        self._generation = 0
+        self._rows_generation = None
+        self._last_request = None
+    
+    def request_rows(self, first, last, generation):
+        """Should ask backend for rows first..last-1"""
+        raise NotImplementedError()
+    
+    def format_row(self, index, row):
+        """Returns values for tree item"""
+        raise NotImplementedError()
+    
+    def get_generation(self):
+        return self._generation
+    
+    def get_total_count(self):
+        return self._total_count
+    
+    def get_row(self, index):
+        return self._rows.get(index)
+    
+    def get_selected_row(self):
+        iid = self.tree.focus()
+        if iid == '':
+            return None
+        else:
+            return self.get_row(self._first_row + self.tree.index(iid))
+    
+    def get_wanted_range(self):
+        """Returns (first, last) of visible rows together with prefetch margin"""
+        return (max(self._first_row - self._prefetch_margin, 0),
+                self._first_row + self._visible_row_count + self._prefetch_margin)
+    
+    def invalidate_rows(self, reset_position=False):
+        self._generation += 1
+        if reset_position:
+            self._first_row = 0
+    
+    def set_rows(self, total_count, offset, rows, generation):
+        if generation != self._generation:
+            # outdated response
+            return
+        
+        if self._rows_generation != generation:
+            self._rows = {}
+            self._rows_generation = generation
+        
+        self._total_count = total_count
+        for i, row in enumerate(rows):
+            self._rows[offset + i] = row
+        
+        self._first_row = min(self._first_row, 
+                              max(self._total_count - self._visible_row_count, 0))
+        self.update_rows()
+    
+    def fetch_missing_rows(self):
+        first, last = self.get_wanted_range()
+        if self._rows_generation == self._generation:
+            last = min(last, self._total_count)
+            if all(i in self._rows for i in range(first, last)):
+                return
+        
+        request = (self._generation, first, last)
+        if request == self._last_request:
+            # response is on its way
+            return
+        
+        self._last_request = request
+        self.request_rows(first, last, self._generation)
+    
+    def scroll_to(self, first_row):
+        max_first_row = max(self._total_count - self._visible_row_count, 0)
+        first_row = min(max(first_row, 0), max_first_row)
+        if first_row != self._first_row:
+            self._first_row = first_row
+            self.update_rows()
+    
+    def update_rows(self):
+        row_count = max(min(self._visible_row_count, self._total_count - self._first_row), 0)
+        
+        # reuse existing items
+        items = self.tree.get_children()
+        for iid in items[row_count:]:
+            self.tree.delete(iid)
+        items = items[:row_count]
+        while len(items) < row_count:
+            items += (self.tree.insert("", "end"),)
+        
+        for i, iid in enumerate(items):
+            row = self._rows.get(self._first_row + i)
+            if row is None:
+                self.tree.item(iid, values=())
+            else:
+                self.tree.item(iid, values=self.format_row(self._first_row + i, row))
+        
+        if self._total_count == 0:
+            self.vert_scrollbar.set(0, 1)
+        else:
+            self.vert_scrollbar.set(self._first_row / self._total_count,
+                                    (self._first_row + row_count) / self._total_count)
+        
+        self.fetch_missing_rows()
+    
+    def _on_resize(self, event):
+        rowheight = ttk.Style().lookup("Treeview", "rowheight")
+        try:
+            rowheight = int(rowheight)
+        except ValueError:
+            rowheight = 20
+        
+        # one row is taken by the headings
+        visible_row_count = max(event.height // rowheight - 1, 1)
+        if visible_row_count != self._visible_row_count:
+            self._visible_row_count = visible_row_count
+            self.update_rows()
+    
+    def _on_scrollbar(self, *args):
+        if args[0] == "moveto":
+            self.scroll_to(int(float(args[1]) * self._total_count))
+        elif args[0] == "scroll":
+            if args[2] == "pages":
+                self.scroll_to(self._first_row + int(args[1]) * self._visible_row_count)
+            else:
+                self.scroll_to(self._first_row + int(args[1]))
+    
+    def _on_mousewheel(self, event):
+        if event.delta > 0:
+            self.scroll_to(self._first_row - 3)
+        else:
+            self.scroll_to(self._first_row + 3)
     
         
 class VariablesFrame(MemoryFrame):
     def __init__(self, master):
         MemoryFrame.__init__(self, master, ('name', 'id', 'value'))
+        self._variable_nodes = {}
+        self.variables_version = None
     
         self.tree.column('name', width=120, anchor=tk.W, stretch=False)
         self.tree.column('id', width=450, anchor=tk.W, stretch=True)
@@ -80,20 +240,46 @@ class VariablesFrame(MemoryFrame):
         
         if variables:
             for name in sorted(variables.keys()):
-                
                 if not name.startswith("__"):
-                    node_id = self.tree.insert("", "end", tags="item")
-                    self.tree.set(node_id, "name", name)
-                    if isinstance(variables[name], dict):
-                        repr_str = variables[name]["repr"]
-                        id_str = variables[name]["id"]
-                    else:
-                        repr_str = variables[name]
-                        id_str = None
-                        
-                    self.tree.set(node_id, "id", format_object_id(id_str))
-                    self.tree.set(node_id, "value", shorten_repr(repr_str, MAX_REPR_LENGTH_IN_GRID))
+                    self._variable_nodes[name] = self.tree.insert("", "end", tags="item")
+                    self._set_variable_values(name, variables[name])
+    
+    def patch_variables(self, changed, removed):
+        """Updates only given variables. Keeps the rows sorted by name"""
+        for name in removed:
+            if name in self._variable_nodes:
+                self.tree.delete(self._variable_nodes.pop(name))
+        
+        names = sorted(self._variable_nodes.keys())
+        for name in sorted(changed.keys()):
+            if name.startswith("__"):
+                continue
+            
+            if name not in self._variable_nodes:
+                index = bisect.bisect(names, name)
+                names.insert(index, name)
+                self._variable_nodes[name] = self.tree.insert("", index, tags="item")
+            
+            self._set_variable_values(name, changed[name])
+    
+    def _set_variable_values(self, name, value):
+        node_id = self._variable_nodes[name]
+        if isinstance(value, dict):
+            repr_str = value["repr"]
+            id_str = value["id"]
+        else:
+            repr_str = value
+            id_str = None
+        
+        self.tree.set(node_id, "name", name)
+        self.tree.set(node_id, "id", format_object_id(id_str))
+        self.tree.set(node_id, "value", shorten_repr(repr_str, MAX_REPR_LENGTH_IN_GRID))
     
+    def _clear_tree(self):
+        MemoryFrame._clear_tree(self)
+        self._variable_nodes = {}
+        # version of the backend's snapshot shown in the tree (see VM.export_variables_patch)
+        self.variables_version = None
     
     def on_select(self, event):
         self.show_selected_object_info()
@@ -0,0 +1,117 @@
+# -*- coding: utf-8 -*-
+"""
+Shows where time goes in the communication between frontend and backend.
+
+Statistics are collected only when run.collect_channel_stats is enabled
+(takes effect when backend gets restarted).
+"""
+
+import json
+import tkinter as tk
+from tkinter import ttk
+from tkinter.filedialog import asksaveasfilename
+
+from thonny.globals import get_workbench, get_runner
+from thonny.common import InlineCommand
+from thonny.ui_utils import TreeFrame, create_boolean_var
+
+
+class BackendStatsView(ttk.Frame):
+    def __init__(self, master):
+        ttk.Frame.__init__(self, master)
+        self._backend_stats = {}
+
+        toolbar = ttk.Frame(self)
+        toolbar.grid(row=0, column=0, sticky=tk.NSEW)
+
+        self._collect_var = create_boolean_var(
+            get_workbench().get_option("run.collect_channel_stats"),
+            self._on_collect_change)
+        ttk.Checkbutton(toolbar, text="Collect (restart backend to apply)",
+                        variable=self._collect_var).grid(row=0, column=0, padx=5)
+        ttk.Button(toolbar, text="Refresh", command=self._request_stats).grid(row=0, column=1)
+        ttk.Button(toolbar, text="Clear", command=self._clear_stats).grid(row=0, column=2)
+        ttk.Button(toolbar, text="Export JSON...", command=self._export).grid(row=0, column=3)
+
+        columns = ("side", "operation", "key", "count", "bytes", "avg_bytes",
+                   "total_ms", "avg_ms", "max_ms")
+        self._tree_frame = TreeFrame(self, columns)
+        self._tree_frame.grid(row=1, column=0, sticky=tk.NSEW)
+        tree = self._tree_frame.tree
+        for column, title, width in [("side", "Side", 70),
+                                     ("operation", "Operation", 120),
+                                     ("key", "Message", 200),
+                                     ("count", "Count", 60),
+                                     ("bytes", "Bytes", 80),
+                                     ("avg_bytes", "Avg bytes", 70),
+                                     ("total_ms", "Total ms", 70),
+                                     ("avg_ms", "Avg ms", 60),
+                                     ("max_ms", "Max ms", 60)]:
+            anchor = tk.W if column in ("side", "operation", "key") else tk.E
+            tree.column(column, width=width, anchor=anchor, stretch=column == "key")
+            tree.heading(column, text=title, anchor=anchor)
+
+        self.columnconfigure(0, weight=1)
+        self.rowconfigure(1, weight=1)
+
+        get_workbench().bind("ChannelStats", self._handle_stats_event, True)
+
+    def before_show(self):
+        self._request_stats()
+
+    def _on_collect_change(self):
+        get_workbench().set_option("run.collect_channel_stats", self._collect_var.get())
+
+    def _request_stats(self, reset=False):
+        get_runner().send_command(InlineCommand("get_channel_stats", reset=reset))
+
+    def _clear_stats(self):
+        frontend_stats = get_runner().get_channel_stats()
+        if frontend_stats is not None:
+            frontend_stats.clear()
+        self._request_stats(reset=True)
+
+    def _handle_stats_event(self, msg):
+        self._backend_stats = msg.stats or {}
+        self._update_tree()
+
+    def _get_all_stats(self):
+        frontend_stats = get_runner().get_channel_stats()
+        return {"frontend" : frontend_stats.get_data() if frontend_stats else {},
+                "backend" : self._backend_stats}
+
+    def _update_tree(self):
+        rows = []
+        for side, stats in sorted(self._get_all_stats().items()):
+            for operation, entries in stats.items():
+                for key, entry in entries.items():
+                    rows.append((side, operation, key, entry))
+
+        # worst offenders first
+        rows.sort(key=lambda row: row[3]["time"], reverse=True)
+
+        tree = self._tree_frame.tree
+        self._tree_frame._clear_tree()
+        for side, operation, key, entry in rows:
+            count = entry["count"]
+            tree.insert("", "end", values=(
+                side, operation, key, count, entry["bytes"],
+                "%.0f" % (entry["bytes"] / count),
+                "%.1f" % (entry["time"] * 1000),
+                "%.2f" % (entry["time"] / count * 1000),
+                "%.2f" % (entry["max_time"] * 1000)))
+
+    def _export(self):
+        filename = asksaveasfilename(filetypes=[("JSON files", ".json")],
+                                     defaultextension=".json",
+                                     initialfile="backend_stats.json",
+                                     parent=get_workbench())
+        if not filename:
+            return
+
+        with open(filename, "w", encoding="UTF-8") as fp:
+            json.dump(self._get_all_stats(), fp, indent=4, sort_keys=True)
+
+
+def load_plugin():
+    get_workbench().add_view(BackendStatsView, "Backend statistics", "se")
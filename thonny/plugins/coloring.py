@@ -3,20 +3,30 @@ Each text will get its on SyntaxColorer.
 
 For performance reasons, coloring is updated in 2 phases:
     1. recolor single-line tokens on the modified line(s)
-    2. recolor multi-line tokens (triple-quoted strings) in the whole text
+    2. recolor multi-line tokens (triple-quoted strings) 
 
 First phase may insert wrong tokens inside triple-quoted strings, but the 
 priorities of triple-quoted-string tags are higher and therefore user 
 doesn't see these wrong taggings.
 
+In editors the second phase remembers for each line whether it starts inside 
+a triple-quoted string. After an edit, lines are lexed from the modified line 
+until the state at the start of a line agrees with the remembered state.
+This work is done in short time slices, starting from the visible part
+of the text, so that opening a big file or a triple-quoted string doesn't
+block the UI. Edits preempt the remaining work.
+
 In Shell only current command entry is colored
     
 Regexes are adapted from idlelib
 """
 
+import bisect
 import re
+import time
 
 from thonny.globals import get_workbench
+from thonny.tktextext import set_tag_ranges, remove_tag_ranges
 from thonny.shell import ShellText
 from thonny.codeview import CodeViewText
 
@@ -119,95 +129,389 @@ class SyntaxColorer:
 
     def _update_uniline_tokens(self, start, end):
         chars = self.text.get(start, end)
-                
-        # clear old tags
-        for tag in self.uniline_tagdefs:
-            self.text.tag_remove(tag, start, end)
         
-        if not get_workbench().get_option("view.syntax_coloring"):
-            return
+        if get_workbench().get_option("view.syntax_coloring"):
+            ranges_by_tag = self._find_uniline_tokens(self.text.index(start), chars)
+        else:
+            ranges_by_tag = {tag : [] for tag in self.uniline_tagdefs}
+            ranges_by_tag["DEFINITION"] = []
+        
+        set_tag_ranges(self.text, ranges_by_tag, start, end)
+    
+    def _find_uniline_tokens(self, start_index, chars):
+        """Returns ranges of single-line tokens in chars (which start at start_index) 
+        grouped by tag"""
+        ranges_by_tag = {tag : [] for tag in self.uniline_tagdefs}
+        ranges_by_tag["DEFINITION"] = []
         
+        get_index = _create_index_converter(start_index, chars)
         for match in self.uniline_regex.finditer(chars):
             for token_type, token_text in match.groupdict().items():
                 if token_text and token_type in self.uniline_tagdefs:
                     token_text = token_text.strip()
                     match_start, match_end = match.span(token_type)
                     
-                    self.text.tag_add(token_type,
-                             start + "+%dc" % match_start,
-                             start + "+%dc" % match_end)
+                    ranges_by_tag[token_type].append((get_index(match_start),
+                                                      get_index(match_end)))
                     
                     # Mark also the word following def or class
                     if token_text in ("def", "class"):
                         id_match = self.id_regex.match(chars, match_end)
                         if id_match:
                             id_match_start, id_match_end = id_match.span(1)
-                            self.text.tag_add("DEFINITION",
-                                         start + "+%dc" % id_match_start,
-                                         start + "+%dc" % id_match_end)
-                
+                            ranges_by_tag["DEFINITION"].append((get_index(id_match_start),
+                                                                get_index(id_match_end)))
         
+        return ranges_by_tag
          
     def _update_multiline_tokens(self, start, end):
         chars = self.text.get(start, end)
-        # clear old tags
-        for tag in self.multiline_tagdefs:
-            self.text.tag_remove(tag, start, end)
-        
-        if not get_workbench().get_option("view.syntax_coloring"):
-            return
+        ranges_by_tag = {tag : [] for tag in self.multiline_tagdefs}
+        token_ranges = []
         
-        # Count number of open multiline strings to be able to detect when string gets closed
-        self.text.number_of_open_multiline_strings = 0
-        
-        interesting_token_types = list(self.multiline_tagdefs.keys()) + ["STRING3"]
-        for match in self.multiline_regex.finditer(chars):
-            for token_type, token_text in match.groupdict().items():
-                if token_text and token_type in interesting_token_types:
-                    token_text = token_text.strip()
-                    match_start, match_end = match.span(token_type)
-                    if token_type == "STRING3":
-                        if (token_text.startswith('"""') and not token_text.endswith('"""')
-                            or token_text.startswith("'''") and not token_text.endswith("'''")
-                            or len(token_text) == 3):
-                            str_end = int(float(self.text.index(start + "+%dc" % match_end)))
-                            file_end = int(float(self.text.index("end")))
-
-                            if str_end == file_end:
+        if get_workbench().get_option("view.syntax_coloring"):
+            # Count number of open multiline strings to be able to detect when string gets closed
+            self.text.number_of_open_multiline_strings = 0
+            
+            get_index = _create_index_converter(self.text.index(start), chars)
+            interesting_token_types = list(self.multiline_tagdefs.keys()) + ["STRING3"]
+            for match in self.multiline_regex.finditer(chars):
+                for token_type, token_text in match.groupdict().items():
+                    if token_text and token_type in interesting_token_types:
+                        token_text = token_text.strip()
+                        match_start, match_end = match.span(token_type)
+                        if token_type == "STRING3":
+                            if (token_text.startswith('"""') and not token_text.endswith('"""')
+                                or token_text.startswith("'''") and not token_text.endswith("'''")
+                                or len(token_text) == 3):
+                                str_end = int(get_index(match_end).split(".")[0])
+                                file_end = int(float(self.text.index("end")))
+    
+                                if str_end == file_end:
+                                    token_type = "STRING_OPEN3"
+                                    self.text.number_of_open_multiline_strings += 1
+                                else:
+                                    token_type = None
+                            elif len(token_text) >= 4 and token_text[-4] == "\\":
                                 token_type = "STRING_OPEN3"
                                 self.text.number_of_open_multiline_strings += 1
                             else:
-                                token_type = None
-                        elif len(token_text) >= 4 and token_text[-4] == "\\":
-                            token_type = "STRING_OPEN3"
-                            self.text.number_of_open_multiline_strings += 1
-                        else:
-                            token_type = "STRING_CLOSED3"
-                    
-                    token_start = start + "+%dc" % match_start
-                    token_end = start + "+%dc" % match_end
-                    # clear uniline tags
-                    for tag in self.uniline_tagdefs:
-                        self.text.tag_remove(tag, token_start, token_end)
-                    # add tag
-                    self.text.tag_add(token_type,
-                             token_start,
-                             token_end)
+                                token_type = "STRING_CLOSED3"
+                        
+                        token_range = (get_index(match_start), get_index(match_end))
+                        token_ranges.append(token_range)
+                        if token_type is not None:
+                            ranges_by_tag[token_type].append(token_range)
+        
+        set_tag_ranges(self.text, ranges_by_tag, start, end)
+        
+        # clear uniline tags
+        if token_ranges:
+            for tag in self.uniline_tagdefs:
+                remove_tag_ranges(self.text, tag, token_ranges)
         
 
+# line state which doesn't agree with any lexing result
+_UNKNOWN_LINE_STATE = "unknown"
+
+# how long one step of coloring may take (in seconds) before letting Tk process events 
+_TIME_SLICE = 0.005
+
+# how many lines get lexed before tagging them and checking the time
+_MAX_CHUNK_LINES = 100
+
 class CodeViewSyntaxColorer(SyntaxColorer):
-    def _update_coloring(self):
-        for dirty_range in self._dirty_ranges:
-            self._update_uniline_tokens(*dirty_range)
+    def __init__(self, text, main_font, bold_font):
+        SyntaxColorer.__init__(self, text, main_font, bold_font)
+        # _line_states[i] is the state at the start of line i+1 (last one is the state at the end):
+        # None or the delimiter of the triple-quoted string, which is open there.
+        # None instead of list means that whole text needs to be lexed
+        self._line_states = None
+        # _string_starts[i] tells where the string open at the start of line i+1 begins
+        # (None or pair of line count back and column), so that earlier chunks can be retagged.
+        # Relative line keeps it valid when lines get added or removed before the string.
+        self._string_starts = None
+        self._changed_lines = set() # lines whose state at the end may have changed
+        self._background_job = None
+    
+    def _compile_regexes(self):
+        SyntaxColorer._compile_regexes(self)
+        from thonny.token_utils import COMMENT, STRING3_DELIMITER, STRING_CLOSED, STRING_OPEN,\
+            SQ3STRING_REST, DQ3STRING_REST
         
-        # Multiline tokens need to be searched from the whole source
-        open_before = getattr(self.text, "number_of_open_multiline_strings", 0)
-        self._update_multiline_tokens("1.0", "end")
-        open_after = getattr(self.text, "number_of_open_multiline_strings", 0)
+        # single-line strings and comments may contain triple quotes
+        self.string3_start_regex = re.compile(
+            COMMENT
+            + "|" + STRING3_DELIMITER
+            + "|" + STRING_CLOSED
+            + "|" + STRING_OPEN
+            , re.S)
+        
+        self.string3_rest_regexes = {
+            "'''" : re.compile(SQ3STRING_REST, re.S),
+            '"""' : re.compile(DQ3STRING_REST, re.S),
+        }
+    
+    def schedule_update(self, event):
+        # edit preempts the coloring of earlier changes
+        self._cancel_background_job()
+        self._register_changed_lines(event)
+        SyntaxColorer.schedule_update(self, event)
+    
+    def _register_changed_lines(self, event):
+        """Keeps line states in sync with the lines of the text"""
+        if self._line_states is None:
+            return
         
-        if open_after == 0 and open_before != 0:
-            # recolor uniline tokens after closing last open multiline string
+        if hasattr(event, "sequence") and event.sequence == "TextInsert":
+            index = event.index
+        elif hasattr(event, "sequence") and event.sequence == "TextDelete":
+            index = event.index1
+        else:
+            self._line_states = None
+            return
+        
+        row = int(self.text.index(index).split(".")[0])
+        # the change has already happened, so it tells how many lines were added or removed 
+        delta = self._get_line_count() + 1 - len(self._line_states)
+        if delta > 0:
+            self._line_states[row:row] = [_UNKNOWN_LINE_STATE] * delta
+            self._string_starts[row:row] = [None] * delta
+        elif delta < 0:
+            del self._line_states[row:row-delta]
+            del self._string_starts[row:row-delta]
+        
+        if delta != 0:
+            # string containing the change got longer or shorter
+            # (entry at index line was at index line-delta before the change)
+            line = row + max(delta, 0)
+            while (line < len(self._string_starts)
+                   and self._string_starts[line] is not None
+                   and line - delta + 1 - self._string_starts[line][0] <= row):
+                lines_back, col = self._string_starts[line]
+                self._string_starts[line] = (lines_back + delta, col)
+                line += 1
+        
+        self._changed_lines = {line if line <= row else max(line + delta, row) 
+                               for line in self._changed_lines}
+        self._changed_lines.update(range(row, row + max(delta, 0) + 1))
+    
+    def _update_coloring(self):
+        # Changed lines are tracked more precisely than dirty ranges,
+        # which may get shifted by later edits
+        line_count = self._get_line_count()
+        
+        if not get_workbench().get_option("view.syntax_coloring"):
             self._update_uniline_tokens("1.0", "end")
+            for tag in self.multiline_tagdefs:
+                self.text.tag_remove(tag, "1.0", "end")
+            self._line_states = None
+            return
+        
+        if self._line_states is None or len(self._line_states) != line_count + 1:
+            self._reset_line_states(line_count)
+        
+        self._continue_coloring()
+        self._update_visible_unknown_lines()
+    
+    def _reset_line_states(self, line_count):
+        self._line_states = [None] + [_UNKNOWN_LINE_STATE] * line_count
+        self._string_starts = [None] * (line_count + 1)
+        self._changed_lines = {1}
+    
+    def _update_visible_unknown_lines(self):
+        """Colors single-line tokens in the visible lines, which didn't get
+        lexed in the first time slice. Rest gets colored when lexing reaches them."""
+        first_line = int(self.text.index("@0,0").split(".")[0])
+        last_line = int(self.text.index("@0,%d" % self.text.winfo_height()).split(".")[0])
+        
+        line = first_line
+        while line <= min(last_line, len(self._line_states) - 1):
+            if self._line_states[line-1] == _UNKNOWN_LINE_STATE:
+                end_line = line + 1
+                while (end_line <= last_line 
+                       and self._line_states[end_line-1] == _UNKNOWN_LINE_STATE):
+                    end_line += 1
+                self._update_uniline_tokens("%d.0" % line, "%d.0" % end_line)
+                line = end_line
+            else:
+                line += 1
+    
+    def _continue_coloring(self):
+        """Lexes and tags changed lines until time slice is used up
+        and schedules the rest for later"""
+        self._background_job = None
+        if not self.text.winfo_exists():
+            return
+        
+        line_count = self._get_line_count()
+        if len(self._line_states) != line_count + 1:
+            # text was changed without an event
+            self._reset_line_states(line_count)
+        
+        deadline = time.perf_counter() + _TIME_SLICE
+        
+        # start from the visible part of the text
+        first_visible_line = int(self.text.index("@0,0").split(".")[0])
+        while self._changed_lines and time.perf_counter() < deadline:
+            self._update_changed_lines(self._get_next_changed_line(first_visible_line),
+                                       line_count, deadline)
+        
+        if self._changed_lines:
+            self._background_job = self.text.after(1, self._continue_coloring)
+    
+    def _cancel_background_job(self):
+        if self._background_job is not None:
+            self.text.after_cancel(self._background_job)
+            self._background_job = None
+    
+    def _get_next_changed_line(self, first_visible_line):
+        """Returns first changed line at or after first_visible_line 
+        (or the first changed line, if there is none) with known state at the start.
+        
+        Lines starting with unknown state get lexed after some earlier changed line"""
+        known_lines = [line for line in self._changed_lines
+                       if self._line_states[line-1] != _UNKNOWN_LINE_STATE]
+        assert known_lines
+        
+        later_lines = [line for line in known_lines if line >= first_visible_line]
+        if later_lines:
+            return min(later_lines)
+        else:
+            return min(known_lines)
+    
+    def _update_changed_lines(self, first_line, line_count, deadline):
+        """Recolors lines starting from first_line until state at the start
+        of next line stays same and next line is not changed.
+        
+        Stops earlier when deadline is passed or the chunk gets too long,
+        next line remains changed then."""
+        
+        self._changed_lines.discard(first_line)
+        state = self._line_states[first_line-1]
+        # start of the open string in the text and in these lines
+        if state is None:
+            start_pos = None
+            string_start = None
+        else:
+            lines_back, col = self._string_starts[first_line-1]
+            start_pos = (first_line - lines_back, col)
+            string_start = "%d.0" % first_line
+        strings = [] # (start index, end index, tag)
+        
+        line = first_line
+        lines = self._iter_lines(first_line)
+        while True:
+            boundaries, state = self._lex_line(next(lines), state)
+            for col, is_start in boundaries:
+                if is_start:
+                    start_pos = (line, col)
+                    string_start = "%d.%d" % start_pos
+                else:
+                    strings.append((string_start, "%d.%d" % (line, col), "STRING_CLOSED3"))
+                    start_pos = None
+                    string_start = None
+            
+            if start_pos is None:
+                relative_start = None
+            else:
+                relative_start = (line + 1 - start_pos[0], start_pos[1])
+            
+            old_state = self._line_states[line]
+            old_relative_start = self._string_starts[line]
+            self._line_states[line] = state
+            self._string_starts[line] = relative_start
+            line += 1
+            self._changed_lines.discard(line-1)
+            
+            if (line > line_count
+                or state == old_state and relative_start == old_relative_start
+                   and line not in self._changed_lines):
+                break
+            
+            if (line - first_line >= _MAX_CHUNK_LINES 
+                or time.perf_counter() > deadline):
+                # rest of the lines need to be colored later
+                self._changed_lines.add(line)
+                break
+        
+        end_index = "%d.0" % line
+        if string_start is not None:
+            if line > line_count or "STRING_OPEN3" in self.text.tag_names(end_index):
+                # string doesn't get closed
+                strings.append((string_start, end_index, "STRING_OPEN3"))
+            else:
+                strings.append((string_start, end_index, "STRING_CLOSED3"))
+        
+        self._retag_lines(first_line, line, strings)
+    
+    def _retag_lines(self, first_line, end_line, strings):
+        start_index = "%d.0" % first_line
+        end_index = "%d.0" % end_line
+        
+        # single-line tokens inside triple-quoted strings are ignored 
+        ranges_by_tag = self._find_uniline_tokens(start_index,
+                                                  self.text.get(start_index, end_index))
+        string_ranges = [(token_start, token_end) for token_start, token_end, _ in strings]
+        for tag in ranges_by_tag:
+            ranges_by_tag[tag] = _subtract_ranges(ranges_by_tag[tag], string_ranges)
+        
+        for tag in self.multiline_tagdefs:
+            ranges_by_tag[tag] = [(token_start, token_end) 
+                                  for token_start, token_end, string_tag in strings
+                                  if string_tag == tag]
+        
+        set_tag_ranges(self.text, ranges_by_tag, start_index, end_index)
+        
+        if (strings and strings[0][0] == start_index and first_line > 1
+            and self._line_states[first_line-1] is not None):
+            # string started before these lines, its beginning may need another tag
+            tag = strings[0][2]
+            other_tag = "STRING_CLOSED3" if tag == "STRING_OPEN3" else "STRING_OPEN3"
+            if other_tag in self.text.tag_names(start_index + "-1c"):
+                lines_back, col = self._string_starts[first_line-1]
+                string_start = "%d.%d" % (first_line - lines_back, col)
+                self.text.tag_remove(other_tag, string_start, start_index)
+                self.text.tag_add(tag, string_start, start_index)
+    
+    def _lex_line(self, line, state):
+        """Returns the positions where triple-quoted strings start or end 
+        in the line (as pairs of column and whether it's a start)
+        and the state at the end of the line"""
+        boundaries = []
+        pos = 0
+        while True:
+            if state is not None:
+                match = self.string3_rest_regexes[state].match(line, pos)
+                if match.group("CLOSING3") is None:
+                    return boundaries, state
+                
+                pos = match.end()
+                boundaries.append((pos, False))
+                state = None
+            
+            match = self.string3_start_regex.search(line, pos)
+            if match is None:
+                return boundaries, None
+            
+            pos = match.end()
+            if match.group("DELIMITER3"):
+                state = match.group("DELIMITER3")[-3:]
+                boundaries.append((match.start(), True))
+    
+    def _iter_lines(self, first_line):
+        # consecutive lines are fetched in growing chunks
+        chunk_size = 1
+        while True:
+            chunk = self.text.get("%d.0" % first_line, "%d.0" % (first_line + chunk_size))
+            for line in chunk.split("\n")[:-1]:
+                yield line + "\n"
+            
+            first_line += chunk_size
+            chunk_size = min(chunk_size * 2, _MAX_CHUNK_LINES)
+    
+    def _get_line_count(self):
+        return int(self.text.index("end-1c").split(".")[0])
 
 class ShellSyntaxColorer(SyntaxColorer):
     def _update_coloring(self):
@@ -226,6 +530,49 @@ class ShellSyntaxColorer(SyntaxColorer):
             self._update_uniline_tokens(start_index, end_index)
             self._update_multiline_tokens(start_index, end_index)
 
+def _create_index_converter(start_index, chars):
+    """Returns a function which converts offsets in chars to Tk indices
+    (given that chars start at start_index)"""
+    start_line, start_col = map(int, start_index.split("."))
+    line_offsets = [0] + [match.end() for match in re.finditer("\n", chars)]
+    
+    def get_index(offset):
+        line_no = bisect.bisect_right(line_offsets, offset) - 1
+        if line_no == 0:
+            return "%d.%d" % (start_line, start_col + offset)
+        else:
+            return "%d.%d" % (start_line + line_no, offset - line_offsets[line_no])
+    
+    return get_index
+
+def _subtract_ranges(ranges, removed_ranges):
+    """Returns the parts of ranges which are not covered by removed_ranges.
+    Both lists must be sorted and contain non-overlapping ranges."""
+    def to_tuple(index):
+        line, col = index.split(".")
+        return int(line), int(col)
+    
+    removed_positions = [(to_tuple(start), to_tuple(end)) for start, end in removed_ranges]
+    result = []
+    i = 0
+    for start, end in ranges:
+        start_pos, end_pos = to_tuple(start), to_tuple(end)
+        while i < len(removed_positions) and removed_positions[i][1] <= start_pos:
+            i += 1
+        
+        j = i
+        while j < len(removed_positions) and removed_positions[j][0] < end_pos:
+            removed_start_pos, removed_end_pos = removed_positions[j]
+            if removed_start_pos > start_pos:
+                result.append(("%d.%d" % start_pos, "%d.%d" % removed_start_pos))
+            start_pos = max(start_pos, removed_end_pos)
+            j += 1
+        
+        if start_pos < end_pos:
+            result.append(("%d.%d" % start_pos, "%d.%d" % end_pos))
+    
+    return result
+
 def update_coloring(event):
     if hasattr(event, "text_widget"):
         text = event.text_widget
@@ -6,7 +6,7 @@ Adds debugging commands and features.
 
 import tkinter as tk
 from tkinter import ttk
-from thonny.common import DebuggerCommand
+from thonny.common import DebuggerCommand, update_stack
 from thonny.memory import VariablesFrame
 from thonny import ast_utils, memory, misc_utils, ui_utils
 from thonny.misc_utils import shorten_repr
@@ -28,6 +28,8 @@ class Debugger:
         
         self._main_frame_visualizer = None
         self._last_progress_message = None
+        self._stack = [] # complete FrameInfo-s assembled from backend's incremental exports
+        self._code_sources = {} # code_id -> source
         
         get_workbench().bind("DebuggerProgress", self._handle_debugger_progress, True)
         get_workbench().bind("ToplevelResult", self._handle_toplevel_result, True)
@@ -69,6 +71,13 @@ class Debugger:
             image_filename="run.step_out.gif",
             include_in_toolbar=True)
         
+        get_workbench().add_command("resume", "run", "Resume (run to next breakpoint)",
+            self._cmd_resume,
+            tester=self._cmd_stepping_commands_enabled,
+            default_sequence="<F9>",
+            group=30,
+            include_in_toolbar=False)
+        
         get_workbench().add_command("run_to_cursor", "run", "Run to cursor",
             self._cmd_run_to_cursor,
             tester=self._cmd_run_to_cursor_enabled,
@@ -97,9 +106,11 @@ class Debugger:
             
             # tell VM the state we are seeing
             cmd.setdefault (
-                frame_id=self._last_progress_message.stack[-1].id,
-                state=self._last_progress_message.stack[-1].last_event,
-                focus=self._last_progress_message.stack[-1].last_event_focus
+                frame_id=self._stack[-1].id,
+                state=self._stack[-1].last_event,
+                focus=self._stack[-1].last_event_focus,
+                # values are shown in grids and editor boxes
+                repr_budget=memory.MAX_REPR_LENGTH_IN_GRID
             )
             
             get_runner().send_command(cmd)
@@ -123,6 +134,11 @@ class Debugger:
         
     def _cmd_step_out(self):
         self._check_issue_debugger_command("out")
+    
+    def _cmd_resume(self):
+        # breakpoints may have been changed after starting
+        self._check_issue_debugger_command("resume",
+            breakpoints=get_workbench().get_editor_notebook().get_breakpoints())
 
     def _cmd_run_to_cursor(self):
         visualizer = self._get_topmost_selected_visualizer()
@@ -164,27 +180,23 @@ class Debugger:
 
     def _handle_debugger_progress(self, msg):
         self._last_progress_message = msg
+        self._stack = update_stack(self._stack, msg.stack, self._code_sources)
         
-        if self._should_skip_event(msg):
-            self._check_issue_debugger_command("run_to_before", automatic=True)
-        else:
-            main_frame_id = msg.stack[0].id
+        # Events not worth stopping at are skipped by the backend 
+        # (see AUTOMATIC_STEPPING_POLICIES in backend)
+        main_frame_id = self._stack[0].id
+        
+        # clear obsolete main frame visualizer
+        if (self._main_frame_visualizer 
+            and self._main_frame_visualizer.get_frame_id() != main_frame_id):
+            self._main_frame_visualizer.close()
+            self._main_frame_visualizer = None
             
-            # clear obsolete main frame visualizer
-            if (self._main_frame_visualizer 
-                and self._main_frame_visualizer.get_frame_id() != main_frame_id):
-                self._main_frame_visualizer.close()
-                self._main_frame_visualizer = None
-                
-            if not self._main_frame_visualizer:
-                self._main_frame_visualizer = MainFrameVisualizer(msg.stack[0])
-                
-            self._main_frame_visualizer.update_this_and_next_frames(msg)
+        if not self._main_frame_visualizer:
+            self._main_frame_visualizer = MainFrameVisualizer(self._stack[0])
+            
+        self._main_frame_visualizer.update_this_and_next_frames(msg, self._stack)
         
-        # advance automatically in some cases
-        event = msg.stack[-1].last_event
-        args = msg.stack[-1].last_event_args
-
         if msg.exception:
             showerror("Exception",
                       # Following is clever but noisy 
@@ -192,35 +204,14 @@ class Debugger:
                       msg.exception["type_name"] 
                       + ": " + msg.exception_msg)
             self._check_issue_debugger_command("step", automatic=True)
-            
-        elif (event == "after_expression" 
-            and "last_child" in args["node_tags"]
-            and "child_of_statement" in args["node_tags"]):
-            # This means we're done with the expression, so let's speed up a bit.
-            self._check_issue_debugger_command("step", automatic=True)
-            # Next event will be before_statement_again
-
-                        
-            
-    
-    def _should_skip_event(self, msg):
-        frame_info = msg.stack[-1]
-        event = frame_info.last_event
-        tags = frame_info.last_event_args["node_tags"]
-        
-        if event == "after_statement":
-            return True
-        
-        # TODO: consult also configuration
-        if "call_function" in tags:
-            return True
-        else:
-            return False
     
     def _handle_toplevel_result(self, msg):
         if self._main_frame_visualizer is not None:
             self._main_frame_visualizer.close()
             self._main_frame_visualizer = None    
+        
+        self._stack = []
+        self._code_sources = {}
 
 
 class FrameVisualizer:
@@ -237,6 +228,8 @@ class FrameVisualizer:
         self._source = frame_info.source
         self._expression_box = ExpressionBox(text_frame)
         self._next_frame_visualizer = None
+        self._frame_info = None
+        self._showing_exception = False
         
         self._text.tag_configure('focus', background=_ACTIVE_FOCUS_BACKGROUND, borderwidth=1, relief=tk.SOLID)
         self._text.tag_configure('exception', background="#FFBFD6")
@@ -255,13 +248,16 @@ class FrameVisualizer:
     def get_frame_id(self):
         return self._frame_id
     
-    def update_this_and_next_frames(self, msg):
+    def update_this_and_next_frames(self, msg, stack):
         """Must not be used on obsolete frame"""
         
         #debug("State: %s, focus: %s", msg.state, msg.focus)
         
-        frame_info, next_frame_info = self._find_this_and_next_frame(msg.stack)
-        self._update_this_frame(msg, frame_info)
+        frame_info, next_frame_info = self._find_this_and_next_frame(stack)
+        # Debugger keeps FrameInfo objects of unchanged frames
+        if (frame_info is not self._frame_info 
+            or msg.exception is not None or self._showing_exception):
+            self._update_this_frame(msg, frame_info)
         
         # clear obsolete next frame visualizer
         if (self._next_frame_visualizer 
@@ -274,7 +270,7 @@ class FrameVisualizer:
             self._next_frame_visualizer = self._create_next_frame_visualizer(next_frame_info)
             
         if self._next_frame_visualizer:
-            self._next_frame_visualizer.update_this_and_next_frames(msg)
+            self._next_frame_visualizer.update_this_and_next_frames(msg, stack)
         
     
     def _remove_focus_tags(self):
@@ -291,6 +287,7 @@ class FrameVisualizer:
             self._tag_range(frame_info.last_event_focus, "focus", True)
             if msg.exception is not None:
                 self._tag_range(frame_info.last_event_focus, "exception", True)
+            self._showing_exception = msg.exception is not None
                 
             self._text.tag_configure('focus', background=_ACTIVE_FOCUS_BACKGROUND, borderwidth=1, relief=tk.SOLID)
         else:
@@ -5,6 +5,7 @@ from tkinter import ttk
 
 from thonny import misc_utils
 from thonny.globals import get_workbench
+from thonny.tktextext import set_tag_ranges
 from thonny.ui_utils import select_sequence
 
 #TODO - consider moving the cmd_find method to main class in order to pass the editornotebook reference
@@ -251,10 +252,8 @@ class FindDialog(tk.Toplevel):
         else: #start a new search, start from the current insert line position
             if self.active_found_tag is not None:
                 self.codeview.text.tag_remove("currentfound", self.active_found_tag[0], self.active_found_tag[1]); #remove the previous active tag if it was present
-            for tag in self.passive_found_tags:
-                self.codeview.text.tag_remove("found", tag[0], tag[1]);                                            #and remove all the previous passive tags that were present
             search_start_index = self.codeview.text.index("insert");    #start searching from the current insert position
-            self._find_and_tag_all(tofind);                             #set the passive tag to ALL found occurences
+            self._find_and_tag_all(tofind);                             #set the passive tag to ALL found occurences (and only these)
             FindDialog.last_searched_word = tofind;                     #set the data about last search
             self.last_search_case = self._is_search_case_sensitive();       
 
@@ -293,8 +292,7 @@ class FindDialog(tk.Toplevel):
 
     #removes the active tag and all passive tags
     def _remove_all_tags(self):
-        for tag in self.passive_found_tags:
-            self.codeview.text.tag_remove("found", tag[0], tag[1]); #removes the passive tags
+        self.codeview.text.tag_remove("found", "1.0", "end"); #removes the passive tags
 
         if self.active_found_tag is not None:
             self.codeview.text.tag_remove("currentfound", self.active_found_tag[0], self.active_found_tag[1]); #removes the currently active tag   
@@ -310,10 +308,11 @@ class FindDialog(tk.Toplevel):
         if self._repeats_last_search(tofind) and not force:   #nothing to do, all passive tags already set
             return
 
+        self.passive_found_tags = set()
         currentpos = 1.0;
         end = self.codeview.text.index("end");
 
-        #searches and tags until the end of codeview
+        #searches until the end of codeview
         while True:
             currentpos = self.codeview.text.search(tofind, currentpos, end, nocase = not self._is_search_case_sensitive()); 
             if currentpos == "":
@@ -321,9 +320,11 @@ class FindDialog(tk.Toplevel):
 
             endpos = self.codeview.text.index("%s+%dc" % (currentpos, len(tofind)))
             self.passive_found_tags.add((currentpos, endpos))
-            self.codeview.text.tag_add("found", currentpos, endpos);
             
-            currentpos = self.codeview.text.index("%s+1c" % currentpos);
+            currentpos = "%s+1c" % currentpos; #search accepts index expressions
+
+        #tags all occurrences at once
+        set_tag_ranges(self.codeview.text, {"found" : self.passive_found_tags})
 
     #initializes the tagging styles 
     def _init_found_tag_styles(self):
@@ -1,6 +1,7 @@
 import tkinter as tk
 from jedi import Script
 from thonny.globals import get_workbench, get_runner
+import thonny.jedi_utils as jedi_utils
 from thonny.ui_utils import control_is_pressed
 
 
@@ -16,8 +17,9 @@ def goto_definition(event):
     index_parts = index.split('.')
     line, column = int(index_parts[0]), int(index_parts[1])
     # TODO: find current editor filename
-    script = Script(source, line=line, column=column, path="")
-    defs = script.goto_definitions()
+    with jedi_utils.jedi_lock:
+        script = Script(source, line=line, column=column, path="")
+        defs = script.goto_definitions()
     if len(defs) > 0:
         module_path = defs[0].module_path
         module_name = defs[0].module_name
@@ -1,55 +1,97 @@
 # -*- coding: utf-8 -*-
 
 import tkinter as tk
+from tkinter import ttk
 
-from thonny.memory import MemoryFrame, format_object_id, MAX_REPR_LENGTH_IN_GRID,\
-    parse_object_id
+from thonny.memory import VirtualMemoryFrame, format_object_id, MAX_REPR_LENGTH_IN_GRID
 from thonny.misc_utils import shorten_repr
 from thonny.globals import get_workbench, get_runner
 from thonny.common import InlineCommand
 
-class HeapView(MemoryFrame):
+SORT_KEYS = [("ID", "id"), ("Type", "type"), ("Recently used", "recent")]
+
+class HeapView(VirtualMemoryFrame):
     def __init__(self, master):
-        MemoryFrame.__init__(self, master, ("id", "value"))
-        
+        VirtualMemoryFrame.__init__(self, master, ("id", "type", "value"))
+
         self.tree.column('id', width=100, anchor=tk.W, stretch=False)
+        self.tree.column('type', width=80, anchor=tk.W, stretch=False)
         self.tree.column('value', width=150, anchor=tk.W, stretch=True)
-        
+
         self.tree.heading('id', text='ID', anchor=tk.W)
-        self.tree.heading('value', text='Value', anchor=tk.W) 
-        
+        self.tree.heading('type', text='Type', anchor=tk.W)
+        self.tree.heading('value', text='Value', anchor=tk.W)
+
+        self._init_toolbar()
+
         get_workbench().bind("Heap", self._handle_heap_event, True)
-        
+
         get_workbench().bind("DebuggerProgress", self._request_heap_data, True)
         get_workbench().bind("ToplevelResult", self._request_heap_data, True)
         # Showing new globals may introduce new interesting objects
-        get_workbench().bind("Globals", self._request_heap_data, True) 
-
-    def _update_data(self, data):
-        self._clear_tree()
-        for value_id in sorted(data.keys()):
-            node_id = self.tree.insert("", "end")
-            self.tree.set(node_id, "id", format_object_id(value_id))
-            self.tree.set(node_id, "value", shorten_repr(data[value_id]["repr"], MAX_REPR_LENGTH_IN_GRID))
-    
+        get_workbench().bind("Globals", self._request_heap_data, True)
+
+    def _init_toolbar(self):
+        toolbar = ttk.Frame(self)
+        toolbar.grid(row=1, column=0, columnspan=2, sticky=tk.EW)
+
+        ttk.Label(toolbar, text="Sort by").grid(row=0, column=0, padx=(0, 3))
+        self._sort_combo = ttk.Combobox(toolbar, state="readonly", width=14,
+                                        values=[label for label, _ in SORT_KEYS])
+        self._sort_combo.current(0)
+        self._sort_combo.grid(row=0, column=1)
+        self._sort_combo.bind("<<ComboboxSelected>>", self._on_query_change, True)
+
+        ttk.Label(toolbar, text="Type").grid(row=0, column=2, padx=(10, 3))
+        self._type_filter_var = tk.StringVar(value="")
+        type_entry = ttk.Entry(toolbar, textvariable=self._type_filter_var, width=12)
+        type_entry.grid(row=0, column=3)
+        type_entry.bind("<Return>", self._on_query_change, True)
+
+        self._size_label = ttk.Label(toolbar, anchor=tk.E)
+        self._size_label.grid(row=0, column=4, sticky=tk.EW, padx=(10, 0))
+        toolbar.columnconfigure(4, weight=1)
+
+    def format_row(self, index, row):
+        return (format_object_id(row["id"]), row["type_name"],
+                shorten_repr(row["repr"], MAX_REPR_LENGTH_IN_GRID))
+
+    def request_rows(self, first, last, generation):
+        sort_key = SORT_KEYS[max(self._sort_combo.current(), 0)][1]
+        get_runner().send_command(InlineCommand("get_heap",
+                                                offset=first,
+                                                limit=last - first,
+                                                sort_key=sort_key,
+                                                type_filter=self._type_filter_var.get(),
+                                                generation=generation,
+                                                repr_budget=MAX_REPR_LENGTH_IN_GRID))
+
     def before_show(self):
         self._request_heap_data(even_when_hidden=True)
 
     def on_select(self, event):
-        iid = self.tree.focus()
-        if iid != '':
-            object_id = parse_object_id(self.tree.item(iid)['values'][0])
-            get_workbench().event_generate("ObjectSelect", object_id=object_id)
-            
+        row = self.get_selected_row()
+        if row is not None:
+            get_workbench().event_generate("ObjectSelect", object_id=row["id"])
+
+    def _on_query_change(self, event=None):
+        self.invalidate_rows(reset_position=True)
+        self.fetch_missing_rows()
+
     def _request_heap_data(self, msg=None, even_when_hidden=False):
         if self.winfo_ismapped() or even_when_hidden:
             # TODO: update itself also when it becomes visible
-            get_runner().send_command(InlineCommand("get_heap"))
-            
+            self.invalidate_rows()
+            self.fetch_missing_rows()
+
     def _handle_heap_event(self, msg):
-        if self.winfo_ismapped():
-            if hasattr(msg, "heap"):
-                self._update_data(msg.heap)
-                
+        if not hasattr(msg, "rows"):
+            # response to another client
+            return
+
+        self.set_rows(msg.total_count, msg.offset, msg.rows, msg.generation)
+        self._size_label.configure(text="%d objects, %d KB (shallow)"
+                                   % (msg.heap_size, msg.heap_bytes // 1024))
+
 def load_plugin():
-    get_workbench().add_view(HeapView, "Heap", "e")
\ No newline at end of file
+    get_workbench().add_view(HeapView, "Heap", "e")
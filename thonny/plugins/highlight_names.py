@@ -10,56 +10,95 @@ except ImportError:
         tree = None
     
 from thonny.globals import get_workbench
+from thonny.text_analysis import get_text_analysis, SnapshotWorker
+from thonny.tktextext import set_tag_ranges
 import tkinter as tk
 import logging
 
 NAME_CONF = {'background' : '#e6ecfe'}
 
+# how long cursor or text must stay still before starting the computation (ms)
+_UPDATE_DELAY = 100
+
 class BaseNameHighlighter:
+    """Computes the positions in a worker thread, using a snapshot of the code.
+    
+    Only the latest request gets processed, the results of earlier requests 
+    and of old revisions of the text are discarded."""
     def __init__(self, text):
         self.text = text
         self.text.tag_configure("NAME", NAME_CONF)
         self.text.tag_raise("sel")
-        self._update_scheduled = False
+        
+        self._update_job = None
+        self._worker = SnapshotWorker(text, self._compute_positions, self._show_positions)
+        
+        # (revision, range of the name at cursor) which the current highlighting is for 
+        self._last_name = None
     
-    def get_positions_for_script(self, script):
+    def get_positions_at(self, snapshot, pos):
+        """Returns the ranges of the name at pos (line and column) and its other occurrences.
+        
+        Gets called in a worker thread, shouldn't touch Tk."""
         raise NotImplementedError();
+    
+    def schedule_update(self):
+        if self._update_job is not None:
+            self.text.after_cancel(self._update_job)
+            self._update_job = None
+        
+        if self._is_last_name_at_cursor():
+            # highlighting is still valid, no need to wait for pending work 
+            self._worker.cancel()
+            return
+        
+        self._update_job = self.text.after(_UPDATE_DELAY, self._start_update)
+    
+    def _start_update(self):
+        self._update_job = None
+        self._last_name = None
+        
+        pos = self._get_cursor_pos()
+        if pos is None or not get_workbench().get_option("view.name_highlighting"):
+            self._worker.cancel()
+            set_tag_ranges(self.text, {"NAME" : set()})
+            return
+        
+        self._worker.request(pos)
+    
+    def _compute_positions(self, snapshot, pos):
+        try:
+            return self.get_positions_at(snapshot, pos)
+        except:
+            logging.exception("Problem when updating name highlighting")
+            return set()
+    
+    def _show_positions(self, positions, snapshot, pos):
+        set_tag_ranges(self.text, {"NAME" : positions})
+        self._last_name = (snapshot.revision, _find_range_at(positions, pos))
+    
+    def _is_last_name_at_cursor(self):
+        if (self._last_name is None 
+            or not get_workbench().get_option("view.name_highlighting")):
+            return False
         
-    def get_positions(self):
+        revision, name_range = self._last_name
+        pos = self._get_cursor_pos()
+        return (revision == get_text_analysis(self.text).revision
+                and name_range is not None 
+                and pos is not None
+                and name_range[0] <= pos <= name_range[1])
+    
+    def _get_cursor_pos(self):
+        """Returns cursor position as (line, column) or None if names shouldn't be highlighted"""
         index = self.text.index("insert")
         
         # ignore if cursor in STRING_OPEN
         if self.text.tag_prevrange("STRING_OPEN", index):
-            return set()
+            return None
 
-        source = self.text.get("1.0", "end") 
         index_parts = index.split('.')
-        line, column = int(index_parts[0]), int(index_parts[1])
-        script = Script(source + ")", line=line, column=column, path="") # https://github.com/davidhalter/jedi/issues/897
-
-        return self.get_positions_for_script(script)
-    
-    def schedule_update(self):
-        def perform_update():
-            try:
-                self.update()
-            finally:
-                self._update_scheduled = False
-        
-        if not self._update_scheduled:
-            self._update_scheduled = True
-            self.text.after_idle(perform_update)
-
-    def update(self):
-        self.text.tag_remove("NAME", "1.0", "end")
-        
-        if get_workbench().get_option("view.name_highlighting"):
-            try:
-                for pos in self.get_positions():
-                    start_index, end_index = pos[0], pos[1]
-                    self.text.tag_add("NAME", start_index, end_index)
-            except:
-                logging.exception("Problem when updating name highlighting")
+        return int(index_parts[0]), int(index_parts[1])
 
 
 class VariablesHighlighter(BaseNameHighlighter):
@@ -85,11 +124,14 @@ class VariablesHighlighter(BaseNameHighlighter):
     # copied from jedi's tree.py with a few modifications
     def _get_statement_for_position(self, node, pos):
         for c in node.children:
-            # sorted here, because the end_pos property depends on the last child having the last position,
-            # there seems to be a problem with jedi, where the children of a node are not always in the right order
+            # end_pos property depends on the last child having the last position,
+            # but there seems to be a problem with jedi, where the children of a node are not always in the right order
+            # (computed here instead of sorting the children, so that the tree doesn't get modified)
             if isinstance(c, tree.Class):
-                c.children.sort(key=lambda x: x.end_pos)
-            if c.start_pos <= pos <= c.end_pos:
+                end_pos = max(child.end_pos for child in c.children)
+            else:
+                end_pos = c.end_pos
+            if c.start_pos <= pos <= end_pos:
                 if c.type not in ('decorated', 'simple_stmt', 'suite') \
                         and not isinstance(c, (tree.Flow, tree.ClassOrFunc)):
                     return c
@@ -228,15 +270,15 @@ class VariablesHighlighter(BaseNameHighlighter):
         usages = find_usages_in_node(scope)
         return usages
     
-    def get_positions_for_script(self, script):
+    def get_positions_at(self, snapshot, pos):
         name = None
-        module_node = jedi_utils.get_module_node(script)
-        stmt = self._get_statement_for_position(module_node, script._pos)
+        module_node = snapshot.get_jedi_module()
+        stmt = self._get_statement_for_position(module_node, pos)
 
         if isinstance(stmt, tree.Name):
             name = stmt
         elif isinstance(stmt, tree.BaseNode):
-            name = stmt.name_for_position(script._pos)
+            name = stmt.name_for_position(pos)
 
         if not name:
             return set()
@@ -254,8 +296,10 @@ class UsagesHighlighter(BaseNameHighlighter):
     
     TODO: check if this gets fixed in later versions of Jedi"""
     
-    def get_positions_for_script(self, script):
-        usages = script.usages()
+    def get_positions_at(self, snapshot, pos):
+        with jedi_utils.jedi_lock:
+            script = Script(snapshot.source + ")", line=pos[0], column=pos[1], path="") # https://github.com/davidhalter/jedi/issues/897
+            usages = script.usages()
         
         result = {("%d.%d" % (usage.line, usage.column),
                   "%d.%d" % (usage.line, usage.column + len(usage.name)))
@@ -265,11 +309,21 @@ class UsagesHighlighter(BaseNameHighlighter):
         
 
 class CombinedHighlighter(VariablesHighlighter, UsagesHighlighter):
-    def get_positions_for_script(self, script):
-        usages = UsagesHighlighter.get_positions_for_script(self, script)
-        variables = VariablesHighlighter.get_positions_for_script(self, script) 
+    def get_positions_at(self, snapshot, pos):
+        usages = UsagesHighlighter.get_positions_at(self, snapshot, pos)
+        variables = VariablesHighlighter.get_positions_at(self, snapshot, pos) 
         return usages | variables
 
+def _find_range_at(positions, pos):
+    """Returns the range (as pair of (line, column)) which contains pos"""
+    for start_index, end_index in positions:
+        start = tuple(map(int, start_index.split(".")))
+        end = tuple(map(int, end_index.split(".")))
+        if start <= pos <= end:
+            return start, end
+    
+    return None
+
 def update_highlighting(event):
     assert isinstance(event.widget, tk.Text)
     text = event.widget
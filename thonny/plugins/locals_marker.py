@@ -1,5 +1,7 @@
 import tkinter as tk
 from thonny.globals import get_workbench
+from thonny.text_analysis import SnapshotWorker
+from thonny.tktextext import set_tag_ranges
 import logging
 import thonny.jedi_utils as jedi_utils
 
@@ -15,26 +17,26 @@ class LocalsHighlighter:
         
         self._configure_tags()
         self._update_scheduled = False
+        self._worker = SnapshotWorker(text, self._compute_positions, self._show_positions)
     
     def get_positions_simple_but_incorrect(self):
         # goto_assignments only gives you last assignment to given node
         import jedi
-        defs = jedi.names(self.text.get('1.0', 'end'), path="",
-                           all_scopes=True, definitions=True, references=True)
-        result = set()
-        for definition in defs:
-            if definition.parent().type == "function": # is located in a function
-                ass = definition.goto_assignments()
-                if len(ass) > 0 and ass[0].parent().type == "function": # is assigned to in a function
-                    pos = ("%d.%d" % (definition.line, definition.column),
-                           "%d.%d" % (definition.line, definition.column+len(definition.name)))
-                    result.add(pos)
+        with jedi_utils.jedi_lock:
+            defs = jedi.names(self.text.get('1.0', 'end'), path="",
+                               all_scopes=True, definitions=True, references=True)
+            result = set()
+            for definition in defs:
+                if definition.parent().type == "function": # is located in a function
+                    ass = definition.goto_assignments()
+                    if len(ass) > 0 and ass[0].parent().type == "function": # is assigned to in a function
+                        pos = ("%d.%d" % (definition.line, definition.column),
+                               "%d.%d" % (definition.line, definition.column+len(definition.name)))
+                        result.add(pos)
         return result
         
     
-    def get_positions_correct_but_using_private_parts(self):
-        from jedi import Script
-        
+    def get_positions_correct_but_using_private_parts(self, snapshot):
         try:
             from jedi.parser.python import tree
         except ImportError:
@@ -80,9 +82,7 @@ class LocalsHighlighter:
                 for child in node.children:
                     process_node(child, local_names, global_names)
 
-        source = self.text.get('1.0', 'end')
-        script = Script(source + ")") # https://github.com/davidhalter/jedi/issues/897
-        module = jedi_utils.get_module_node(script)
+        module = snapshot.get_jedi_module()
         for child in module.children:
             if isinstance(child, tree.BaseNode) and child.is_scope():
                 process_scope(child)
@@ -100,9 +100,7 @@ class LocalsHighlighter:
         self.text.tag_raise("sel")
         
     def _highlight(self, pos_info):
-        for pos in pos_info:
-            start_index, end_index = pos[0], pos[1]
-            self.text.tag_add("LOCAL_NAME", start_index, end_index)
+        set_tag_ranges(self.text, {"LOCAL_NAME" : pos_info})
 
     def schedule_update(self):
         def perform_update():
@@ -116,14 +114,22 @@ class LocalsHighlighter:
             self.text.after_idle(perform_update)
             
     def update(self):
-        self.text.tag_remove("LOCAL_NAME", "1.0", "end")
-        
         if get_workbench().get_option("view.locals_highlighting"):
-            try:
-                highlight_positions = self.get_positions_correct_but_using_private_parts()
-                self._highlight(highlight_positions)
-            except:
-                logging.exception("Problem when updating local variable tags")
+            # parsing is too slow for Tk thread
+            self._worker.request()
+        else:
+            self._worker.cancel()
+            self._highlight(set())
+    
+    def _compute_positions(self, snapshot):
+        try:
+            return self.get_positions_correct_but_using_private_parts(snapshot)
+        except:
+            logging.exception("Problem when updating local variable tags")
+            return set()
+    
+    def _show_positions(self, positions, snapshot):
+        self._highlight(positions)
 
 
 def update_highlighting(event):
@@ -157,7 +157,9 @@ class ObjectInspector(ScrollableFrame):
     def request_object_info(self): 
         get_runner().send_command(InlineCommand("get_object_info",
                                             object_id=self.object_id,
-                                            all_attributes=False)) 
+                                            all_attributes=False,
+                                            repr_budget=MAX_REPR_LENGTH_IN_GRID,
+                                            pin_owner="ObjectInspector")) 
                     
     def set_object_info(self, object_info):
         self.object_info = object_info
@@ -7,10 +7,15 @@ from thonny.tktextext import TextFrame
 import logging
 import thonny.memory
 import ast
+import base64
 from thonny.misc_utils import shorten_repr
 from thonny.ui_utils import update_entry_text, CALM_WHITE
 from thonny.gridtable import ScrollableGridTable
 
+# How many elements or entries of a container are requested together with
+# the rest of object info. More are requested when user scrolls.
+INITIAL_ELEMENTS_COUNT = 100
+
 class ObjectInspector2(ttk.Frame):
     def __init__(self, master):
         ttk.Frame.__init__(self, master)
@@ -32,6 +37,7 @@ class ObjectInspector2(ttk.Frame):
         
         get_workbench().bind("ObjectSelect", self.show_object, True)
         get_workbench().bind("ObjectInfo", self._handle_object_info_event, True)
+        get_workbench().bind("ObjectPage", self._handle_object_page_event, True)
         get_workbench().bind("DebuggerProgress", self._handle_progress_event, True)
         get_workbench().bind("ToplevelResult", self._handle_progress_event, True)
         
@@ -146,10 +152,13 @@ class ObjectInspector2(ttk.Frame):
             FileHandleInspector(self.data_frame),
             FunctionInspector(self.data_frame),
             StringInspector(self.data_frame),
-            ElementsInspector(self.data_frame),
-            DictInspector(self.data_frame),
-            DataFrameInspector(self.data_frame),
-            ImageInspector(self.data_frame),
+            ElementsInspector(self.data_frame, self._request_object_window, 
+                              self._request_object_page),
+            DictInspector(self.data_frame, self._request_object_window,
+                          self._request_object_page),
+            DataFrameInspector(self.data_frame, self._request_object_window,
+                               self._request_object_page),
+            ImageInspector(self.data_frame, self.request_object_info),
             ReprInspector(self.data_frame)
         ]
         
@@ -201,12 +210,41 @@ class ObjectInspector2(ttk.Frame):
                 else:
                     self.set_object_info(msg.info)
     
+    def _handle_object_page_event(self, msg):
+        if (self.winfo_ismapped() 
+            and msg.page["id"] == self.object_id
+            and not getattr(msg, "not_found", False)
+            and self.current_type_specific_inspector is not None):
+            self.current_type_specific_inspector.set_page(msg.page)
+    
     def _handle_progress_event(self, event):
         if self.object_id is not None:
-            self.request_object_info()
-                
+            inspector = self.current_type_specific_inspector
+            if isinstance(inspector, thonny.memory.VirtualMemoryFrame):
+                # keep the scroll position, but refresh the rows
+                inspector.invalidate_rows()
+                inspector.fetch_missing_rows()
+            elif isinstance(inspector, DataFrameInspector) and inspector.table is not None:
+                inspector.refresh()
+            else:
+                self.request_object_info()
+    
+    def _request_object_window(self, first, last, generation, **options):
+        """Requests full object info together with given range of items"""
+        if self.object_id is not None:
+            self.request_object_info(first, last - first, generation, **options)
+    
+    def _request_object_page(self, first, last, generation):
+        """Requests only given range of items (other info is already shown)"""
+        if self.object_id is not None:
+            get_runner().send_command(InlineCommand("get_object_page",
+                                                object_id=self.object_id,
+                                                start=first,
+                                                count=last - first,
+                                                generation=generation))
                 
-    def request_object_info(self): 
+    def request_object_info(self, start=0, count=INITIAL_ELEMENTS_COUNT, generation=None,
+                            **options): 
         if self.active_page is not None:
             frame_width=self.active_page.winfo_width()
             frame_height=self.active_page.winfo_height()
@@ -226,7 +264,13 @@ class ObjectInspector2(ttk.Frame):
                                             include_attributes=self.active_page == self.attributes_frame,
                                             all_attributes=False,
                                             frame_width=frame_width,
-                                            frame_height=frame_height)) 
+                                            frame_height=frame_height,
+                                            start=start,
+                                            count=count,
+                                            generation=generation,
+                                            repr_budget=thonny.memory.MAX_REPR_LENGTH_IN_GRID,
+                                            pin_owner="ObjectInspector2",
+                                            **options)) 
                     
     def set_object_info(self, object_info):
         self.object_info = object_info
@@ -308,6 +352,9 @@ class TypeSpecificInspector:
     def set_object_info(self, object_info, label):
         pass
     
+    def set_page(self, page):
+        pass
+    
     def applies_to(self, object_info):
         return False
     
@@ -433,11 +480,50 @@ class ReprInspector(TextFrame, TypeSpecificInspector):
         """
         
 
-class ElementsInspector(thonny.memory.MemoryFrame, TypeSpecificInspector):
-    def __init__(self, master):
+class PagedInspector(thonny.memory.VirtualMemoryFrame, TypeSpecificInspector):
+    """Shows elements or entries of a container, which are requested 
+    from the backend page by page, as user scrolls"""
+    def __init__(self, master, columns, items_key, request_info, request_page):
         TypeSpecificInspector.__init__(self, master)
-        thonny.memory.MemoryFrame.__init__(self, master, ('index', 'id', 'value'))
+        thonny.memory.VirtualMemoryFrame.__init__(self, master, columns)
         self.configure(border=1)
+        self._items_key = items_key
+        self._request_info = request_info
+        self._request_page = request_page
+        self._object_id = None
+        self._info_generation = None
+    
+    def request_rows(self, first, last, generation):
+        if self._object_id is not None:
+            if generation != self._info_generation:
+                # program state has changed, summary needs updating as well
+                self._info_generation = generation
+                self._request_info(first, last, generation)
+            else:
+                self._request_page(first, last, generation)
+    
+    def set_items(self, object_info, items):
+        generation = object_info["generation"]
+        if generation is None or object_info["id"] != self._object_id:
+            # info was not requested by this inspector, start from scratch
+            self.invalidate_rows(reset_position=object_info["id"] != self._object_id)
+            self._object_id = object_info["id"]
+            generation = self.get_generation()
+            self._info_generation = generation
+        
+        self.tree.config(height=min(object_info["length"], 10))
+        self.set_rows(object_info["length"], object_info["start"], items, generation)
+    
+    def set_page(self, page):
+        if page["id"] == self._object_id and self._items_key in page:
+            self.set_rows(page["length"], page["start"], page[self._items_key], 
+                          page["generation"])
+    
+
+class ElementsInspector(PagedInspector):
+    def __init__(self, master, request_info, request_page):
+        PagedInspector.__init__(self, master, ('index', 'id', 'value'), "elements",
+                                request_info, request_page)
         
         #self.vert_scrollbar.grid_remove()
         self.tree.column('index', width=40, anchor=tk.W, stretch=False)
@@ -479,40 +565,29 @@ class ElementsInspector(thonny.memory.MemoryFrame, TypeSpecificInspector):
     def on_double_click(self, event):
         self.show_selected_object_info()
     
+    def format_row(self, index, element):
+        return (index if self.elements_have_indices else "",
+                thonny.memory.format_object_id(element["id"]),
+                shorten_repr(element["repr"], thonny.memory.MAX_REPR_LENGTH_IN_GRID))
+    
     def set_object_info(self, object_info, label):
         assert "elements" in object_info
         
         self.elements_have_indices = object_info["type"] in (repr(tuple), repr(list))
         self._update_columns()
         
-        self._clear_tree()
-        index = 0
-        # TODO: don't show too big number of elements
-        for element in object_info["elements"]:
-            node_id = self.tree.insert("", "end")
-            if self.elements_have_indices:
-                self.tree.set(node_id, "index", index)
-            else:
-                self.tree.set(node_id, "index", "")
-                
-            self.tree.set(node_id, "id", thonny.memory.format_object_id(element["id"]))
-            self.tree.set(node_id, "value", shorten_repr(element["repr"], thonny.memory.MAX_REPR_LENGTH_IN_GRID))
-            index += 1
+        self.set_items(object_info, object_info["elements"])
 
-        count = len(object_info["elements"])
-        self.tree.config(height=min(count,10))
-        
-        
+        count = object_info["length"]
         label.configure (
             text=("%d element" if count == 1 else "%d elements") % count
         ) 
         
 
-class DictInspector(thonny.memory.MemoryFrame, TypeSpecificInspector):
-    def __init__(self, master):
-        TypeSpecificInspector.__init__(self, master)
-        thonny.memory.MemoryFrame.__init__(self, master, ('key_id', 'id', 'key', 'value'))
-        self.configure(border=1)
+class DictInspector(PagedInspector):
+    def __init__(self, master, request_info, request_page):
+        PagedInspector.__init__(self, master, ('key_id', 'id', 'key', 'value'), "entries",
+                                request_info, request_page)
         #self.vert_scrollbar.grid_remove()
         self.tree.column('key_id', width=100, anchor=tk.W, stretch=False)
         self.tree.column('key', width=100, anchor=tk.W, stretch=False)
@@ -541,22 +616,20 @@ class DictInspector(thonny.memory.MemoryFrame, TypeSpecificInspector):
     def on_double_click(self, event):
         # NB! this selects value
         self.show_selected_object_info()
+    
+    def format_row(self, index, entry):
+        key, value = entry
+        return (thonny.memory.format_object_id(key["id"]),
+                thonny.memory.format_object_id(value["id"]),
+                shorten_repr(key["repr"], thonny.memory.MAX_REPR_LENGTH_IN_GRID),
+                shorten_repr(value["repr"], thonny.memory.MAX_REPR_LENGTH_IN_GRID))
 
     def set_object_info(self, object_info, label):
         assert "entries" in object_info
         
-        self._clear_tree()
-        # TODO: don't show too big number of elements
-        for key, value in object_info["entries"]:
-            node_id = self.tree.insert("", "end")
-            self.tree.set(node_id, "key_id", thonny.memory.format_object_id(key["id"]))
-            self.tree.set(node_id, "key", shorten_repr(key["repr"], thonny.memory.MAX_REPR_LENGTH_IN_GRID))
-            self.tree.set(node_id, "id", thonny.memory.format_object_id(value["id"]))
-            self.tree.set(node_id, "value", shorten_repr(value["repr"], thonny.memory.MAX_REPR_LENGTH_IN_GRID))
+        self.set_items(object_info, object_info["entries"])
 
-        count = len(object_info["entries"])
-        self.tree.config(height=min(count,10))
-        
+        count = object_info["length"]
         label.configure (
             text=("%d entry" if count == 1 else "%d entries") % count
         ) 
@@ -576,7 +649,9 @@ class AttributesFrame(thonny.memory.VariablesFrame):
         self.show_selected_object_info()
     
 class DataFrameInspector(TypeSpecificInspector, tk.Frame):
-    def __init__(self, master):
+    """Shows column summaries and the rows of a DataFrame. Rows are requested
+    from the backend page by page as the user scrolls"""
+    def __init__(self, master, request_info, request_page):
         TypeSpecificInspector.__init__(self, master)
         tk.Frame.__init__(self, master)
         self.columnconfigure(0, weight=1)
@@ -584,70 +659,162 @@ class DataFrameInspector(TypeSpecificInspector, tk.Frame):
         
         self.table = None
         self.columns = None
-        self.index = None
-        self.values = None
-        
-        """
-        data_row_count = 50
-        column_count = 16
-        
-        header_row = []
-        for i in range(column_count):
-            header_row.append("Hdr " + str(i) )
-        ScrollableGridTable.__init__(self, master, [header_row], 50, 0, 1)
-        
-        data_rows = {}
-        for r in range(data_row_count):
-            row = []
-            for i in range(column_count):
-                row.append("D" + str(r) + ":" + str(i))
-            data_rows[r] = row
-        self.grid_table.set_data_rows(data_rows)
-        """
+        self._request_info = request_info
+        self._request_page = request_page
+        self._object_id = None
+        self._generation = 0
+        self._info_generation = None
+        self._column_stats = None
     
     def set_object_info(self, object_info, label):
-        if self.table is not None and self.columns != object_info["columns"]:
+        generation = object_info["generation"]
+        if generation is None or object_info["id"] != self._object_id:
+            # info was not requested by this inspector, start from scratch
+            self._generation += 1
+            generation = self._generation
+            self._info_generation = generation
+            new_object = object_info["id"] != self._object_id
+            self._object_id = object_info["id"]
+        elif generation != self._generation:
+            # outdated response
+            return
+        else:
+            new_object = False
+        
+        self._column_stats = object_info["column_stats"]
+        
+        headers = self._create_header_rows(object_info)
+        if self.table is not None and (new_object 
+                                       or self.columns != object_info["columns"]
+                                       or len(headers) != self.table.grid_table.header_row_count):
             self.table.grid_forget()
             self.table.destroy()
             self.table = None
         
-        data = []
         self.columns = object_info["columns"]
         index = object_info["index"]
         values = object_info["values"]
         assert len(values) == len(index)
-        for i in range(len(values)):
-            data.append([index[i]] + values[i])
-        
-        headers = [""] + self.columns 
+        data = [[index[i]] + values[i] for i in range(len(values))]
         
         if self.table is None:
-            self.table = ScrollableGridTable(self, [headers],
-                                             object_info["row_count"], 0, 1)
+            self.table = ScrollableGridTable(self, headers,
+                                             object_info["row_count"], 0, 1,
+                                             request_rows=self._request_rows)
             
             self.table.grid(row=0, column=0, sticky="nsew")
+        else:
+            self.table.grid_table.set_header_rows(headers)
+            if object_info["generation"] is None:
+                # rows of other program state shouldn't be mixed in
+                self.table.grid_table.data_rows_are_stale = True
+        
+        self.table.set_data_rows(object_info["row_count"], object_info["start"], data)
+        
+        label.configure(text="%d rows, %d columns" 
+                        % (object_info["row_count"], len(self.columns)))
+    
+    def set_page(self, page):
+        if (page["id"] == self._object_id 
+            and page["generation"] == self._generation
+            and "values" in page
+            and self.table is not None):
+            index = page["index"]
+            values = page["values"]
+            data = [[index[i]] + values[i] for i in range(len(values))]
+            self.table.set_data_rows(page["row_count"], page["start"], data)
+    
+    def refresh(self):
+        """Requests visible rows (and column info) for new program state"""
+        if self.table is not None:
+            self._generation += 1
+            self.table.grid_table.invalidate_data_rows()
+    
+    def _request_rows(self, first, last):
+        if self._info_generation != self._generation:
+            # columns and their stats are needed only once per program state
+            self._info_generation = self._generation
+            self._request_info(first, last, self._generation)
+        else:
+            self._request_page(first, last, self._generation)
+    
+    def _create_header_rows(self, object_info):
+        rows = [[""] + object_info["columns"],
+                ["dtype"] + object_info["dtypes"]]
+        
+        stats = self._column_stats
+        if stats is None or len(stats) != len(object_info["columns"]):
+            return rows
+        
+        def format_stat(value):
+            if isinstance(value, float):
+                return "%.6g" % value
+            elif value is None:
+                return ""
+            else:
+                return str(value)
+        
+        rows.append(["count"] + [format_stat(s["count"]) for s in stats])
+        if any("mean" in s for s in stats):
+            for name in ["mean", "min", "max"]:
+                rows.append([name] + [format_stat(s.get(name)) for s in stats])
         
-        self.table.grid_table.set_data(data)
+        return rows
     
     def applies_to(self, object_info):
         return object_info.get("is_DataFrame", False)
 
 class ImageInspector(TypeSpecificInspector, tk.Frame):
-    def __init__(self, master):
+    def __init__(self, master, request_image):
         tk.Frame.__init__(self, master)
         self.label = tk.Label(self, anchor="nw")
         self.label.grid(row=0, column=0, sticky="nsew")
         self.rowconfigure(0, weight=1)
         self.columnconfigure(0, weight=1)
+        
+        self._request_image = request_image
+        self._image_frame_size = None
+        self._resize_job = None
+        master.bind("<Configure>", self._on_configure, True)
 
     def set_object_info(self, object_info, label):
-        #print(object_info["image_data"])
-        self.image = tk.PhotoImage(data=object_info["image_data"])
+        data = object_info["image_data"]
+        if object_info.get("image_encoding") == "raw":
+            try:
+                self.image = tk.PhotoImage(data=data)
+            except tk.TclError:
+                # older Tk accepts only base64 encoded data
+                self.image = tk.PhotoImage(data=base64.b64encode(data))
+        else:
+            self.image = tk.PhotoImage(data=data)
+            
         self.label.configure(image=self.image)
+        if object_info.get("image_preview", False):
+            label.configure(text="Figure (rendering...)")
+            # let preview get painted before backend gets busy with rendering
+            self.after_idle(lambda: self._request_image(allow_preview=False))
+        else:
+            label.configure(text="Figure")
+        
+        self._image_frame_size = (self.master.winfo_width(), self.master.winfo_height())
     
     def applies_to(self, object_info):
         return "image_data" in object_info
     
+    def _on_configure(self, event):
+        if self._resize_job is not None:
+            self.after_cancel(self._resize_job)
+        # wait until user stops resizing
+        self._resize_job = self.after(300, self._check_size)
+    
+    def _check_size(self):
+        self._resize_job = None
+        if (self.winfo_ismapped()
+            and self._image_frame_size is not None
+            and self._image_frame_size != (self.master.winfo_width(), 
+                                           self.master.winfo_height())):
+            # backend caches renderings, so returning to earlier size is cheap
+            self._request_image()
         
         
 def load_plugin():
@@ -2,6 +2,7 @@ import re
 import tkinter as tk
 from tkinter import ttk
 from thonny.globals import get_workbench
+from thonny.text_analysis import get_text_analysis
 from thonny.ui_utils import SafeScrollbar
 
 class OutlineView(ttk.Frame):
@@ -57,7 +58,9 @@ class OutlineView(ttk.Frame):
         if editor is None:
             return
         
-        root = self._parse_source(editor.get_code_view().get_content())
+        # parse result is reused until the code changes
+        root = get_text_analysis(editor.get_code_view().text).get_cached("outline",
+            lambda analysis: self._parse_source(analysis.get_source()))
         for child in root[2]:
             self._add_item_to_tree('', child)
     
@@ -1,8 +1,7 @@
 from thonny.globals import get_workbench
-import tokenize
-import io
 from thonny.codeview import CodeViewText
 from thonny.shell import ShellText
+from thonny.text_analysis import get_text_analysis, tokenize_source
 
 
 _OPENERS = {')': '(', ']': '[', '}': '{'}
@@ -70,18 +69,10 @@ class ParenMatcher:
             open_index = "%d.%d" % (opener.start[0], opener.start[1])
             self.text.tag_add("UNCLOSED", open_index, end_index) 
     
-    def _get_paren_tokens(self, source):
-        result = []
-        try: 
-            tokens = tokenize.tokenize(io.BytesIO(source.encode('utf-8')).readline)
-            for token in tokens:
-                if token.string != "" and token.string in "()[]{}":
-                    result.append(token)
-        except:
-            # happens eg when parens are unbalanced or there is indentation error or ...
-            pass
-        
-        return result
+    def _get_paren_tokens(self, start_index, end_index):
+        # editor is always processed as a whole, tokens are shared with other plugins
+        return get_text_analysis(self.text).get_cached("paren_tokens",
+            lambda analysis: _filter_paren_tokens(analysis.get_tokens()))
 
     def find_surrounding(self, start_index, end_index):
                 
@@ -89,14 +80,7 @@ class ParenMatcher:
         opener, closer = None, None
         open_index, close_index = None, None
         
-        start_row, start_col = map(int, start_index.split(".")) 
-        source = self.text.get(start_index, end_index)
-        
-        # prepend source with empty lines and spaces to make 
-        # token rows and columns match with widget indices
-        source = ("\n" * (start_row-1)) + (" "*start_col) + source 
-        
-        for t in self._get_paren_tokens(source):
+        for t in self._get_paren_tokens(start_index, end_index):
             if t.string == "" or t.string not in "()[]{}":
                 continue
             if t.string in "([{":
@@ -122,6 +106,16 @@ class ParenMatcher:
                self.text.compare("insert-1c", "<=", index2)
 
 class ShellParenMatcher(ParenMatcher):
+    def _get_paren_tokens(self, start_index, end_index):
+        start_row, start_col = map(int, start_index.split(".")) 
+        source = self.text.get(start_index, end_index)
+        
+        # prepend source with empty lines and spaces to make 
+        # token rows and columns match with widget indices
+        source = ("\n" * (start_row-1)) + (" "*start_col) + source 
+        
+        return _filter_paren_tokens(tokenize_source(source))
+    
     def _update_highlighting_for_active_range(self):
     
         # TODO: check that cursor is in this range
@@ -132,6 +126,9 @@ class ShellParenMatcher(ParenMatcher):
             remaining = self._highlight_surrounding(start_index, end_index)
             self._highlight_unclosed(remaining, start_index, "end")
             
+def _filter_paren_tokens(tokens):
+    return [token for token in tokens if token.string != "" and token.string in "()[]{}"]
+
 def update_highlighting(event=None):
     text = event.widget
     if not hasattr(text, "paren_matcher"):
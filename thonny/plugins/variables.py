@@ -1,6 +1,6 @@
 # -*- coding: utf-8 -*-
 
-from thonny.memory import VariablesFrame
+from thonny.memory import VariablesFrame, MAX_REPR_LENGTH_IN_GRID
 from thonny.globals import get_workbench, get_runner
 from thonny.common import InlineCommand
 
@@ -18,12 +18,27 @@ class GlobalsView(VariablesFrame):
     
     def _handle_globals_event(self, event):
         # TODO: handle other modules as well
-        self.update_variables(event.globals)
+        if hasattr(event, "variables_patch"):
+            if event.base_version == self.variables_version:
+                self.patch_variables(event.variables_patch["changed"], 
+                                     event.variables_patch["removed"])
+                self.variables_version = event.version
+            else:
+                # the tree has been changed meanwhile, patch doesn't apply
+                self._clear_tree()
+                self._request_globals()
+                return
+        else:
+            self.update_variables(event.globals)
+            self.variables_version = getattr(event, "version", None)
     
     def _request_globals(self, event=None, even_when_hidden=False):
         if self.winfo_ismapped() or even_when_hidden:
             # TODO: module_name
-            get_runner().send_command(InlineCommand("get_globals", module_name="__main__"))
+            # backend sends only changes compared to the version we have 
+            get_runner().send_command(InlineCommand("get_globals", module_name="__main__",
+                                                    known_version=self.variables_version,
+                                                    repr_budget=MAX_REPR_LENGTH_IN_GRID))
     
 
 def load_plugin():
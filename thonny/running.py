@@ -15,10 +15,12 @@ import os.path
 import subprocess
 import sys
 
-from thonny.common import serialize_message, ToplevelCommand, \
+from thonny.common import ToplevelCommand, \
     InlineCommand, parse_shell_command, \
-    CommandSyntaxError, parse_message, DebuggerCommand, InputSubmission,\
-    UserError
+    CommandSyntaxError, DebuggerCommand, InputSubmission,\
+    UserError, TEXT_PROTOCOL, SUPPORTED_PROTOCOLS, MESSAGE_PROTOCOLS_ENV_VAR,\
+    read_message, write_message, read_message_bytes, decode_message,\
+    encode_message, ChannelStats, get_message_stats_key
 from thonny.globals import get_workbench, get_runner
 import shlex
 from thonny import THONNY_USER_DIR
@@ -29,17 +31,44 @@ import tokenize
 import collections
 import signal
 import logging
+import threading
+import time
+import tkinter
 
 
 DEFAULT_CPYTHON_INTERPRETER = "default"
 WINDOWS_EXE = "python.exe"
 
+# Message polling interval (ms) is short while messages are coming in 
+# and grows up to the maximum while the backend is quiet.
+# Listener thread can wake up the polling sooner if the platform allows 
+# watching a pipe from Tk event loop. 
+MIN_POLL_INTERVAL = 1
+MAX_POLL_INTERVAL_WITHOUT_WAKEUP = 50
+MAX_POLL_INTERVAL_WITH_WAKEUP = 1000
+
 class Runner:
     def __init__(self):
         get_workbench().set_default("run.working_directory", os.path.expanduser("~"))
         get_workbench().set_default("run.auto_cd", True)
         get_workbench().set_default("run.backend_configuration", "Python (%s)" % DEFAULT_CPYTHON_INTERPRETER)
         get_workbench().set_default("run.used_interpreters", [])
+        # backend sends program output in batches
+        get_workbench().set_default("run.output_flush_interval_ms", 20)
+        get_workbench().set_default("run.output_flush_size", 65536)
+        # how many characters of program output may wait for the UI
+        get_workbench().set_default("run.max_queued_output", 1000000)
+        # "block" makes backend wait when output queue is full, 
+        # "keep_tail" drops older queued output instead
+        get_workbench().set_default("run.runaway_output_policy", "block")
+        # backend adds send time to messages and frontend logs the delivery latency
+        get_workbench().set_default("run.measure_message_latency", False)
+        # both processes measure serialization, queueing and event handling times 
+        # per message type (takes effect when backend is restarted)
+        get_workbench().set_default("run.collect_channel_stats", False)
+        # how many exported objects (besides the ones still alive anyway) 
+        # backend remembers for inspecting by id
+        get_workbench().set_default("run.object_registry_size", 10000)
         get_workbench().add_backend("Python", CPythonProxy)
         
         from thonny.shell import ShellView
@@ -54,8 +83,13 @@ class Runner:
         self._postponed_commands = []
         self._current_toplevel_command = None
         self._current_command = None
+        self._poll_interval = MIN_POLL_INTERVAL
+        self._poll_after_id = None
+        self._latency_stats = {}
+        self._channel_stats = ChannelStats()
         
         self._check_alloc_console()
+        self._init_wakeup()
     
     def start(self):
         try:
@@ -233,6 +267,10 @@ class Runner:
             if command in ["Run", "run", "Debug", "debug"]:
                 with tokenize.open(cmd.full_filename) as fp:
                     cmd.source = fp.read()
+            
+            if command in ["Debug", "debug"]:
+                # with breakpoints the program runs without instrumentation until first of them
+                cmd.breakpoints = get_workbench().get_editor_notebook().get_breakpoints()
                 
             self.send_command(cmd)
         else:
@@ -334,11 +372,54 @@ class Runner:
         self._postponed_commands = remaining
         
     
+    def _init_wakeup(self):
+        """Listener thread writes a byte into the pipe when it has 
+        queued a message and Tk event loop calls _handle_wakeup when 
+        the pipe becomes readable. (Tk can't watch pipes in Windows, 
+        there Runner relies only on polling.)"""
+        self._wakeup_requested = False
+        self._wakeup_pipe = None
+        
+        if not running_on_windows() and hasattr(get_workbench().tk, "createfilehandler"):
+            try:
+                read_fd, write_fd = os.pipe()
+                get_workbench().tk.createfilehandler(read_fd, tkinter.READABLE, 
+                                                     self._handle_wakeup)
+                self._wakeup_pipe = (read_fd, write_fd)
+            except:
+                logging.exception("Could not set up message wakeup")
+    
+    def request_wakeup(self):
+        """Can be called from any thread after a message has been queued"""
+        if self._wakeup_pipe is not None and not self._wakeup_requested:
+            self._wakeup_requested = True
+            try:
+                os.write(self._wakeup_pipe[1], b"x")
+            except OSError:
+                self._wakeup_requested = False
+    
+    def _handle_wakeup(self, fd, mask):
+        try:
+            os.read(fd, 1024)
+        except OSError:
+            pass
+        
+        # must be reset before polling, otherwise a message queued during
+        # polling may remain unnoticed
+        self._wakeup_requested = False
+        self._poll_vm_messages()
+    
     def _poll_vm_messages(self):
-        """I chose polling instead of event_generate in listener thread,
+        """Runs in Tk thread, either after timeout or after wakeup from 
+        listener thread. (Listener thread doesn't event_generate directly, 
         because event_generate across threads is not reliable
-        http://www.thecodingforums.com/threads/more-on-tk-event_generate-and-threads.359615/
+        http://www.thecodingforums.com/threads/more-on-tk-event_generate-and-threads.359615/)
         """
+        if self._poll_after_id is not None:
+            get_workbench().after_cancel(self._poll_after_id)
+            self._poll_after_id = None
+        
+        message_count = 0
         try:
             initial_state = self.get_state()
             
@@ -346,6 +427,7 @@ class Runner:
                 msg = self._proxy.fetch_next_message()
                 if not msg:
                     break
+                message_count += 1
                 
                 if msg.get("SystemExit", False):
                     self.reset_backend()
@@ -366,9 +448,19 @@ class Runner:
                 
                 if msg["message_type"] == "ToplevelResult":
                     self._current_toplevel_command = None
-    
+                
+                if "sent_time" in msg:
+                    self._record_latency(msg)
+                
                 #logging.debug("Runner: State: %s, Fetched msg: %s" % (self.get_state(), msg))
-                get_workbench().event_generate(msg["message_type"], **msg)
+                channel_stats = self.get_channel_stats()
+                if channel_stats is None:
+                    get_workbench().event_generate(msg["message_type"], **msg)
+                else:
+                    start_time = time.perf_counter()
+                    get_workbench().event_generate(msg["message_type"], **msg)
+                    channel_stats.record("ui_handlers", get_message_stats_key(msg), 0,
+                                         time.perf_counter() - start_time)
                 
                 # TODO: maybe distinguish between workbench cwd and backend cwd ??
                 get_workbench().set_option("run.working_directory", self.get_cwd())
@@ -381,7 +473,44 @@ class Runner:
                 self._send_postponed_commands()
                 
         finally:
-            get_workbench().after(50, self._poll_vm_messages)
+            if message_count > 0:
+                self._poll_interval = MIN_POLL_INTERVAL
+            elif self._wakeup_pipe is not None:
+                self._poll_interval = min(self._poll_interval * 2, MAX_POLL_INTERVAL_WITH_WAKEUP)
+            else:
+                self._poll_interval = min(self._poll_interval * 2, MAX_POLL_INTERVAL_WITHOUT_WAKEUP)
+                
+            self._poll_after_id = get_workbench().after(self._poll_interval, 
+                                                        self._poll_vm_messages)
+    
+    def _record_latency(self, msg):
+        latency = time.time() - msg["sent_time"]
+        stats = self._latency_stats.setdefault(msg["message_type"], 
+                                               {"count" : 0, "total" : 0.0, "max" : 0.0})
+        stats["count"] += 1
+        stats["total"] += latency
+        stats["max"] = max(stats["max"], latency)
+        
+        channel_stats = self.get_channel_stats()
+        if channel_stats is not None:
+            channel_stats.record("latency", get_message_stats_key(msg), 0, latency)
+        
+        logging.info("%s delivered in %.1f ms (average %.1f ms, max %.1f ms)",
+                     msg["message_type"], latency * 1000, 
+                     stats["total"] / stats["count"] * 1000, stats["max"] * 1000)
+    
+    def get_message_latency_stats(self):
+        """Returns dict of message latency statistics (in seconds) per message type.
+        Is populated only when run.measure_message_latency is enabled"""
+        return self._latency_stats
+    
+    def get_channel_stats(self):
+        """Returns frontend's ChannelStats or None if run.collect_channel_stats is disabled.
+        Backend's statistics can be requested with InlineCommand("get_channel_stats")"""
+        if get_workbench().get_option("run.collect_channel_stats"):
+            return self._channel_stats
+        else:
+            return None
     
     def reset_backend(self):
         self.kill_backend()
@@ -550,6 +679,8 @@ class CPythonProxy(BackendProxy):
             
         self._proc = None
         self._message_queue = None
+        self._message_protocol = TEXT_PROTOCOL
+        self._channel_stats = None
         self._sys_path = []
         self._gui_update_loop_id = None
         self.in_venv = None
@@ -561,6 +692,7 @@ class CPythonProxy(BackendProxy):
             return None
         
         msg = self._message_queue.popleft()
+        self._record_queue_wait(msg)
         if "gui_is_active" in msg:
             self._update_gui_updating(msg)
         
@@ -577,7 +709,10 @@ class CPythonProxy(BackendProxy):
                 else:
                     next_msg = self._message_queue.popleft()
                     if (next_msg["message_type"] == "ProgramOutput" 
-                        and next_msg["stream_name"] == msg["stream_name"]):
+                        and next_msg["stream_name"] == msg["stream_name"]
+                        and "elided_chars" not in msg
+                        and "elided_chars" not in next_msg):
+                        self._record_queue_wait(next_msg)
                         msg["data"] += next_msg["data"]
                     else:
                         # not same type of message, put it back
@@ -587,6 +722,13 @@ class CPythonProxy(BackendProxy):
         else: 
             return msg
     
+    def _record_queue_wait(self, msg):
+        if "_queued_time" in msg:
+            queued_time = msg.pop("_queued_time")
+            if self._channel_stats is not None:
+                self._channel_stats.record("queue_wait", get_message_stats_key(msg), 0,
+                                           time.perf_counter() - queued_time)
+    
     def get_description(self):
         # TODO: show backend version and interpreter path
         return "Python (current dir: {})".format(self.cwd)
@@ -597,8 +739,15 @@ class CPythonProxy(BackendProxy):
             self.kill_current_process()
             self._start_new_process(cmd)
              
-        self._proc.stdin.write(serialize_message(cmd) + "\n")
-        self._proc.stdin.flush()
+        if self._channel_stats is None:
+            write_message(self._proc.stdin, cmd, self._message_protocol)
+        else:
+            start_time = time.perf_counter()
+            data = encode_message(cmd, self._message_protocol)
+            self._channel_stats.record("frontend_serialize", get_message_stats_key(cmd), 
+                                       len(data), time.perf_counter() - start_time)
+            self._proc.stdin.write(data)
+            self._proc.stdin.flush()
         return True 
     
     def send_program_input(self, data):
@@ -647,6 +796,9 @@ class CPythonProxy(BackendProxy):
             self._proc.kill()
             
         self._proc = None
+        if self._message_queue is not None:
+            # release the listener if it's waiting for free space
+            self._message_queue.close()
         self._message_queue = None
     
     def _prepare_jedi(self):
@@ -662,8 +814,10 @@ class CPythonProxy(BackendProxy):
         # TODO: clean up old versions
     
     def _start_new_process(self, cmd=None):
-        # deque, because in one occasion I need to put messages back
-        self._message_queue = collections.deque()
+        self._message_queue = MessageQueue(get_workbench().get_option("run.max_queued_output"),
+                                           get_workbench().get_option("run.runaway_output_policy"))
+        # backend answers with text protocol until it announces its choice
+        self._message_protocol = TEXT_PROTOCOL
     
         # create new backend process
         my_env = {}
@@ -679,6 +833,16 @@ class CPythonProxy(BackendProxy):
         my_env["PYTHONIOENCODING"] = "ASCII" 
         my_env["PYTHONUNBUFFERED"] = "1" 
         my_env["THONNY_USER_DIR"] = THONNY_USER_DIR
+        my_env[MESSAGE_PROTOCOLS_ENV_VAR] = ",".join(SUPPORTED_PROTOCOLS)
+        my_env["THONNY_OUTPUT_FLUSH_INTERVAL"] = str(
+            get_workbench().get_option("run.output_flush_interval_ms") / 1000)
+        my_env["THONNY_OUTPUT_FLUSH_SIZE"] = str(get_workbench().get_option("run.output_flush_size"))
+        my_env["THONNY_OBJECT_REGISTRY_SIZE"] = str(get_workbench().get_option("run.object_registry_size"))
+        if get_workbench().get_option("run.measure_message_latency"):
+            my_env["THONNY_MESSAGE_TIMESTAMPS"] = "1"
+        self._channel_stats = get_runner().get_channel_stats()
+        if self._channel_stats is not None:
+            my_env["THONNY_CHANNEL_STATS"] = "1"
         
         # venv may not find (correct) Tk without assistance (eg. in Ubuntu)
         if self._executable == get_private_venv_executable():
@@ -728,51 +892,63 @@ class CPythonProxy(BackendProxy):
             stderr=subprocess.PIPE,
             cwd=self.cwd,
             env=my_env,
-            universal_newlines=True,
             creationflags=creationflags
         )
         
         if cmd:
             # Consume the ready message, cmd will get its own result message
-            ready_line = self._proc.stdout.readline()
-            if ready_line == "": # There was some problem
-                error_msg = self._proc.stderr.read()
+            ready_msg = read_message(self._proc.stdout, TEXT_PROTOCOL)
+            if ready_msg is None: # There was some problem
+                error_msg = self._proc.stderr.read().decode("UTF-8", errors="replace")
                 raise Exception("Error starting backend process: " + error_msg)
             
-            #ready_msg = parse_message(ready_line)
+            self._message_protocol = ready_msg.get("message_protocol", TEXT_PROTOCOL)
             #self._sys_path = ready_msg["path"]
             #debug("Backend ready: %s", ready_msg)
         
         
         
         # setup asynchronous output listeners
-        start_new_thread(self._listen_stdout, ())
-        start_new_thread(self._listen_stderr, ())
+        start_new_thread(self._listen_stdout, (self._proc.stdout, self._message_queue,
+                                               self._channel_stats))
+        start_new_thread(self._listen_stderr, (self._proc.stderr,))
     
-    def _listen_stdout(self):
+    def _listen_stdout(self, stdout, message_queue, channel_stats):
         #debug("... started listening to stdout")
         # will be called from separate thread
         while True:
-            data = self._proc.stdout.readline()
-            #debug("... read some stdout data", repr(data))
-            if data == '':
+            protocol = self._message_protocol
+            data = read_message_bytes(stdout, protocol)
+            if data is None:
                 break
             else:
-                msg = parse_message(data)
+                start_time = time.perf_counter()
+                msg = decode_message(data, protocol)
+                #debug("... read some stdout data", repr(msg))
+                if channel_stats is not None:
+                    channel_stats.record("frontend_parse", get_message_stats_key(msg), 
+                                         len(data), time.perf_counter() - start_time)
+                    msg["_queued_time"] = time.perf_counter()
+                
+                if "message_protocol" in msg:
+                    # ready message, next messages will use chosen protocol 
+                    self._message_protocol = msg["message_protocol"]
+                
                 if "cwd" in msg:
                     self.cwd = msg["cwd"]
                     
-                # TODO: it was "with self._state_lock:". Is it necessary?
-                self._message_queue.append(msg)
+                # may block when UI can't keep up with the output
+                message_queue.append(msg)
+                get_runner().request_wakeup()
 
-    def _listen_stderr(self):
+    def _listen_stderr(self, stderr):
         # stderr is used only for debugger debugging
         while True:
-            data = self._proc.stderr.readline()
-            if data == '':
+            data = stderr.readline()
+            if data == b'':
                 break
             else:
-                debug("### BACKEND ###: %s", data.strip())
+                debug("### BACKEND ###: %s", data.decode("UTF-8", errors="replace").strip())
         
 
 
@@ -985,6 +1161,122 @@ class CPythonProxy(BackendProxy):
         return ["run", "debug", "pip_gui", "system_shell"]
 
 
+class MessageQueue:
+    """Thread-safe queue between backend listener thread and UI thread.
+    
+    Amount of queued program output is limited. When the limit is reached,
+    then depending on the policy either the listener thread waits
+    until UI consumes some messages (this way backend gets blocked when
+    writing to its stdout) or older queued output gets replaced with 
+    a ProgramOutput message which has only attribute "elided_chars" 
+    telling how many characters were dropped.
+    
+    Supports same operations as collections.deque which are needed
+    by CPythonProxy (messages may be put back to the front).
+    """
+    def __init__(self, max_output_size, policy="block"):
+        assert policy in ("block", "keep_tail")
+        self._queue = collections.deque()
+        self._max_output_size = max_output_size
+        self._policy = policy
+        self._output_size = 0
+        self._closed = False
+        self._condition = threading.Condition()
+    
+    def append(self, msg):
+        """Is called from listener thread"""
+        with self._condition:
+            size = _get_output_size(msg)
+            if size > 0 and self._policy == "block":
+                while (self._output_size > 0 
+                       and self._output_size + size > self._max_output_size
+                       and not self._closed):
+                    self._condition.wait()
+            elif size > 0 and self._output_size + size > self._max_output_size:
+                self._drop_older_output(msg, size)
+                size = _get_output_size(msg)
+            
+            if not self._closed:
+                self._queue.append(msg)
+                self._output_size += size
+    
+    def appendleft(self, msg):
+        with self._condition:
+            self._queue.appendleft(msg)
+            self._output_size += _get_output_size(msg)
+    
+    def popleft(self):
+        with self._condition:
+            msg = self._queue.popleft()
+            self._output_size -= _get_output_size(msg)
+            self._condition.notify_all()
+            return msg
+    
+    def close(self):
+        with self._condition:
+            self._closed = True
+            self._queue.clear()
+            self._output_size = 0
+            self._condition.notify_all()
+    
+    def __len__(self):
+        return len(self._queue)
+    
+    def _drop_older_output(self, new_msg, new_size):
+        # Too long new message keeps only its tail
+        if new_size > self._max_output_size:
+            elided = new_size - self._max_output_size
+            new_msg["data"] = new_msg["data"][elided:]
+            new_size -= elided
+        else:
+            elided = 0
+        
+        # Other output messages get removed from the front,
+        # dropped parts are counted by elision markers in their place
+        kept = []
+        while self._queue and self._output_size + new_size > self._max_output_size:
+            msg = self._queue.popleft()
+            size = _get_output_size(msg)
+            if size > 0:
+                excess = self._output_size + new_size - self._max_output_size
+                dropped = min(size, excess)
+                self._add_elided_chars(kept, msg["stream_name"], dropped)
+                if size > excess:
+                    # it's enough to drop the beginning of this message
+                    msg["data"] = msg["data"][excess:]
+                    kept.append(msg)
+                    
+                self._output_size -= dropped
+            else:
+                kept.append(msg)
+        
+        self._queue.extendleft(reversed(kept))
+        
+        if elided:
+            # beginning of new message comes after all queued messages
+            self._add_elided_chars(self._queue, new_msg["stream_name"], elided)
+    
+    def _add_elided_chars(self, messages, stream_name, count):
+        """Counts dropped output at the end of messages, 
+        merging it with the marker there, if present"""
+        if not messages or "elided_chars" not in messages[-1]:
+            messages.append(self._create_elision_marker(stream_name))
+        messages[-1]["elided_chars"] += count
+    
+    def _create_elision_marker(self, stream_name):
+        return {"message_type" : "ProgramOutput", 
+                "stream_name" : stream_name, 
+                "data" : "",
+                "elided_chars" : 0}
+    
+
+def _get_output_size(msg):
+    if msg["message_type"] == "ProgramOutput":
+        return len(msg["data"])
+    else:
+        return 0
+
+
 def parse_configuration(configuration):
     """
     "Python (C:\Python34\python.exe)" becomes ("Python", "C:\Python34\python.exe")
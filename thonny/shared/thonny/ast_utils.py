@@ -2,6 +2,8 @@
 
 import ast
 import _ast
+import bisect
+import collections
 import io
 import sys
 import token
@@ -152,20 +154,33 @@ def mark_text_ranges(node, source):
     Node is an AST, source is corresponding source as string.
     Function adds recursively attributes end_lineno and end_col_offset to each node
     which has attributes lineno and col_offset.
+    
+    Column offsets are given in characters (not in UTF-8 bytes, as the parser gives them).
     """
+    if sys.version_info >= (3, 8):
+        _mark_text_ranges_from_parser_positions(node, source)
+    else:
+        _mark_text_ranges_from_tokens(node, source)
 
 
-    def _extract_tokens(tokens, lineno, col_offset, end_lineno, end_col_offset):
-        return list(filter((lambda tok: tok.start[0] >= lineno
-                                   and (tok.start[1] >= col_offset or tok.start[0] > lineno)
-                                   and tok.end[0] <= end_lineno
-                                   and (tok.end[1] <= end_col_offset or tok.end[0] < end_lineno)
-                                   and tok.string != ''),
-                           tokens))
+def _mark_text_ranges_from_tokens(node, source):
+    # Token list of each node is a continuous slice of its parent's token list
+    # (all stripping happens at the end), therefore token lists are represented 
+    # by spans [lo, hi] of a single list and nodes can find their tokens 
+    # by binary search. Bracket structure is indexed in advance, so that 
+    # stripping doesn't need to scan the tokens of the node.
 
+    def _extract_tokens(span, lineno, col_offset, end_lineno, end_col_offset):
+        lo = bisect.bisect_left(token_starts, (lineno, col_offset), span[0], span[1])
+        hi = bisect.bisect_right(token_ends, (end_lineno, end_col_offset), lo, span[1])
+        return [lo, hi]
 
+    def _get_last_token(span):
+        if span[1] <= span[0]:
+            raise IndexError("No tokens left")
+        return tokens[span[1]-1]
 
-    def _mark_text_ranges_rec(node, tokens, prelim_end_lineno, prelim_end_col_offset):
+    def _mark_text_ranges_rec(node, span, prelim_end_lineno, prelim_end_col_offset):
         """
         Returns the earliest starting position found in given tree,
         this is convenient for internal handling of the siblings
@@ -173,9 +188,9 @@ def mark_text_ranges(node, source):
 
         # set end markers to this node
         if "lineno" in node._attributes and "col_offset" in node._attributes:
-            tokens = _extract_tokens(tokens, node.lineno, node.col_offset, prelim_end_lineno, prelim_end_col_offset)
+            span = _extract_tokens(span, node.lineno, node.col_offset, prelim_end_lineno, prelim_end_col_offset)
             try:
-                tokens = _mark_end_and_return_child_tokens(node, tokens, prelim_end_lineno, prelim_end_col_offset)
+                _mark_end_and_strip_to_child_tokens(node, span)
             except:
                 traceback.print_exc() # TODO: log it somewhere
                 # fallback to incorrect marking instead of exception
@@ -188,7 +203,7 @@ def mark_text_ranges(node, source):
         children = list(_get_ordered_child_nodes(node))
         for child in reversed(children):
             (prelim_end_lineno, prelim_end_col_offset) = \
-                _mark_text_ranges_rec(child, tokens, prelim_end_lineno, prelim_end_col_offset)
+                _mark_text_ranges_rec(child, span, prelim_end_lineno, prelim_end_col_offset)
 
         if "lineno" in node._attributes and "col_offset" in node._attributes:
             # new "front" is beginning of this node
@@ -198,74 +213,59 @@ def mark_text_ranges(node, source):
         return (prelim_end_lineno, prelim_end_col_offset)
 
 
-    def _strip_trailing_junk_from_expressions(tokens):
-        while (tokens[-1].type not in (token.RBRACE, token.RPAR, token.RSQB,
-                                      token.NAME, token.NUMBER, token.STRING)
-                    and not (hasattr(token, "ELLIPSIS") and tokens[-1].type == token.ELLIPSIS)
-                    and tokens[-1].string not in ")}]"
-                    or tokens[-1].string in ['and', 'as', 'assert', 'class', 'def', 'del',
-                                              'elif', 'else', 'except', 'exec', 'finally',
-                                              'for', 'from', 'global', 'if', 'import', 'in',
-                                              'is', 'lambda', 'not', 'or', 'try',
-                                              'while', 'with', 'yield']):
-            del tokens[-1]
-
-    def _strip_trailing_extra_closers(tokens, remove_naked_comma):
-        level = 0
-        for i in range(len(tokens)):
-            if tokens[i].string in "({[":
-                level += 1
-            elif tokens[i].string in ")}]":
-                level -= 1
-
-            if level == 0 and tokens[i].string == "," and remove_naked_comma:
-                tokens[:] = tokens[0:i]
-                return
-
-            if level < 0:
-                tokens[:] = tokens[0:i]
-                return
-
-    def _strip_unclosed_brackets(tokens):
-        level = 0
-        for i in range(len(tokens)-1, -1, -1):
-            if tokens[i].string in "({[":
-                level -= 1
-            elif tokens[i].string in ")}]":
-                level += 1
-
-            if level < 0:
-                tokens[:] = tokens[0:i]
-                level = 0  # keep going, there may be more unclosed brackets
-
-    def _mark_end_and_return_child_tokens(node, tokens, prelim_end_lineno, prelim_end_col_offset):
-        """
-        # shortcut
-        node.end_lineno = prelim_end_lineno
-        node.end_col_offset = prelim_end_col_offset
-        return tokens
-        """
-        # prelim_end_lineno and prelim_end_col_offset are the start of
+    def _strip_trailing_junk_from_expressions(span):
+        while (_get_last_token(span).type not in (token.RBRACE, token.RPAR, token.RSQB,
+                                                  token.NAME, token.NUMBER, token.STRING)
+                    and not (hasattr(token, "ELLIPSIS") and _get_last_token(span).type == token.ELLIPSIS)
+                    and _get_last_token(span).string not in ")}]"
+                    or _get_last_token(span).string in ['and', 'as', 'assert', 'class', 'def', 'del',
+                                                        'elif', 'else', 'except', 'exec', 'finally',
+                                                        'for', 'from', 'global', 'if', 'import', 'in',
+                                                        'is', 'lambda', 'not', 'or', 'try',
+                                                        'while', 'with', 'yield']):
+            span[1] -= 1
+
+    def _strip_trailing_extra_closers(span, remove_naked_comma):
+        # cut at the first closer which goes below the level of the first token 
+        # or at the first comma on that level
+        lo, hi = span
+        if lo < hi:
+            span[1] = min(hi, group_ends[lo])
+            if remove_naked_comma:
+                span[1] = min(span[1], next_commas[lo])
+
+    def _strip_unclosed_brackets(span):
+        # Assumes that there are no extra closers. 
+        # Cuts before the outermost opener which is not closed inside the span. 
+        lo, hi = span
+        opener = enclosing_openers[hi]
+        while opener >= lo and levels[opener] > levels[lo]:
+            opener = enclosing_openers[opener]
+        
+        if opener >= lo:
+            span[1] = opener
+
+    def _mark_end_and_strip_to_child_tokens(node, span):
+        # End of given span is the start of
         # next positioned node or end of source, ie. the suffix of given
-        # range may contain keywords, commas and other stuff not belonging to current node
+        # span may contain keywords, commas and other stuff not belonging to current node
 
-        # Function returns the list of tokens which cover all its children
+        # Function leaves in the span the tokens which cover all its children
 
 
         if isinstance(node, _ast.stmt):
             # remove empty trailing lines
-            while (tokens[-1].type in (tokenize.NL, tokenize.COMMENT, token.NEWLINE, token.INDENT)
-                   or tokens[-1].string in (":", "else", "elif", "finally", "except")):
-                del tokens[-1]
+            while (_get_last_token(span).type in (tokenize.NL, tokenize.COMMENT, token.NEWLINE, token.INDENT)
+                   or _get_last_token(span).string in (":", "else", "elif", "finally", "except")):
+                span[1] -= 1
 
         else:
-            _strip_trailing_extra_closers(tokens, not (isinstance(node, ast.Tuple) or isinstance(node, ast.Lambda)))
-            _strip_trailing_junk_from_expressions(tokens)
-            _strip_unclosed_brackets(tokens)
+            _strip_trailing_extra_closers(span, not (isinstance(node, ast.Tuple) or isinstance(node, ast.Lambda)))
+            _strip_trailing_junk_from_expressions(span)
+            _strip_unclosed_brackets(span)
 
         # set the end markers of this node
-        node.end_lineno = tokens[-1].end[0]
-        node.end_col_offset = tokens[-1].end[1]
+        node.end_lineno, node.end_col_offset = _get_last_token(span).end
 
         # Peel off some trailing tokens which can't be part any
         # positioned child node.
@@ -274,33 +274,127 @@ def mark_text_ranges(node, source):
 
         # Remove trailing empty parens from no-arg call
         if (isinstance(node, ast.Call)
-            and _tokens_text(tokens[-2:]) == "()"):
-            del tokens[-2:]
+            and _span_text(span, 2) == "()"):
+            span[1] -= 2
 
         # Remove trailing full slice
         elif isinstance(node, ast.Subscript):
-            if  _tokens_text(tokens[-3:]) == "[:]":
-                del tokens[-3:]
+            if  _span_text(span, 3) == "[:]":
+                span[1] -= 3
 
-            elif _tokens_text(tokens[-4:]) == "[::]":
-                del tokens[-4:]
+            elif _span_text(span, 4) == "[::]":
+                span[1] -= 4
 
         # Attribute name would confuse the "value" of Attribute
         elif isinstance(node, ast.Attribute):
-            assert tokens[-1].type == token.NAME
-            del tokens[-1]
-            _strip_trailing_junk_from_expressions(tokens)
+            assert _get_last_token(span).type == token.NAME
+            span[1] -= 1
+            _strip_trailing_junk_from_expressions(span)
 
-        return tokens
+    def _span_text(span, max_token_count):
+        lo, hi = span
+        return _tokens_text(tokens[max(lo, hi-max_token_count):hi])
 
     all_tokens = list(tokenize.tokenize(io.BytesIO(source.encode('utf-8')).readline))
     source_lines = source.splitlines(True)
     fix_ast_problems(node, source_lines, all_tokens)
+    
+    tokens = [tok for tok in all_tokens if tok.string != '']
+    # positions of tokens are increasing, so both lists are sorted
+    token_starts = [tok.start for tok in tokens]
+    token_ends = [tok.end for tok in tokens]
+    levels, enclosing_openers, group_ends, next_commas = _index_brackets(tokens)
+    
     prelim_end_lineno = len(source_lines)
     prelim_end_col_offset = len(source_lines[len(source_lines)-1])
-    _mark_text_ranges_rec(node, all_tokens, prelim_end_lineno, prelim_end_col_offset)
+    _mark_text_ranges_rec(node, [0, len(tokens)], prelim_end_lineno, prelim_end_col_offset)
+
+
+def _index_brackets(tokens):
+    """
+    Returns 4 lists:
+     * levels[i] is the number of unclosed brackets before token i 
+     * enclosing_openers[i] is the index of the innermost unclosed opener before token i (or -1)
+     * group_ends[i] is the index of the closer which closes the brackets 
+       containing token i (or len(tokens))
+     * next_commas[i] is the index of next comma at same level inside the same brackets
+       (or len(tokens))
+    
+    levels and enclosing_openers have an extra item for the position after last token.
+    """
+    levels = []
+    enclosing_openers = []
+    stack = []
+    for i, tok in enumerate(tokens):
+        levels.append(len(stack))
+        enclosing_openers.append(stack[-1] if stack else -1)
+        if tok.string in "({[":
+            stack.append(i)
+        elif tok.string in ")}]" and stack:
+            stack.pop()
+    
+    levels.append(len(stack))
+    enclosing_openers.append(stack[-1] if stack else -1)
+    
+    group_ends = [len(tokens)] * len(tokens)
+    next_commas = [len(tokens)] * len(tokens)
+    last_closers = {} # level -> index of the closer
+    last_commas = {} # level -> index of the comma
+    for i in range(len(tokens)-1, -1, -1):
+        level = levels[i]
+        if tokens[i].string in ")}]":
+            # the tokens before it are in different brackets
+            last_closers[level] = i
+            last_commas[level] = len(tokens)
+        elif tokens[i].string == ",":
+            last_commas[level] = i
+        
+        group_ends[i] = last_closers.get(level, len(tokens))
+        next_commas[i] = last_commas.get(level, len(tokens))
+    
+    return levels, enclosing_openers, group_ends, next_commas
 
 
+def _mark_text_ranges_from_parser_positions(root, source):
+    # Since Python 3.8 parser gives end positions itself. 
+    # Their column offsets are in UTF-8 bytes and positions of nodes 
+    # inside f-strings are unreliable before Python 3.12.
+    
+    # parser breaks lines only at \n, \r\n and \r
+    utf8_byte_lines = [line.encode("UTF-8") 
+                       for line in io.StringIO(source, newline="").readlines()]
+    
+    def to_char_offset(lineno, byte_offset):
+        byte_line = utf8_byte_lines[lineno-1]
+        if len(byte_line) == len(byte_line.decode("UTF-8")):
+            # ASCII line
+            return byte_offset
+        else:
+            return len(byte_line[:byte_offset].decode("UTF-8", errors="replace"))
+    
+    def mark(node, joined_str):
+        if hasattr(node, "lineno"):
+            if joined_str is not None:
+                node.lineno = joined_str.lineno
+                node.col_offset = joined_str.col_offset
+                node.end_lineno = joined_str.end_lineno
+                node.end_col_offset = joined_str.end_col_offset
+            else:
+                if getattr(node, "end_lineno", None) is None:
+                    node.end_lineno = node.lineno
+                    node.end_col_offset = node.col_offset
+                node.col_offset = to_char_offset(node.lineno, node.col_offset)
+                node.end_col_offset = to_char_offset(node.end_lineno, node.end_col_offset)
+        
+        if (joined_str is None and isinstance(node, ast.JoinedStr) 
+            and sys.version_info < (3, 12)):
+            joined_str = node
+        
+        for child in ast.iter_child_nodes(node):
+            mark(child, joined_str)
+    
+    mark(root, None)
+
 
 def value_to_literal(value):
     if value is None:
@@ -326,7 +420,7 @@ def fix_ast_problems(tree, source_lines, tokens):
     # Problem 2:
     # triple-quoted strings have just plain wrong positions: http://bugs.python.org/issue18370
     # Fortunately lexer gives them correct positions
-    string_tokens = list(filter(lambda tok: tok.type == token.STRING, tokens))
+    string_tokens = collections.deque(filter(lambda tok: tok.type == token.STRING, tokens))
 
     # Problem 3:
     # Binary operations have wrong positions: http://bugs.python.org/issue18374
@@ -343,7 +437,7 @@ def fix_ast_problems(tree, source_lines, tokens):
         if isinstance(node, ast.Str):
             # fix triple-quote problem
             # get position from tokens
-            token = string_tokens.pop(0)
+            token = string_tokens.popleft()
             node.lineno, node.col_offset = token.start
 
         elif ((isinstance(node, ast.Expr) or isinstance(node, ast.Attribute))
@@ -13,22 +13,80 @@ import logging
 import pydoc
 import builtins
 import site
+import time
+import collections
+import itertools
+import weakref
+import gc
+import dis
+import marshal
+import hashlib
+import importlib.util
 
 import __main__  # @UnresolvedImport
 
 from thonny import ast_utils
 from thonny.common import TextRange,\
-    parse_message, serialize_message, DebuggerCommand,\
-    ToplevelCommand, FrameInfo, InlineCommand, InputSubmission
+    DebuggerCommand, ToplevelCommand, FrameInfo, InlineCommand, InputSubmission,\
+    TEXT_PROTOCOL, MESSAGE_PROTOCOLS_ENV_VAR, choose_message_protocol,\
+    read_message, write_message, read_message_bytes, decode_message,\
+    encode_message, ChannelStats, get_message_stats_key
 import signal
 import warnings
+import threading
 
 BEFORE_STATEMENT_MARKER = "_thonny_hidden_before_stmt"
 BEFORE_EXPRESSION_MARKER = "_thonny_hidden_before_expr"
 AFTER_STATEMENT_MARKER = "_thonny_hidden_after_stmt"
 AFTER_EXPRESSION_MARKER = "_thonny_hidden_after_expr"
+_MARKER_EVENTS = {
+    BEFORE_STATEMENT_MARKER : "before_statement",
+    AFTER_STATEMENT_MARKER : "after_statement",
+    BEFORE_EXPRESSION_MARKER : "before_expression",
+    AFTER_EXPRESSION_MARKER : "after_expression",
+}
+
+# Tags of instrumented nodes are kept as bits 
+NODE_TAGS = ("has_children", "last_child", "child_of_expression", "child_of_statement",
+             "last_call_arg", "call_function", "or_arg", "and_arg", 
+             "StringLiteral", "NumberLiteral", "ListComp.elt", "SetComp.elt",
+             "DictComp.key", "DictComp.value", "comprehension.if")
+_NODE_TAG_BITS = {tag : 1 << i for i, tag in enumerate(NODE_TAGS)}
+
+# Progress events the debugger passes without waiting for user's command.
+# Each policy is (event or None for any event, node tags which must all be present, action).
+# "skip" means running to next before_* event without reporting the state,
+# "show" means reporting the state but continuing with "step" right away.
+# First matching policy counts.
+AUTOMATIC_STEPPING_POLICIES = [
+    ("after_statement", (), "skip"),
+    (None, ("call_function",), "skip"),
+    # expression's value gets shown while it's parent statement gets finished
+    ("after_expression", ("last_child", "child_of_statement"), "show"),
+]
 
 EXCEPTION_TRACEBACK_LIMIT = 100
+
+# repr of these objects can't change while the object is alive
+_IMMUTABLE_TYPES = {int, float, complex, bool, str, bytes, type(None), range, 
+                    types.FunctionType, types.BuiltinFunctionType, types.ModuleType, type}
+_MAX_VARIABLES_SNAPSHOTS = 20
+# Max length of value reprs when command doesn't specify repr_budget
+DEFAULT_REPR_BUDGET = 10000
+# How many recently exported (not pinned) objects can be inspected by id
+DEFAULT_OBJECT_REGISTRY_SIZE = 10000
+# How many latest results shown in Shell are kept alive for inspection
+MAX_PINNED_SHELL_VALUES = 100
+
+FIGURE_CACHE_BYTES = 32 * 1024 * 1024
+# Figures bigger than this (in pixels) get a quick low-resolution preview first 
+FIGURE_PREVIEW_THRESHOLD = 400 * 400
+FIGURE_PREVIEW_PIXELS = 200 * 200
+# Instrumented code of recently debugged programs is kept in THONNY_USER_DIR
+INSTRUMENTED_CODE_CACHE_DIR_NAME = "instrumented_code_cache"
+INSTRUMENTED_CODE_CACHE_SIZE = 200 # files
+# Increase when instrumentation changes in a way not visible in the source of this module 
+TRACER_VERSION = 2
 DEBUG = True    
 
 logger = logging.getLogger()
@@ -37,12 +95,33 @@ info = logger.info
 class VM:
     def __init__(self):
         self._main_dir = os.path.dirname(sys.modules["thonny"].__file__)
-        self._heap = {} # WeakValueDictionary would be better, but can't store reference to None
+        self._object_registry = ObjectRegistry(int(os.environ.get("THONNY_OBJECT_REGISTRY_SIZE", 
+                                                                  DEFAULT_OBJECT_REGISTRY_SIZE)))
+        self._variables_snapshots = collections.OrderedDict()
+        self._variables_snapshot_counter = 0
+        self._shell_values = collections.deque(maxlen=MAX_PINNED_SHELL_VALUES)
+        self._repr_budget = DEFAULT_REPR_BUDGET
+        self._figure_cache = FigureRenderCache(FIGURE_CACHE_BYTES)
+        self._instrumented_code_cache = InstrumentedCodeCache(
+            os.path.join(os.path.expanduser(os.environ["THONNY_USER_DIR"]), 
+                         INSTRUMENTED_CODE_CACHE_DIR_NAME),
+            INSTRUMENTED_CODE_CACHE_SIZE)
         site.sethelper() # otherwise help function is not available
         pydoc.pager = pydoc.plainpager # otherwise help command plays tricks
         self._install_fake_streams()
         self._current_executor = None
         self._io_level = 0
+        # ready message is always sent with text protocol, 
+        # the protocol chosen here gets used after that
+        self._message_protocol = TEXT_PROTOCOL
+        chosen_protocol = choose_message_protocol(os.environ.get(MESSAGE_PROTOCOLS_ENV_VAR, 
+                                                                 TEXT_PROTOCOL))
+        self._init_output_buffer()
+        self._add_sent_time = os.environ.get("THONNY_MESSAGE_TIMESTAMPS") == "1"
+        if os.environ.get("THONNY_CHANNEL_STATS") == "1":
+            self._channel_stats = ChannelStats()
+        else:
+            self._channel_stats = None
         
         original_argv = sys.argv.copy()
         original_path = sys.path.copy()
@@ -86,7 +165,9 @@ class VM:
                           executable=sys.executable,
                           in_venv=hasattr(sys, 'base_prefix') and sys.base_prefix != sys.prefix,
                           python_version=_get_python_version_string(),
+                          message_protocol=chosen_protocol,
                           cwd=os.getcwd()))
+        self._message_protocol = chosen_protocol
         
         self._install_signal_handler()
         
@@ -116,16 +197,23 @@ class VM:
         except AttributeError:
             response = self.create_message(error_response_type, error="Unknown command: " + cmd.command)
         else:
+            # inline commands may arrive during debugging, which has its own budget
+            old_repr_budget = self._repr_budget
+            self._repr_budget = getattr(cmd, "repr_budget", DEFAULT_REPR_BUDGET)
             try:
                 response = handler(cmd)
             except:
                 response = self.create_message(error_response_type,
                     error="Thonny internal error: {0}".format(traceback.format_exc(EXCEPTION_TRACEBACK_LIMIT)))
+            finally:
+                self._repr_budget = old_repr_budget
         
         if response is not None:
             response["command_context"] = command_context
             response["command"] = cmd.command
             if response["message_type"] == "ToplevelResult":
+                # debugger views get closed
+                self.pin_values("Debugger", [])
                 response["gui_is_active"] = (
                     self._get_tkinter_default_root() is not None
                     or self._get_qt_app() is not None
@@ -201,23 +289,80 @@ class VM:
         if not cmd.module_name in sys.modules:
             raise ThonnyClientError("Module '{0}' is not loaded".format(cmd.module_name))
         
-        return self.create_message("Globals", module_name=cmd.module_name,
-                              globals=self.export_variables(sys.modules[cmd.module_name].__dict__))
+        variables = sys.modules[cmd.module_name].__dict__
+        self.pin_values("Variables", [variables[name] for name in variables
+                                      if not name.startswith("_thonny_hidden_")])
+        if hasattr(cmd, "known_version"):
+            return self.create_message("Globals", module_name=cmd.module_name,
+                                       **self.export_variables_patch(("globals", cmd.module_name),
+                                                                     variables, cmd.known_version,
+                                                                     "globals"))
+        else:
+            return self.create_message("Globals", module_name=cmd.module_name,
+                                       globals=self.export_variables(variables))
     
     def _cmd_get_locals(self, cmd):
         for frame in inspect.stack():
-            if id(frame) == cmd.frame_id:
-                return self.create_message("Locals", locals=self.export_variables(frame.f_locals))
+            if id(frame[0]) == cmd.frame_id:
+                return self.create_message("Locals", frame_id=cmd.frame_id,
+                                           locals=self.export_variables(frame[0].f_locals))
         else:
             raise ThonnyClientError("Frame '{0}' not found".format(cmd.frame_id))
             
     
     def _cmd_get_heap(self, cmd):
+        # measure before exporting touches the registry
+        heap_size = self._object_registry.get_size()
+        heap_bytes = self._object_registry.get_memory_usage()
+        
+        if hasattr(cmd, "offset"):
+            return self._get_heap_window(cmd, heap_size, heap_bytes)
+        
         result = {}
-        for key in self._heap:
-            result[key] = self.export_value(self._heap[key])
+        for key, value in self._object_registry.items():
+            # showing the heap shouldn't change the order of recent use
+            result[key] = self.export_value(value, register=False)
             
-        return self.create_message("Heap", heap=result)
+        return self.create_message("Heap", heap=result, 
+                                   heap_size=heap_size, heap_bytes=heap_bytes)
+    
+    def _get_heap_window(self, cmd, heap_size, heap_bytes):
+        """Exports only requested rows of the sorted and filtered heap"""
+        items = self._object_registry.items()
+        
+        type_filter = getattr(cmd, "type_filter", "").strip().lower()
+        if type_filter:
+            items = [item for item in items 
+                     if type_filter in type(item[1]).__name__.lower()]
+        
+        sort_key = getattr(cmd, "sort_key", "id")
+        if sort_key == "id":
+            items.sort(key=lambda item: item[0])
+        elif sort_key == "type":
+            items.sort(key=lambda item: (type(item[1]).__name__, item[0]))
+        elif sort_key == "recent":
+            items.reverse()
+        else:
+            raise ThonnyClientError("Unknown heap sort key: " + sort_key)
+        
+        # rows are already registered, showing them shouldn't change the order of recent use
+        rows = [self.export_value(value, register=False) 
+                for _, value in items[cmd.offset : cmd.offset + cmd.limit]]
+        
+        return self.create_message("Heap", rows=rows, offset=cmd.offset, 
+                                   total_count=len(items),
+                                   generation=getattr(cmd, "generation", None),
+                                   heap_size=heap_size, heap_bytes=heap_bytes)
+    
+    def _cmd_get_channel_stats(self, cmd):
+        if self._channel_stats is None:
+            stats = None
+        else:
+            stats = self._channel_stats.get_data()
+            if getattr(cmd, "reset", False):
+                self._channel_stats.clear()
+        
+        return self.create_message("ChannelStats", stats=stats)
     
     def _cmd_shell_autocomplete(self, cmd):
         error = None
@@ -291,8 +436,12 @@ class VM:
         
     
     def _cmd_get_object_info(self, cmd):
-        if cmd.object_id in self._heap:
-            value = self._heap[cmd.object_id]
+        if hasattr(cmd, "pin_owner"):
+            # inspected object should remain available while it's shown
+            self._object_registry.set_pinned(cmd.pin_owner, [cmd.object_id])
+        
+        if cmd.object_id in self._object_registry:
+            value = self._object_registry.get(cmd.object_id)
             attributes = {}
             if cmd.include_attributes:
                 for name in dir(value):
@@ -303,10 +452,16 @@ class VM:
                         except:
                             pass 
             
-            self._heap[id(type(value))] = type(value)
+            self._object_registry.add(type(value))
+            
+            if isinstance(value, str):
+                # string inspector needs whole string
+                value_repr = repr(value)
+            else:
+                value_repr = bounded_repr(value, max(self._repr_budget, DEFAULT_REPR_BUDGET))
             
             info = {'id' : cmd.object_id,
-                    'repr' : repr(value),
+                    'repr' : value_repr,
                     'type' : str(type(value)),
                     'type_id' : id(type(value)),
                     'attributes': self.export_variables(attributes)}
@@ -319,11 +474,11 @@ class VM:
             elif (isinstance(value, list) 
                   or isinstance(value, tuple)
                   or isinstance(value, set)):
-                self._add_elements_info(value, info)
+                self._add_elements_info(value, info, cmd)
             elif (isinstance(value, dict)):
-                self._add_entries_info(value, info)
+                self._add_entries_info(value, info, cmd)
             else:
-                self._try_add_dataframe_info(value, info)
+                self._try_add_dataframe_info(value, info, cmd)
                 self._try_add_matplotlib_info(value, info, cmd)
             
         else:
@@ -334,7 +489,26 @@ class VM:
                     "attributes" : {}}
         
         return self.create_message("ObjectInfo", id=cmd.object_id, info=info)
-    
+
+    def _cmd_get_object_page(self, cmd):
+        """Returns only the requested items of a container, which is already
+        shown in the inspector (repr, attributes etc. are not recomputed)"""
+        page = {'id' : cmd.object_id}
+
+        if cmd.object_id not in self._object_registry:
+            return self.create_message("ObjectPage", id=cmd.object_id, page=page,
+                                       not_found=True)
+
+        value = self._object_registry.get(cmd.object_id)
+        if isinstance(value, (list, tuple, set)):
+            self._add_elements_info(value, page, cmd)
+        elif isinstance(value, dict):
+            self._add_entries_info(value, page, cmd)
+        elif _is_dataframe(value):
+            self._add_dataframe_rows(value, page, cmd)
+
+        return self.create_message("ObjectPage", id=cmd.object_id, page=page)
+
     def _get_tkinter_default_root(self):
         # tkinter._default_root is not None,
         # when window has been created and mainloop isn't called or hasn't ended yet
@@ -385,66 +559,116 @@ class VM:
         except:
             pass
         
-    def _add_elements_info(self, value, info):
+    def _add_elements_info(self, value, info, cmd):
         info["elements"] = []
-        for element in value:
+        for element in self._get_requested_items(value, info, cmd):
             info["elements"].append(self.export_value(element))
         
-    def _add_entries_info(self, value, info):
+    def _add_entries_info(self, value, info, cmd):
         info["entries"] = []
-        for key in value:
+        for key in self._get_requested_items(value, info, cmd):
             info["entries"].append((self.export_value(key),
                                      self.export_value(value[key])))
     
-    def _try_add_dataframe_info(self, value, info):
+    def _get_requested_items(self, value, info, cmd):
+        """Returns the range of items requested with cmd.start and cmd.count
+        (all items by default)"""
+        start = getattr(cmd, "start", 0)
+        count = getattr(cmd, "count", None)
+        info["length"] = len(value)
+        info["start"] = start
+        info["generation"] = getattr(cmd, "generation", None)
+        
+        if count is None:
+            end = None
+        else:
+            end = start + count
+        
+        if isinstance(value, (list, tuple)):
+            return value[start:end]
+        else:
+            return itertools.islice(value, start, end)
+    
+    def _try_add_dataframe_info(self, value, info, cmd):
         try:
-            if (type(value).__name__ == "DataFrame"
-                and type(value).__module__ == "pandas.core.frame"):
-                info["columns"] = value.columns.tolist()
-                info["index"] = value.index.tolist()
-                info["values"] = value.values.tolist()
-                info["row_count"] = len(value)
+            if _is_dataframe(value):
+                info["columns"] = [_to_simple_cell(name) for name in value.columns.tolist()]
+                info["dtypes"] = [str(dtype) for dtype in value.dtypes]
                 info["is_DataFrame"] = True
+                info["column_stats"] = [_get_column_stats(value.iloc[:, i]) 
+                                        for i in range(len(value.columns))]
                 
                 import pandas as pd  # @UnresolvedImport
                 info["float_format"] = pd.options.display.float_format 
+                
+                self._add_dataframe_rows(value, info, cmd)
         except:
             logger.exception("Couldn't add DataFrame info")
     
+    def _add_dataframe_rows(self, value, info, cmd):
+        # only requested rows (all by default) are sent
+        start = getattr(cmd, "start", 0)
+        count = getattr(cmd, "count", None)
+        if count is None:
+            rows = value.iloc[start:]
+        else:
+            rows = value.iloc[start:start+count]
+        
+        info["index"] = [_to_simple_cell(x) for x in rows.index.tolist()]
+        info["values"] = [[_to_simple_cell(x) for x in row] 
+                          for row in rows.values.tolist()]
+        info["start"] = start
+        info["generation"] = getattr(cmd, "generation", None)
+        info["row_count"] = len(value)
+    
     def _try_add_matplotlib_info(self, value, info, cmd):
         try:
             if (type(value).__name__ == "Figure"
                 and type(value).__module__ == "matplotlib.figure"):
                 # TODO: test with ion/ioff
                 
+                fig_width = value.get_figwidth()
+                fig_height = value.get_figheight()
                 frame_width = getattr(cmd, "frame_width", None)
                 frame_height = getattr(cmd, "frame_height", None)
                 if frame_width is not None and frame_height is not None:
-                    frame_ratio = frame_width / frame_height
-                    fig_ratio = value.get_figwidth() / value.get_figheight()
-                    if frame_ratio > fig_ratio:
-                        # image size should depend on height
-                        dpi = frame_height / value.get_figheight()
-                    else:
-                        dpi = frame_width / value.get_figwidth()
+                    # fit into the frame, keeping the aspect ratio
+                    scale = min(frame_width / fig_width, frame_height / fig_height)
                 else:
-                    dpi = None
-                
+                    scale = value.dpi
                 
-                #import matplotlib.pyplot as plt
-                fp = io.BytesIO()
-                value.savefig(fp, format="png", dpi=dpi)
+                width = max(int(fig_width * scale), 1)
+                height = max(int(fig_height * scale), 1)
                 
-                import base64
-                info["image_data"] = base64.b64encode(fp.getvalue())
-                fp.close() 
+                if (width * height > FIGURE_PREVIEW_THRESHOLD
+                    and getattr(cmd, "allow_preview", True)
+                    and not self._figure_cache.has_png(value, width, height)):
+                    # full rendering may take a while, frontend shows the preview
+                    # and asks for full image with a separate request
+                    factor = (FIGURE_PREVIEW_PIXELS / (width * height)) ** 0.5
+                    self._add_image_data(info, self._figure_cache.get_png(value,
+                        max(int(width * factor), 1), max(int(height * factor), 1)))
+                    info["image_preview"] = True
+                else:
+                    self._add_image_data(info, self._figure_cache.get_png(value, width, height))
         except:
             logger.exception("Couldn't add Figure info")
     
+    def _add_image_data(self, info, data):
+        if self._message_protocol == TEXT_PROTOCOL:
+            # raw bytes would get inflated by repr and UTF-7
+            import base64
+            info["image_data"] = base64.b64encode(data).decode("ASCII")
+            info["image_encoding"] = "base64"
+        else:
+            info["image_data"] = data
+            info["image_encoding"] = "raw"
+    
     def _execute_file(self, cmd, debug_mode):
         # args are accepted only in Run and Debug,
         # and were stored in sys.argv already in VM.__init__
-        result_attributes = self._execute_source_ex(cmd.source, cmd.full_filename, "exec", debug_mode) 
+        result_attributes = self._execute_source_ex(cmd.source, cmd.full_filename, "exec", debug_mode,
+                                                    breakpoints=getattr(cmd, "breakpoints", None)) 
         return self.create_message("ToplevelResult", **result_attributes)
     
     def _execute_source(self, cmd, result_type):
@@ -487,9 +711,9 @@ class VM:
         return self.create_message(result_type, **result_attributes)
         
     def _execute_source_ex(self, source, filename, execution_mode, debug_mode,
-                        global_vars=None):
+                        global_vars=None, breakpoints=None):
         if debug_mode:
-            self._current_executor = FancyTracer(self)
+            self._current_executor = FancyTracer(self, breakpoints)
         else:
             self._current_executor = Executor(self)
         
@@ -519,11 +743,21 @@ class VM:
         sys.__stderr__ = sys.stderr
         
     def _fetch_command(self):
-        line = self._original_stdin.readline()
-        if line == "":
+        if self._channel_stats is None:
+            cmd = read_message(self._original_stdin.buffer, self._message_protocol)
+        else:
+            data = read_message_bytes(self._original_stdin.buffer, self._message_protocol)
+            if data is not None:
+                start_time = time.perf_counter()
+                cmd = decode_message(data, self._message_protocol)
+                self._channel_stats.record("backend_parse", get_message_stats_key(cmd), 
+                                           len(data), time.perf_counter() - start_time)
+            else:
+                cmd = None
+        
+        if cmd is None:
             logger.info("Read stdin EOF")
             sys.exit()
-        cmd = parse_message(line)
         return cmd
 
     def create_message(self, message_type, **kwargs):
@@ -534,25 +768,117 @@ class VM:
         return kwargs
 
     def send_message(self, msg):
-        self._original_stdout.write(serialize_message(msg) + "\n")
-        self._original_stdout.flush()
+        with self._output_lock:
+            # program output must reach the frontend before anything 
+            # what happened after it (InputRequest, ToplevelResult, DebuggerProgress ...)
+            self._flush_output()
+            self._write_message(msg)
+    
+    def _write_message(self, msg):
+        if self._add_sent_time:
+            msg["sent_time"] = time.time()
+        
+        if self._channel_stats is None:
+            write_message(self._original_stdout.buffer, msg, self._message_protocol)
+        else:
+            start_time = time.perf_counter()
+            data = encode_message(msg, self._message_protocol)
+            serialization_time = time.perf_counter() - start_time 
+            self._original_stdout.buffer.write(data)
+            self._original_stdout.buffer.flush()
+            key = get_message_stats_key(msg)
+            self._channel_stats.record("backend_serialize", key, len(data), serialization_time)
+            self._channel_stats.record("backend_write", key, len(data), 
+                                       time.perf_counter() - start_time - serialization_time)
+    
+    def _init_output_buffer(self):
+        """Program output is collected into a buffer, which is sent as few
+        ProgramOutput messages as possible. Buffer is flushed when it gets full,
+        when flush interval passes or when any other message is sent"""
+        # RLock, because send_message flushes while holding the lock
+        self._output_lock = threading.RLock()
+        # list of [stream_name, list_of_chunks] in the order of writes 
+        self._output_buffer = []
+        self._output_buffer_size = 0
+        self._output_flush_interval = float(os.environ.get("THONNY_OUTPUT_FLUSH_INTERVAL", 0.02))
+        self._output_flush_size = int(os.environ.get("THONNY_OUTPUT_FLUSH_SIZE", 65536))
+        # set when buffer gets its first chunk, so that flusher can sleep while there is no output
+        self._output_available = threading.Event()
+        
+        flusher = threading.Thread(target=self._flush_output_periodically, 
+                                   name="ThonnyOutputFlusher", daemon=True)
+        flusher.start()
+    
+    def _buffer_output(self, stream_name, data):
+        with self._output_lock:
+            if not self._output_buffer:
+                self._output_available.set()
+            
+            if self._output_buffer and self._output_buffer[-1][0] == stream_name:
+                self._output_buffer[-1][1].append(data)
+            else:
+                # keep the interleaving of stdout and stderr
+                self._output_buffer.append([stream_name, [data]])
+            
+            self._output_buffer_size += len(data)
+            if self._output_buffer_size >= self._output_flush_size:
+                self._flush_output()
+    
+    def _flush_output(self):
+        with self._output_lock:
+            buffer = self._output_buffer
+            self._output_buffer = []
+            self._output_buffer_size = 0
+            
+            for stream_name, chunks in buffer:
+                self._write_message(self.create_message("ProgramOutput", 
+                                                        stream_name=stream_name, 
+                                                        data="".join(chunks)))
+    
+    def _flush_output_periodically(self):
+        # runs in separate thread
+        while True:
+            self._output_available.wait()
+            # let more output accumulate
+            time.sleep(self._output_flush_interval)
+            try:
+                with self._output_lock:
+                    self._output_available.clear()
+                    if self._output_buffer:
+                        self._flush_output()
+            except:
+                logger.exception("Problem when flushing output")
         
-    def export_value(self, value, skip_None=False):
+    def export_value(self, value, skip_None=False, register=True):
+        """Exports value for the client. The value gets registered (as most recently 
+        used object) so that the client can later ask for it by id."""
         if value is None and skip_None:
             return None
         
-        self._heap[id(value)] = value
+        if register:
+            self._object_registry.add(value)
         try:
             type_name = value.__class__.__name__
         except:
             type_name = type(value).__name__ 
             
         result = {'id' : id(value),
-                  'repr' : repr(value), 
+                  'repr' : bounded_repr(value, self._repr_budget), 
                   'type_name'  : type_name}
         
         return result
     
+    def pin_values(self, owner, values):
+        """Keeps values available for inspection while owner (a view in the UI)
+        shows them. Replaces the values owner pinned earlier."""
+        self._object_registry.set_pinned_values(owner, values)
+    
+    def pin_shell_value(self, value):
+        """Shell keeps showing earlier results, 
+        so latest MAX_PINNED_SHELL_VALUES of them are pinned"""
+        self._shell_values.append(value)
+        self.pin_values("Shell", self._shell_values)
+    
     def export_variables(self, variables):
         result = {}
         for name in variables:
@@ -560,7 +886,68 @@ class VM:
                 result[name] = self.export_value(variables[name])
             
         return result
+    
+    def export_variables_patch(self, snapshot_key, variables, known_version, full_key):
+        """Compares variables to the snapshot stored under snapshot_key.
+        
+        If client knows the latest snapshot (known_version), then returns only 
+        changed (or added) and removed variables ({"changed" : ..., "removed" : ...}
+        under key "variables_patch"), otherwise returns all variables under full_key.
+        In both cases "version" tells the version of the new snapshot.
+        """
+        snapshot = self._variables_snapshots.pop(snapshot_key, None)
+        if snapshot is None or snapshot["version"] != known_version:
+            old_entries = {}
+        else:
+            old_entries = snapshot["entries"]
+        
+        entries, changed = self.export_variables_diff(variables, old_entries)
+        
+        self._variables_snapshot_counter += 1
+        self._variables_snapshots[snapshot_key] = {"version" : self._variables_snapshot_counter,
+                                                   "entries" : entries}
+        # snapshots of modules, which are not inspected anymore, are dropped eventually
+        while len(self._variables_snapshots) > _MAX_VARIABLES_SNAPSHOTS:
+            self._variables_snapshots.popitem(last=False)
+        
+        if snapshot is None or snapshot["version"] != known_version:
+            return {full_key : {name : entries[name][1] for name in entries},
+                    "version" : self._variables_snapshot_counter}
+        else:
+            removed = [name for name in old_entries if name not in entries]
+            return {"variables_patch" : {"changed" : changed, "removed" : removed},
+                    "base_version" : known_version,
+                    "version" : self._variables_snapshot_counter}
            
+    def export_variables_diff(self, variables, old_entries):
+        """Exports variables reusing the exports in old_entries (name -> (value, exported)).
+        
+        Returns new entries and the exports of changed (or added) variables.
+        Entries keep only immutable values (None in place of others), so that 
+        snapshots don't keep the objects of the program alive.
+        """
+        entries = {}
+        changed = {}
+        for name in variables:
+            if name.startswith("_thonny_hidden_"):
+                continue
+            
+            value = variables[name]
+            old_entry = old_entries.get(name)
+            if (old_entry is not None 
+                and value is not None # None in entry may stand for a mutable value
+                and old_entry[0] is value
+                and type(value) in _IMMUTABLE_TYPES):
+                # same immutable object, no need to compute repr
+                entries[name] = old_entry
+            else:
+                exported = self.export_value(value)
+                entries[name] = (value if type(value) in _IMMUTABLE_TYPES else None, exported)
+                if old_entry is None or old_entry[1] != exported:
+                    changed[name] = exported
+        
+        return entries, changed
+    
     def _debug(self, *args):
         print("VM:", *args, file=self._original_stderr)
     
@@ -597,7 +984,14 @@ class VM:
             try:
                 self._vm._enter_io_function()
                 if data != "":
-                    self._vm.send_message(self._vm.create_message("ProgramOutput", stream_name=self._stream_name, data=data))
+                    self._vm._buffer_output(self._stream_name, data)
+            finally:
+                self._vm._exit_io_function()
+        
+        def flush(self):
+            try:
+                self._vm._enter_io_function()
+                self._vm._flush_output()
             finally:
                 self._vm._exit_io_function()
         
@@ -649,12 +1043,15 @@ class Executor:
         
         try:
             bytecode = self._compile_source(source, filename, mode)
-            if hasattr(self, "_trace"):
-                sys.settrace(self._trace)    
+            trace_function = self._get_trace_function()
+            if trace_function is not None:
+                sys.settrace(trace_function)    
             if mode == "eval":
                 value = eval(bytecode, global_vars)
                 if value is not None:
                     builtins._ = value 
+                # builtins._ gets replaced by next result, but the value is still shown in Shell
+                self._vm.pin_shell_value(value)
                 return {"value_info" : self._vm.export_value(value)}
             else:
                 assert mode == "exec"
@@ -691,22 +1088,58 @@ class Executor:
 
     def _compile_source(self, source, filename, mode):
         return compile(source, filename, mode)
+    
+    def _get_trace_function(self):
+        return None
 
 
 class FancyTracer(Executor):
-    
-    def __init__(self, vm):
+    """
+    Normally program gets instrumented with marker function calls, 
+    which allow stepping by statements and expressions. 
+    
+    When breakpoints are given, the program starts in plain form and only line events
+    in files with breakpoints get examined. When a breakpoint gets hit, tracer switches
+    to detailed stepping. Running frames can't change their code, so these continue
+    in plain form and get stepped by lines, but all program functions get 
+    instrumented code for later calls. Resume command switches back to plain code.
+    """
+    
+    def __init__(self, vm, breakpoints=None):
         self._vm = vm
         self._normcase_thonny_src_dir = os.path.normcase(os.path.dirname(sys.modules["thonny"].__file__)) 
         self._instrumented_files = _PathSet()
         self._interesting_files = _PathSet() # only events happening in these files are reported
+        self._code_decisions = {} # id(code) -> (weakref to code, whether it's worth tracing)
+        self._breakpoints = {} # normcased filename -> set of line numbers
+        self._breakpoint_lines = {} # id(code) -> (weakref to code, breakpoint line numbers in the code)
+        self._running_to_breakpoint = False
+        self._program = None # (source, filename, mode)
+        self._program_codes = {} # is instrumented -> code of the program
+        self._instrumented_code_ids = set()
+        self._node_tables = {} # filename -> list of _InstrumentedNode-s indexed by node id
+        self._code_counterparts = None # id(code) -> code in other form
+        self._program_functions = weakref.WeakSet() # functions running code of the program (in either form)
+        self._rescanned_code_ids = set() # codes which caused looking up new functions since last swap
+        self._statement_ranges = None # lineno -> range of outermost statement starting there
+        self._set_breakpoints(breakpoints or {})
         self._current_command = None
         self._unhandled_exception = None
         self._install_marker_functions()
         self._custom_stack = []
+        self._automatic_stepping_policies = [
+            (event, sum(_NODE_TAG_BITS[tag] for tag in tags), action)
+            for (event, tags, action) in AUTOMATIC_STEPPING_POLICIES
+        ]
+        # id(code) -> (code, firstlineno) for codes whose source has been sent to the client
+        self._exported_codes = {}
     
     def execute_source(self, source, filename, mode, global_vars=None):
-        self._current_command = DebuggerCommand(command="step", state=None, focus=None, frame_id=None, exception=None)
+        if self._breakpoints:
+            self._running_to_breakpoint = True
+            self._current_command = DebuggerCommand(command="resume", state=None, focus=None, frame_id=None, exception=None)
+        else:
+            self._current_command = DebuggerCommand(command="step", state=None, focus=None, frame_id=None, exception=None)
         
         return Executor.execute_source(self, source, filename, mode, global_vars)
         #assert len(self._custom_stack) == 0
@@ -732,18 +1165,71 @@ class FancyTracer(Executor):
                 or not self._frame_is_alive(cmd.frame_id))
 
     def _compile_source(self, source, filename, mode):
+        self._program = (source, filename, mode)
+        self._instrumented_files.add(filename)
+        self._code_decisions.clear()
+        
+        return self._get_program_code(not self._running_to_breakpoint)
+    
+    def _get_program_code(self, instrumented):
+        if instrumented not in self._program_codes:
+            source, filename, mode = self._program
+            if instrumented:
+                code = self._instrument(source, filename, mode)
+                self._instrumented_code_ids = {id(c) for c in _get_code_tree(code)}
+            else:
+                code = compile(source, filename, mode)
+            self._program_codes[instrumented] = code
+        
+        return self._program_codes[instrumented]
+    
+    def _instrument(self, source, filename, mode):
+        code, node_table = self._vm._instrumented_code_cache.get_code(
+            source, filename, mode, self._create_instrumented_code, 
+            self._is_valid_instrumentation)
+        self._node_tables[filename] = [_InstrumentedNode(*entry) for entry in node_table]
+        return code
+    
+    def _create_instrumented_code(self, source, filename, mode):
+        """
+        Returns instrumented code together with the table of node properties. 
+        Marker calls refer to the nodes by their index in this table. 
+        """
         root = ast.parse(source, filename, mode)
         
         ast_utils.mark_text_ranges(root, source)
-        self._tag_nodes(root)        
-        self._insert_expression_markers(root)
-        self._insert_statement_markers(root)
-        self._instrumented_files.add(filename)
-        
-        return compile(root, filename, mode)
+        self._tag_nodes(root)
+        node_table = []
+        self._insert_expression_markers(root, node_table)
+        self._insert_statement_markers(root, node_table)
+        
+        return compile(root, filename, mode), node_table
+    
+    def _is_valid_instrumentation(self, result):
+        """Checks the form of a cached result of _create_instrumented_code"""
+        return (isinstance(result, tuple) and len(result) == 2
+                and isinstance(result[0], types.CodeType)
+                and isinstance(result[1], list)
+                and all(isinstance(entry, tuple) and len(entry) == 4 for entry in result[1]))
+    
+    def _get_trace_function(self):
+        if self._running_to_breakpoint:
+            return self._trace_to_breakpoint_call
+        else:
+            return self._trace
     
     def _may_step_in(self, code):
-            
+        # Decision about the code object doesn't change until the set of
+        # instrumented files changes, so it's computed only once per code object.
+        try:
+            may_step_in = self._code_decisions[id(code)][1]
+        except KeyError:
+            may_step_in = self._is_interesting_code(code)
+            _cache_code_info(self._code_decisions, code, may_step_in)
+        
+        return may_step_in and not self._vm.is_doing_io()
+    
+    def _is_interesting_code(self, code):
         return not (
             code is None 
             or code.co_filename is None
@@ -756,7 +1242,6 @@ class FancyTracer(Executor):
                 and code.co_name not in self.marker_function_names
             or os.path.normcase(code.co_filename).startswith(self._normcase_thonny_src_dir)
                 and code.co_name not in self.marker_function_names
-            or self._vm.is_doing_io() 
         )
         
     
@@ -775,28 +1260,28 @@ class FancyTracer(Executor):
             
             if code_name in self.marker_function_names:
                 # the main thing
-                if code_name == BEFORE_STATEMENT_MARKER:
-                    event = "before_statement"
-                elif code_name == AFTER_STATEMENT_MARKER:
-                    event = "after_statement"
-                elif code_name == BEFORE_EXPRESSION_MARKER:
-                    event = "before_expression"
-                elif code_name == AFTER_EXPRESSION_MARKER:
-                    event = "after_expression"
-                else:
-                    raise AssertionError("Unknown marker function")
+                event = _MARKER_EVENTS[code_name]
+                marker_function_args = frame.f_locals
+                node = self._node_tables[frame.f_back.f_code.co_filename][marker_function_args["node_id"]]
                 
-                marker_function_args = frame.f_locals.copy()
-                del marker_function_args["self"]
+                if event == "after_expression":
+                    value = marker_function_args["value"]
+                    args = dict(node.event_args, value=value)
+                else:
+                    value = None
+                    args = node.event_args
                 
-                self._handle_progress_event(frame.f_back, event, marker_function_args)
-                self._try_interpret_as_again_event(frame.f_back, event, marker_function_args)
+                self._handle_progress_event(frame.f_back, event, args, node.focus, node.tags)
+                self._try_interpret_as_again_event(frame.f_back, event, node, value)
                 
+                # line and return events of marker functions are not interesting
+                return None
                 
             else:
                 # Calls to proper functions.
                 # Client doesn't care about these events,
                 # it cares about "before_statement" events in the first statement of the body
+                self._check_function_code(frame.f_code)
                 self._custom_stack.append(CustomStackFrame(frame, "call"))
         
         elif event == "return":
@@ -811,35 +1296,252 @@ class FancyTracer(Executor):
                 pass
                 
         elif event == "exception":
-            exc = arg[1]
-            if self._unhandled_exception is None:
-                # this means it's the first time we see this exception
-                exc.causing_frame = frame
-            else:
-                # this means the exception is propagating to older frames
-                # get the causing_frame from previous occurrence
-                exc.causing_frame = self._unhandled_exception.causing_frame 
-            
-            self._unhandled_exception = exc
+            self._register_exception(frame, arg[1])
             if self._is_interesting_exception(frame):
                 self._report_state_and_fetch_next_message(frame)
 
         # TODO: support line event in non-instrumented files
         elif event == "line":
             self._unhandled_exception = None  
-                
-        return self._trace
+            if id(frame.f_code) not in self._instrumented_code_ids:
+                # frame started before breakpoint and runs plain code,
+                # so it can be stepped only by lines
+                self._handle_progress_event(frame, "before_statement", 
+                                            self._get_line_event_args(frame))
+        
+        if self._running_to_breakpoint:
+            # resume command was given
+            return self._trace_to_breakpoint
+        else:
+            return self._trace
+    
+    def _register_exception(self, frame, exc):
+        if self._unhandled_exception is None:
+            # this means it's the first time we see this exception
+            exc.causing_frame = frame
+        else:
+            # this means the exception is propagating to older frames
+            # get the causing_frame from previous occurrence
+            exc.causing_frame = self._unhandled_exception.causing_frame 
+        
+        self._unhandled_exception = exc
+    
+    def _trace_to_breakpoint_call(self, frame, event, arg):
+        """Global trace function used while running to breakpoint"""
+        code = frame.f_code
+        if not self._may_step_in(code) or code.co_name in self.marker_function_names:
+            return None
+        
+        self._check_function_code(code)
+        if (self._get_breakpoint_lines(code)
+            # outermost program frame notices exceptions leaving the program
+            or frame.f_back is None 
+            or not self._may_step_in(frame.f_back.f_code)):
+            return self._trace_to_breakpoint
+        else:
+            return None
+    
+    def _trace_to_breakpoint(self, frame, event, arg):
+        """Local trace function used while running to breakpoint"""
+        if event == "line":
+            self._unhandled_exception = None
+            if frame.f_lineno in self._get_breakpoint_lines(frame.f_code):
+                self._start_detailed_tracing(frame)
+                if id(frame.f_code) in self._instrumented_code_ids:
+                    # let the marker of this statement report the breakpoint
+                    self._current_command = DebuggerCommand(command="step", state=None, 
+                                                            focus=None, frame_id=None, 
+                                                            exception=None)
+                else:
+                    self._handle_progress_event(frame, "before_statement",
+                                                self._get_line_event_args(frame))
+        
+        elif event == "exception":
+            self._register_exception(frame, arg[1])
+        
+        elif (event == "return"
+              and self._unhandled_exception is not None
+              and (frame.f_back is None or not self._may_step_in(frame.f_back.f_code))):
+            # exception is leaving the program
+            self._start_detailed_tracing(frame)
+            self._custom_stack[-1].last_event = "before_statement"
+            self._custom_stack[-1].last_event_args = self._get_line_event_args(frame)
+            self._custom_stack[-1].last_event_focus = TextRange(*self._custom_stack[-1]
+                                                                .last_event_args["text_range"])
+            self._report_state_and_fetch_next_message(frame)
+            
+        if self._running_to_breakpoint:
+            return self._trace_to_breakpoint
+        else:
+            return self._trace
+    
+    def _start_detailed_tracing(self, frame):
+        self._running_to_breakpoint = False
+        self._swap_function_codes(True, frame)
+        
+        program_frames = []
+        while frame is not None:
+            if (self._may_step_in(frame.f_code) 
+                and frame.f_code.co_name not in self.marker_function_names):
+                program_frames.insert(0, frame)
+            frame = frame.f_back
         
+        self._custom_stack = []
+        for program_frame in program_frames:
+            custom_frame = CustomStackFrame(program_frame, "before_statement")
+            custom_frame.last_event_args = self._get_line_event_args(program_frame)
+            custom_frame.last_event_focus = TextRange(*custom_frame.last_event_args["text_range"])
+            self._custom_stack.append(custom_frame)
+            program_frame.f_trace = self._trace
+        
+        sys.settrace(self._trace)
+    
+    def _start_running_to_breakpoint(self):
+        self._running_to_breakpoint = True
+        if self._custom_stack:
+            self._swap_function_codes(False, self._custom_stack[-1].system_frame)
+        else:
+            self._swap_function_codes(False, None)
+        
+        for custom_frame in self._custom_stack:
+            custom_frame.system_frame.f_trace = self._trace_to_breakpoint
+        
+        self._custom_stack = []
+        sys.settrace(self._trace_to_breakpoint_call)
+    
+    def _swap_function_codes(self, instrumented, frame):
+        """Makes known functions of the program use instrumented or plain code.
+        frame is the current frame."""
+        if self._code_counterparts is None:
+            self._code_counterparts = {}
+            instrumented_codes = collections.defaultdict(list)
+            for code in _get_code_tree(self._get_program_code(True)):
+                instrumented_codes[(code.co_name, code.co_firstlineno)].append(code)
+            
+            plain_codes = collections.defaultdict(list)
+            for code in _get_code_tree(self._get_program_code(False)):
+                plain_codes[(code.co_name, code.co_firstlineno)].append(code)
             
-    def _handle_progress_event(self, frame, event, args):
+            for key in plain_codes:
+                # equal plain code objects may have been merged by the compiler
+                if len(plain_codes[key]) == len(instrumented_codes[key]):
+                    for plain_code, instrumented_code in zip(plain_codes[key], 
+                                                             instrumented_codes[key]):
+                        self._code_counterparts[id(plain_code)] = instrumented_code
+                        self._code_counterparts[id(instrumented_code)] = plain_code
+            
+            self._find_program_functions()
+        else:
+            self._find_namespace_functions(frame)
+        
+        self._rescanned_code_ids.clear()
+        self._set_function_codes(instrumented)
+    
+    def _set_function_codes(self, instrumented):
+        for function in list(self._program_functions):
+            if (id(function.__code__) in self._instrumented_code_ids) != instrumented:
+                function.__code__ = self._code_counterparts[id(function.__code__)]
+    
+    def _find_program_functions(self):
+        """Remembers the functions using the code of the program. Scans whole heap,
+        therefore it's done only at first swap and when a call reveals an unknown function."""
+        codes = [code 
+                 for instrumented in [True, False]
+                 for code in _get_code_tree(self._get_program_code(instrumented))
+                 if id(code) in self._code_counterparts]
+        
+        for obj in gc.get_referrers(*codes):
+            if isinstance(obj, types.FunctionType):
+                self._program_functions.add(obj)
+    
+    def _find_namespace_functions(self, frame):
+        """Remembers the functions of the program found in global and local variables
+        (or in classes there) of the program frames on the stack. This is a cheap 
+        way to find most of the functions created since the heap was scanned."""
+        namespaces = {}
+        while frame is not None:
+            if self._may_step_in(frame.f_code):
+                namespaces[id(frame.f_globals)] = frame.f_globals
+                namespaces[id(frame.f_locals)] = frame.f_locals
+            frame = frame.f_back
+        
+        def add_if_program_function(value):
+            if type(value) in (staticmethod, classmethod):
+                value = value.__func__
+            if (isinstance(value, types.FunctionType) 
+                and id(value.__code__) in self._code_counterparts):
+                self._program_functions.add(value)
+        
+        for namespace in namespaces.values():
+            for value in list(namespace.values()):
+                if isinstance(value, type):
+                    for attribute in list(vars(value).values()):
+                        add_if_program_function(attribute)
+                else:
+                    add_if_program_function(value)
+    
+    def _check_function_code(self, code):
+        """Called when a frame of the program starts. If it runs the other form of code,
+        then it was created from a running frame after last swap and there may be 
+        more functions like this."""
+        if (self._code_counterparts is not None
+            and id(code) in self._code_counterparts
+            and (id(code) in self._instrumented_code_ids) == self._running_to_breakpoint
+            and id(code) not in self._rescanned_code_ids):
+            # look only once per code, as functions may be created eg. in a loop
+            self._rescanned_code_ids.add(id(code))
+            self._find_program_functions()
+            self._set_function_codes(not self._running_to_breakpoint)
+    
+    def _set_breakpoints(self, breakpoints):
+        self._breakpoints = {os.path.normcase(os.path.normpath(filename)) : set(lines)
+                             for filename, lines in breakpoints.items()
+                             if lines}
+        self._breakpoint_lines.clear()
+    
+    def _get_breakpoint_lines(self, code):
+        try:
+            return self._breakpoint_lines[id(code)][1]
+        except KeyError:
+            filename = os.path.normcase(os.path.normpath(code.co_filename))
+            lines = (self._breakpoints.get(filename, set()) 
+                     & {lineno for _, lineno in dis.findlinestarts(code)})
+            _cache_code_info(self._breakpoint_lines, code, lines)
+            return lines
+    
+    def _get_line_event_args(self, frame):
+        if self._statement_ranges is None:
+            self._statement_ranges = {}
+            source, filename, mode = self._program
+            root = ast.parse(source, filename, mode)
+            ast_utils.mark_text_ranges(root, source)
+            # ast.walk visits outer statements first
+            for node in ast.walk(root):
+                if isinstance(node, _ast.stmt):
+                    self._statement_ranges.setdefault(node.lineno, 
+                        (node.lineno, node.col_offset, node.end_lineno, node.end_col_offset))
+        
+        lineno = frame.f_lineno
+        return {"text_range" : self._statement_ranges.get(lineno, (lineno, 0, lineno, 0)),
+                "node_tags" : ""}
+        
+            
+    def _handle_progress_event(self, frame, event, args, focus=None, tags=0):
         """
         Tries to respond to current command in this state. 
         If it can't, then it returns, program resumes
         and _trace will call it again in another state.
-        Otherwise sends response and fetches next command.  
+        Otherwise sends response and fetches next command
+        (unless an automatic stepping policy says otherwise).
+        tags are the bits of node tags (see _NODE_TAG_BITS).
         """
+        if self._running_to_breakpoint:
+            # only breakpoints matter now
+            return
+        
         self._debug("Progress event:", event, self._current_command)
-        focus = TextRange(*args["text_range"])
+        if focus is None:
+            focus = TextRange(*args["text_range"])
         
         self._custom_stack[-1].last_event = event
         self._custom_stack[-1].last_event_focus = focus
@@ -850,13 +1552,47 @@ class FancyTracer(Executor):
              
         # If method decides we're in the right place to respond to the command ...
         if tester(frame, event, args, focus, self._current_command):
+            action = self._get_automatic_stepping_action(event, tags)
+            if action == "skip":
+                self._current_command = self._create_automatic_command("run_to_before", 
+                                                                       frame, event, focus)
+                return
+            
             if event == "after_expression":
                 value = self._vm.export_value(args["value"])
             else:
                 value = None
-            self._report_state_and_fetch_next_message(frame, value)
+            
+            self._pin_shown_values(event, args)
+            
+            if action == "show":
+                next_command = self._create_automatic_command("step", frame, event, focus)
+            else:
+                next_command = None
+            
+            self._report_state_and_fetch_next_message(frame, value, next_command)
+    
+    def _get_automatic_stepping_action(self, event, tags):
+        if self._unhandled_exception is not None:
+            # user needs to see it
+            return None
+        
+        for policy_event, policy_tags, action in self._automatic_stepping_policies:
+            if ((policy_event is None or policy_event == event)
+                and tags & policy_tags == policy_tags):
+                return action
+        
+        return None
+    
+    def _create_automatic_command(self, command, frame, event, focus):
+        return DebuggerCommand(command, frame_id=id(frame), state=event, focus=focus,
+                               repr_budget=self._vm._repr_budget)
     
-    def _report_state_and_fetch_next_message(self, frame, value=None):
+    def _report_state_and_fetch_next_message(self, frame, value=None, next_command=None):
+            """
+            When next_command is given, then client is not expected to answer
+            and tracer continues with this command.
+            """
             #self._debug("Completed command: ", self._current_command)
             
             if self._unhandled_exception is not None:
@@ -887,20 +1623,30 @@ class FancyTracer(Executor):
                 exception_msg=exception_msg,
                 exception_lower_stack_description=exception_lower_stack_description,
                 value=value,
-                command_context="waiting_debugger_command"
+                command_context="waiting_debugger_command" if next_command is None else "running"
             ))
             
+            if next_command is not None:
+                self._current_command = next_command
+                return
+            
             # Fetch next debugger command
             self._current_command = self._vm._fetch_command()
             self._debug("got command:", self._current_command)
             # get non-progress commands out our way
             self._respond_to_inline_commands()  
             assert isinstance(self._current_command, DebuggerCommand)
+            self._vm._repr_budget = getattr(self._current_command, "repr_budget", 
+                                            DEFAULT_REPR_BUDGET)
+            
+            if self._current_command.command == "resume":
+                self._set_breakpoints(getattr(self._current_command, "breakpoints", {}))
+                self._start_running_to_breakpoint()
             
         # Return and let Python run to next progress event
         
     
-    def _try_interpret_as_again_event(self, frame, original_event, original_args):
+    def _try_interpret_as_again_event(self, frame, original_event, node, value):
         """
         Some after_* events can be interpreted also as 
         "before_*_again" events (eg. when last argument of a call was 
@@ -908,23 +1654,21 @@ class FancyTracer(Executor):
         """
 
         if original_event == "after_expression":
-            node_tags = original_args.get("node_tags")
-            value = original_args.get("value")
+            tags = node.tags
             
-            if (node_tags is not None 
-                and ("last_child" in node_tags
-                     or "or_arg" in node_tags and value
-                     or "and_arg" in node_tags and not value)):
+            if (tags & _NODE_TAG_BITS["last_child"]
+                or tags & _NODE_TAG_BITS["or_arg"] and value
+                or tags & _NODE_TAG_BITS["and_arg"] and not value):
                 
                 # next step will be finalizing evaluation of parent of current expr
                 # so let's say we're before that parent expression
-                again_args = {"text_range" : original_args.get("parent_range"),
+                again_args = {"text_range" : node.event_args["parent_range"],
                               "node_tags" : ""}
                 again_event = ("before_expression_again" 
-                               if "child_of_expression" in node_tags
+                               if tags & _NODE_TAG_BITS["child_of_expression"]
                                else "before_statement_again")
                 
-                self._handle_progress_event(frame, again_event, again_args)
+                self._handle_progress_event(frame, again_event, again_args, node.parent_focus)
                 
     
     def _respond_to_inline_commands(self):
@@ -1016,6 +1760,10 @@ class FancyTracer(Executor):
     def _cmd_step_completed(self, frame, event, args, focus, cmd):
         return True
     
+    def _cmd_resume_completed(self, frame, event, args, focus, cmd):
+        # while running to breakpoint, only breakpoints produce progress events
+        return True
+    
     def _cmd_run_to_before_completed(self, frame, event, args, focus, cmd):
         return event.startswith("before")
     
@@ -1036,6 +1784,20 @@ class FancyTracer(Executor):
             and (focus != cmd.focus or id(frame) != cmd.frame_id))
 
     
+    def _pin_shown_values(self, event, args):
+        """Keeps the values shown in expression boxes and the exception
+        available for inspection until the debugger views get updated"""
+        custom_frame = self._custom_stack[-1]
+        if event == "after_expression":
+            custom_frame.shown_values.append(args["value"])
+        elif event in ("before_statement", "after_statement"):
+            custom_frame.shown_values = []
+        
+        values = [value for frame in self._custom_stack for value in frame.shown_values]
+        if self._unhandled_exception is not None:
+            values.append(self._unhandled_exception)
+        self._vm.pin_values("Debugger", values)
+    
     def _frame_is_alive(self, frame_id):
         for frame in self._custom_stack:
             if frame.id == frame_id:
@@ -1044,63 +1806,99 @@ class FancyTracer(Executor):
             return False 
     
     def _export_stack(self):
+        """
+        Frames are exported incrementally. A frame appearing for the first time
+        gets all its attributes, later only the attributes which have changed
+        since previous export. Frames without changes are exported with id only.
+        Source of a code object is sent only with the first frame running it
+        (client finds it by code_id later). Topmost frame always gets its event info.
+        """
         result = []
         
         for custom_frame in self._custom_stack:
+            system_frame = custom_frame.system_frame
+            frame_info = FrameInfo(id=id(system_frame))
             
-            last_event_args = custom_frame.last_event_args.copy()
-            if "value" in last_event_args:
-                last_event_args["value"] = self._vm.export_value(last_event_args["value"]) 
+            if custom_frame.exported_locals is None:
+                # new frame
+                code = system_frame.f_code
+                frame_info.update(
+                    filename=code.co_filename,
+                    module_name=system_frame.f_globals["__name__"],
+                    code_name=code.co_name,
+                    code_id=id(code),
+                )
+                
+                if id(code) in self._exported_codes:
+                    frame_info.firstlineno = self._exported_codes[id(code)][1]
+                else:
+                    frame_info.source, frame_info.firstlineno = \
+                        self._get_frame_source_info(system_frame)
+                    # keep the code alive so that its id can't get reused
+                    self._exported_codes[id(code)] = (code, frame_info.firstlineno)
+                
+                old_entries = {}
+            else:
+                old_entries = custom_frame.exported_locals
             
-            system_frame = custom_frame.system_frame
-            source, firstlineno = self._get_frame_source_info(system_frame)
+            entries, changed = self._vm.export_variables_diff(system_frame.f_locals, old_entries)
+            if (custom_frame.exported_locals is None 
+                or changed or len(entries) != len(old_entries)):
+                frame_info.locals = {name : entries[name][1] for name in entries}
+            custom_frame.exported_locals = entries
             
-            result.append(FrameInfo(
-                id=id(system_frame),
-                filename=system_frame.f_code.co_filename,
-                module_name=system_frame.f_globals["__name__"],
-                code_name=system_frame.f_code.co_name,
-                locals=self._vm.export_variables(system_frame.f_locals),
-                source=source,
-                firstlineno=firstlineno,
-                last_event=custom_frame.last_event,
-                last_event_args=last_event_args,
-                last_event_focus=custom_frame.last_event_focus,
-            ))
+            event_info = (custom_frame.last_event, 
+                          custom_frame.last_event_focus,
+                          custom_frame.last_event_args)
+            if (custom_frame is self._custom_stack[-1]
+                or custom_frame.exported_event_info is None
+                or any(a is not b for (a, b) in zip(event_info, custom_frame.exported_event_info))):
+                last_event_args = custom_frame.last_event_args.copy()
+                if "value" in last_event_args:
+                    last_event_args["value"] = self._vm.export_value(last_event_args["value"]) 
+                
+                frame_info.update(
+                    last_event=custom_frame.last_event,
+                    last_event_args=last_event_args,
+                    last_event_focus=custom_frame.last_event_focus,
+                )
+            custom_frame.exported_event_info = event_info
+            
+            result.append(frame_info)
         
         return result
 
-    def _thonny_hidden_before_stmt(self, text_range, node_tags):
+    def _thonny_hidden_before_stmt(self, node_id):
         """
         The code to be debugged will be instrumented with this function
         inserted before each statement. 
         Entry into this function indicates that statement as given
-        by the code range is about to be evaluated next.
+        by the node id is about to be evaluated next.
         """
         return None
     
-    def _thonny_hidden_after_stmt(self, text_range, node_tags):
+    def _thonny_hidden_after_stmt(self, node_id):
         """
         The code to be debugged will be instrumented with this function
         inserted after each statement. 
         Entry into this function indicates that statement as given
-        by the code range was just executed successfully.
+        by the node id was just executed successfully.
         """
         return None
     
-    def _thonny_hidden_before_expr(self, text_range, node_tags):
+    def _thonny_hidden_before_expr(self, node_id):
         """
         Entry into this function indicates that expression as given
-        by the code range is about to be evaluated next
+        by the node id is about to be evaluated next
         """ 
-        return text_range
+        return node_id
     
-    def _thonny_hidden_after_expr(self, text_range, node_tags, value, parent_range):
+    def _thonny_hidden_after_expr(self, node_id, value):
         """
         The code to be debugged will be instrumented with this function
         wrapped around each expression (given as 2nd argument). 
         Entry into this function indicates that expression as given
-        by the code range was just evaluated to given value
+        by the node id was just evaluated to given value
         """ 
         return value
     
@@ -1196,11 +1994,11 @@ class FancyTracer(Executor):
                 and (not isinstance(node, _ast.ImportFrom)
                      or node.module != "__future__"))
     
-    def _insert_statement_markers(self, root):
+    def _insert_statement_markers(self, root, node_table):
         # find lists of statements and insert before/after markers for each statement
         for name, value in ast.iter_fields(root):
             if isinstance(value, ast.AST):
-                self._insert_statement_markers(value)
+                self._insert_statement_markers(value, node_table)
             elif isinstance(value, list):
                 if len(value) > 0:
                     new_list = []
@@ -1209,39 +2007,38 @@ class FancyTracer(Executor):
                             # self._debug("EBFOMA", node)
                             # add before marker
                             new_list.append(self._create_statement_marker(node, 
-                                                                          BEFORE_STATEMENT_MARKER))
+                                                                          BEFORE_STATEMENT_MARKER,
+                                                                          node_table))
                         
                         # original statement
                         if self._should_instrument_as_statement(node):
-                            self._insert_statement_markers(node)
+                            self._insert_statement_markers(node, node_table)
                         new_list.append(node)
                         
                         if isinstance(node, _ast.stmt):
                             # add after marker
                             new_list.append(self._create_statement_marker(node,
-                                                                          AFTER_STATEMENT_MARKER))
+                                                                          AFTER_STATEMENT_MARKER,
+                                                                          node_table))
                     setattr(root, name, new_list)
     
     
-    def _create_statement_marker(self, node, function_name):
-        call = self._create_simple_marker_call(node, function_name)
+    def _create_statement_marker(self, node, function_name, node_table):
+        call = self._create_simple_marker_call(node, function_name, node_table)
         stmt = ast.Expr(value=call)
         ast.copy_location(stmt, node)
-        ast.fix_missing_locations(stmt)
         return stmt
         
     
-    def _insert_expression_markers(self, node):
+    def _insert_expression_markers(self, node, node_table):
         """
         each expression e gets wrapped like this:
-            _after(_before(_loc, _node_is_zoomable), e, _node_role, _parent_range)
+            _after(_before(_node_id), e)
         where
             _after is function that gives the resulting value
             _before is function that signals the beginning of evaluation of e
-            _loc gives the code range of e
-            _node_is_zoomable indicates whether this node has subexpressions
-            _node_role is either 'last_call_arg', 'last_op_arg', 'first_or_arg', 
-                                 'first_and_arg', 'function' or None
+            _node_id is the index of e's properties (code range, tags, 
+                     code range of parent) in node_table
         """
         tracer = self
         
@@ -1253,22 +2050,23 @@ class FancyTracer(Executor):
                         return ast.NodeTransformer.generic_visit(self, node)
                     elif tracer._should_instrument_as_expression(node):
                         # before marker 
-                        before_marker = tracer._create_simple_marker_call(node, BEFORE_EXPRESSION_MARKER)
-                        ast.copy_location(before_marker, node)
+                        before_marker = tracer._create_simple_marker_call(node, 
+                                                                          BEFORE_EXPRESSION_MARKER,
+                                                                          node_table)
                         
                         # after marker
                         after_marker = ast.Call (
                             func=ast.Name(id=AFTER_EXPRESSION_MARKER, ctx=ast.Load()),
                             args=[
                                 before_marker,
-                                tracer._create_tags_literal(node),
                                 ast.NodeTransformer.generic_visit(self, node),
-                                tracer._create_location_literal(node.parent_node if hasattr(node, "parent_node") else None)
                             ],
                             keywords=[]
                         )
+                        # Children already have their locations, so no need 
+                        # for ast.fix_missing_locations (which would walk the whole subtree)
                         ast.copy_location(after_marker, node)
-                        ast.fix_missing_locations(after_marker)
+                        ast.copy_location(after_marker.func, node)
                         
                         return after_marker
                     else:
@@ -1281,44 +2079,58 @@ class FancyTracer(Executor):
         return ExpressionVisitor().visit(node)   
             
     
-    def _create_location_literal(self, node):
-        if node is None:
-            return ast_utils.value_to_literal(None)
+    def _get_node_id(self, node, node_table):
+        """Registers node's properties in the node table (if not done already)"""
+        if not hasattr(node, "node_id"):
+            node.node_id = len(node_table)
+            parent_node = getattr(node, "parent_node", None)
+            node_table.append((self._get_text_range_tuple(node),
+                               self._get_tag_bits(node),
+                               ",".join(getattr(node, "tags", ())),
+                               None if parent_node is None else self._get_text_range_tuple(parent_node)))
         
+        return node.node_id
+    
+    def _get_text_range_tuple(self, node):
         assert hasattr(node, "end_lineno")
         assert hasattr(node, "end_col_offset")
-        
-        nums = []
-        for value in node.lineno, node.col_offset, node.end_lineno, node.end_col_offset:
-            nums.append(ast.Num(n=value))
-        return ast.Tuple(elts=nums, ctx=ast.Load())
+        return (node.lineno, node.col_offset, node.end_lineno, node.end_col_offset)
     
-    def _create_tags_literal(self, node):
-        if hasattr(node, "tags"):
-            # maybe set would perform as well, but I think string is faster
-            return ast_utils.value_to_literal(",".join(node.tags))
-            #self._debug("YESTAGS")
-        else:
-            #self._debug("NOTAGS " + str(node))
-            return ast_utils.value_to_literal("")
+    def _get_tag_bits(self, node):
+        bits = 0
+        for tag in getattr(node, "tags", ()):
+            bits |= _NODE_TAG_BITS.get(tag, 0)
+        return bits
     
-    def _create_simple_marker_call(self, node, fun_name):
-        assert hasattr(node, "end_lineno")
-        assert hasattr(node, "end_col_offset")
-        
-        args = [
-            self._create_location_literal(node),
-            self._create_tags_literal(node),
-        ]
-        
-        return ast.Call (
+    def _create_simple_marker_call(self, node, fun_name, node_table):
+        call = ast.Call (
             func=ast.Name(id=fun_name, ctx=ast.Load()),
-            args=args,
+            args=[ast.Num(n=self._get_node_id(node, node_table))],
             keywords=[]
         )
+        
+        for new_node in (call, call.func, call.args[0]):
+            ast.copy_location(new_node, node)
+        
+        return call
     
     def _debug(self, *args):
-        print("TRACER:", *args, file=self._vm._original_stderr)
+        # called for every progress event, so don't even format the message in vain
+        if logger.isEnabledFor(logging.DEBUG):
+            print("TRACER:", *args, file=self._vm._original_stderr)
+
+class _InstrumentedNode:
+    """Properties of an instrumented AST node needed when its marker function gets called"""
+    
+    def __init__(self, text_range, tags, tags_string, parent_range):
+        self.focus = TextRange(*text_range)
+        self.tags = tags
+        self.parent_focus = None if parent_range is None else TextRange(*parent_range)
+        # shared by all events of the node, must not be modified 
+        self.event_args = {"text_range" : text_range, 
+                           "node_tags" : tags_string, 
+                           "parent_range" : parent_range}
+
 
 class CustomStackFrame:
     def __init__(self, frame, last_event, focus=None):
@@ -1326,7 +2138,329 @@ class CustomStackFrame:
         self.system_frame = frame
         self.last_event = last_event
         self.focus = None
+        self.exported_locals = None # name -> (value, exported value) as last sent to the client
+        self.exported_event_info = None
+        self.shown_values = [] # values of the expressions of current statement sent to the client
         
+
+def _is_dataframe(value):
+    return (type(value).__name__ == "DataFrame"
+            and type(value).__module__.split(".")[0] == "pandas")
+
+def _to_simple_cell(value):
+    """Makes DataFrame cell transferable (eg. Timestamps become strings)"""
+    if value is None or type(value) in (int, float, str, bool):
+        return value
+    elif type(value).__module__ == "numpy" and hasattr(value, "item"):
+        # numpy scalar
+        return _to_simple_cell(value.item())
+    else:
+        return str(value)
+
+def _get_column_stats(column):
+    """Returns summary of a DataFrame column. Uses only vectorized operations"""
+    stats = {"count" : int(column.count())}
+    if column.dtype.kind in "iufb":
+        try:
+            stats["mean"] = float(column.mean())
+            stats["min"] = _to_simple_cell(column.min())
+            stats["max"] = _to_simple_cell(column.max())
+        except:
+            logger.exception("Couldn't compute column stats")
+    return stats
+
+
+class ObjectRegistry:
+    """Remembers exported objects so that they can be later inspected by id.
+    
+    Objects supporting weak references are kept only as long as the program 
+    uses them. Others are kept with strong references, but only max_size most 
+    recently used objects are remembered. Pinned objects are remembered 
+    (strongly) until their owner pins something else.
+    """
+    def __init__(self, max_size):
+        self._max_size = max_size
+        self._entries = collections.OrderedDict() # id -> weakref or (value,)
+        self._pinned = {} # owner -> {id : value}
+    
+    def add(self, value):
+        object_id = id(value)
+        try:
+            entry = weakref.ref(value)
+        except TypeError:
+            entry = (value,)
+        
+        self._entries[object_id] = entry
+        self._entries.move_to_end(object_id)
+        
+        while len(self._entries) > self._max_size:
+            self._entries.popitem(last=False)
+        
+        return object_id
+    
+    def get(self, object_id):
+        """Raises KeyError if object is unknown, evicted or garbage collected"""
+        return self._lookup(object_id, True)
+    
+    def __contains__(self, object_id):
+        try:
+            self._lookup(object_id, False)
+            return True
+        except KeyError:
+            return False
+    
+    def set_pinned(self, owner, object_ids):
+        """Replaces owner's pinned objects. Ids must be known to the registry"""
+        pinned_objects = {}
+        for object_id in object_ids:
+            try:
+                pinned_objects[object_id] = self.get(object_id)
+            except KeyError:
+                pass
+        
+        self._pinned[owner] = pinned_objects
+    
+    def set_pinned_values(self, owner, values):
+        """Replaces owner's pinned objects with given values"""
+        self._pinned[owner] = {id(value) : value for value in values}
+    
+    def items(self):
+        """Returns list of (id, value) pairs of all live objects, least recently used first"""
+        result = collections.OrderedDict()
+        for object_id, entry in list(self._entries.items()):
+            value = self._get_entry_value(entry)
+            if value is _DEAD:
+                del self._entries[object_id]
+            else:
+                result[object_id] = value
+        
+        for pinned_objects in self._pinned.values():
+            result.update(pinned_objects)
+        
+        return list(result.items())
+    
+    def get_size(self):
+        return len(self.items())
+    
+    def get_memory_usage(self):
+        """Returns total shallow size of live objects in bytes"""
+        total = 0
+        for _, value in self.items():
+            try:
+                total += sys.getsizeof(value)
+            except:
+                pass
+        return total
+    
+    def _lookup(self, object_id, mark_used):
+        for pinned_objects in self._pinned.values():
+            if object_id in pinned_objects:
+                return pinned_objects[object_id]
+        
+        value = self._get_entry_value(self._entries[object_id])
+        if value is _DEAD:
+            del self._entries[object_id]
+            raise KeyError(object_id)
+        
+        if mark_used:
+            self._entries.move_to_end(object_id)
+        return value
+    
+    def _get_entry_value(self, entry):
+        if isinstance(entry, tuple):
+            return entry[0]
+        
+        value = entry()
+        if value is None:
+            # None can't be weakly referenced, so this object has died
+            return _DEAD
+        else:
+            return value
+
+_DEAD = object()
+
+
+def _cache_code_info(cache, code, value):
+    """Stores value in cache (dict keyed by code id) without keeping the code alive.
+    
+    The entry gets removed when the code dies, so that its id can't get reused."""
+    key = id(code)
+    cache[key] = (weakref.ref(code, lambda ref: cache.pop(key, None)), value)
+
+
+def _get_code_tree(code):
+    """Returns given code object and all code objects nested in it (depth-first)"""
+    result = [code]
+    for const in code.co_consts:
+        if isinstance(const, types.CodeType):
+            result.extend(_get_code_tree(const))
+    
+    return result
+
+
+class FigureRenderCache:
+    """Keeps recently rendered PNG images of matplotlib figures.
+
+    Images are keyed by figure id, figure revision and pixel size of the image.
+    Figure gets a new revision whenever any of its artists change (matplotlib
+    propagates these changes to figure's stale_callback). Revisions are unique
+    across all figures, so a new figure reusing the id of a dead one can't hit
+    its images.
+
+    Least recently used images get evicted when total size exceeds max_bytes.
+    """
+    def __init__(self, max_bytes):
+        self._max_bytes = max_bytes
+        self._images = collections.OrderedDict()
+        self._total_bytes = 0
+        self._revisions = weakref.WeakKeyDictionary()
+        self._revision_counter = itertools.count(1)
+        self._rendering = False
+
+    def get_png(self, figure, width, height):
+        """Returns bytes of PNG image of given pixel size"""
+        key = (id(figure), self.get_revision(figure), width, height)
+        if key in self._images:
+            self._images.move_to_end(key)
+            return self._images[key]
+
+        # images of previous revisions are useless
+        for old_key in [k for k in self._images if k[0] == key[0] and k[1] != key[1]]:
+            self._total_bytes -= len(self._images.pop(old_key))
+
+        data = self._render(figure, width, height)
+        self._images[key] = data
+        self._total_bytes += len(data)
+        while self._total_bytes > self._max_bytes and len(self._images) > 1:
+            _, evicted = self._images.popitem(last=False)
+            self._total_bytes -= len(evicted)
+
+        return data
+
+    def has_png(self, figure, width, height):
+        return (id(figure), self.get_revision(figure), width, height) in self._images
+
+    def get_revision(self, figure):
+        if figure not in self._revisions:
+            self._observe(figure)
+            self.invalidate(figure)
+
+        return self._revisions[figure]
+
+    def invalidate(self, figure):
+        """Makes all cached images of the figure unreachable"""
+        self._revisions[figure] = next(self._revision_counter)
+
+    def get_total_bytes(self):
+        return self._total_bytes
+
+    def _observe(self, figure):
+        original_callback = figure.stale_callback
+
+        def stale_callback(fig, val):
+            # savefig temporarily changes dpi, which makes the figure stale
+            if val and not self._rendering:
+                self.invalidate(fig)
+            if original_callback is not None:
+                original_callback(fig, val)
+
+        figure.stale_callback = stale_callback
+
+    def _render(self, figure, width, height):
+        # size of the figure is given in inches, resolution must do the rest
+        dpi = min(width / figure.get_figwidth(), height / figure.get_figheight())
+        fp = io.BytesIO()
+        self._rendering = True
+        try:
+            figure.savefig(fp, format="png", dpi=dpi)
+        finally:
+            self._rendering = False
+
+        return fp.getvalue()
+
+
+class InstrumentedCodeCache:
+    """Keeps marshalled instrumented code objects (with accompanying data) in a directory.
+
+    Files are named by a hash of the source, filename, compilation mode, 
+    bytecode version and tracer version (which includes modification times of
+    the instrumenting modules). This way outdated entries never get hit, they 
+    just age out -- least recently used files get removed when there are 
+    more than max_entries of them.
+    
+    Several backends may use the same directory, therefore files are written
+    atomically and all problems with the directory only cost a cache miss.
+    """
+    def __init__(self, directory, max_entries):
+        self._directory = directory
+        self._max_entries = max_entries
+        self._tracer_version = None
+    
+    def get_code(self, source, filename, mode, create_code, is_valid=None):
+        """
+        Returns cached or new result of create_code(source, filename, mode).
+        The result must be a code object or a marshallable structure containing it.
+        is_valid checks whether a cached result has the form create_code gives
+        (by default it must be a code object). Invalid entries get recreated.
+        """
+        if is_valid is None:
+            is_valid = lambda result: isinstance(result, types.CodeType)
+        
+        path = os.path.join(self._directory, 
+                            self._get_key(source, filename, mode) + ".marshal")
+        try:
+            with open(path, "rb") as fp:
+                result = marshal.load(fp)
+            if is_valid(result):
+                os.utime(path) # mark as recently used
+                return result
+        except (OSError, EOFError, ValueError, TypeError):
+            pass
+        
+        result = create_code(source, filename, mode)
+        try:
+            self._store(path, result)
+            self._remove_old_entries()
+        except OSError:
+            logger.exception("Could not cache instrumented code")
+        
+        return result
+    
+    def _get_key(self, source, filename, mode):
+        if self._tracer_version is None:
+            self._tracer_version = "%d-%d-%d" % (TRACER_VERSION, 
+                                                 os.stat(__file__).st_mtime_ns,
+                                                 os.stat(ast_utils.__file__).st_mtime_ns)
+        
+        parts = [self._tracer_version, importlib.util.MAGIC_NUMBER.hex(),
+                 mode, filename, source]
+        return hashlib.sha1("\0".join(parts).encode("UTF-8", "surrogatepass")).hexdigest()
+    
+    def _store(self, path, value):
+        os.makedirs(self._directory, exist_ok=True)
+        temp_path = "%s.%d.tmp" % (path, os.getpid())
+        with open(temp_path, "wb") as fp:
+            marshal.dump(value, fp)
+        os.replace(temp_path, path)
+    
+    def _remove_old_entries(self):
+        entries = []
+        for name in os.listdir(self._directory):
+            path = os.path.join(self._directory, name)
+            try:
+                entries.append((os.stat(path).st_mtime, path))
+            except OSError:
+                # removed by another backend 
+                pass
+        
+        entries.sort()
+        for _, path in entries[:max(len(entries) - self._max_entries, 0)]:
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+
+
 class ThonnyClientError(Exception):
     pass
     
@@ -1369,3 +2503,185 @@ class _PathSet:
     def __iter__(self):
         for item in self._normcase_set:
             yield item
+
+
+def bounded_repr(value, budget):
+    """Returns repr(value) if it fits into budget characters, otherwise
+    its prefix ending with "..." (total length is budget).
+    
+    Builtin containers (and their subclasses), strings, numpy arrays and 
+    pandas objects are processed so that the work is proportional to budget, 
+    not to the size of the object. Other objects get repr-ed normally and then cut.
+    
+    Container subclasses with their own __repr__ (eg. namedtuple, OrderedDict)
+    get their normal repr only when they are small. Otherwise the result is
+    the class name followed by the elements in builtin container syntax.
+    """
+    builder = _BoundedReprBuilder(budget)
+    try:
+        builder.add_value(value)
+    except _ReprBudgetExhausted:
+        return "".join(builder.parts)[:max(budget-3, 0)] + "..."
+    
+    return "".join(builder.parts)
+
+
+_CONTAINER_TYPES = (dict, list, tuple, set, frozenset)
+
+def _get_container_base_type(value):
+    for base_type in _CONTAINER_TYPES:
+        if isinstance(value, base_type):
+            return base_type
+    
+    raise AssertionError("Not a container")
+
+
+class _ReprBudgetExhausted(Exception):
+    pass
+
+
+class _BoundedReprBuilder:
+    def __init__(self, budget):
+        self.budget = budget
+        self.parts = []
+        self.length = 0
+        self._active_container_ids = set()
+    
+    def add(self, s):
+        self.parts.append(s)
+        self.length += len(s)
+        if self.length > self.budget:
+            raise _ReprBudgetExhausted()
+    
+    def add_value(self, value):
+        value_type = type(value)
+        remaining = self.budget - self.length
+        
+        if value_type in (str, bytes, bytearray):
+            # repr of a slice is cheap and its prefix is the prefix of full repr
+            if len(value) > remaining:
+                self.add(repr(_get_quote_preserving_slice(value, remaining+1)))
+            else:
+                self.add(repr(value))
+        elif isinstance(value, _CONTAINER_TYPES):
+            base_type = _get_container_base_type(value)
+            if id(value) in self._active_container_ids:
+                # same as builtin repr of recursive structures
+                if base_type == list:
+                    self.add("[...]")
+                elif base_type == tuple:
+                    self.add("(...)")
+                elif base_type == dict:
+                    self.add("{...}")
+                else:
+                    self.add(value_type.__name__ + "(...)")
+            else:
+                self._active_container_ids.add(id(value))
+                try:
+                    if value_type.__repr__ is base_type.__repr__:
+                        self._add_container(value, base_type)
+                    else:
+                        self._add_custom_container(value, base_type)
+                finally:
+                    self._active_container_ids.remove(id(value))
+        elif value_type.__name__ == "ndarray" and value_type.__module__ == "numpy":
+            self.add(_get_numpy_repr(value, remaining))
+        elif (value_type.__name__ in ("DataFrame", "Series") 
+              and value_type.__module__.split(".")[0] == "pandas"):
+            self.add(_get_pandas_repr(value, remaining))
+        else:
+            self.add(repr(value))
+    
+    def _add_container(self, value, base_type):
+        # items are accessed via base type, like builtin repr does
+        value_type = type(value)
+        if base_type == dict:
+            self.add("{")
+            for i, (key, item) in enumerate(dict.items(value)):
+                if i > 0:
+                    self.add(", ")
+                self.add_value(key)
+                self.add(": ")
+                self.add_value(item)
+            self.add("}")
+            return
+        
+        if base_type in (set, frozenset) and len(value) == 0:
+            self.add(value_type.__name__ + "()")
+            return
+        
+        if base_type == list:
+            opening, closing = "[", "]"
+        elif base_type == tuple:
+            opening, closing = "(", ",)" if len(value) == 1 else ")"
+        elif value_type == set:
+            opening, closing = "{", "}"
+        else:
+            opening, closing = value_type.__name__ + "({", "})"
+        
+        self.add(opening)
+        for i, item in enumerate(base_type.__iter__(value)):
+            if i > 0:
+                self.add(", ")
+            self.add_value(item)
+        self.add(closing)
+    
+    def _add_custom_container(self, value, base_type):
+        part_count = len(self.parts)
+        length = self.length
+        
+        # when this runs out of budget, the result remains as it is
+        self.add(type(value).__name__ + "(")
+        self._add_container(value, base_type)
+        self.add(")")
+        
+        # object is small, so its own repr shouldn't be expensive
+        del self.parts[part_count:]
+        self.length = length
+        self.add(repr(value))
+
+
+def _get_quote_preserving_slice(value, length):
+    """Returns value[:length] (str, bytes or bytearray), possibly with an extra
+    quote character at the end, so that its repr uses the same quotes as repr(value).
+    
+    repr uses double quotes only when there are single quotes and no double quotes.
+    """
+    if type(value) == str:
+        single_quote, double_quote = "'", '"'
+    else:
+        single_quote, double_quote = b"'", b'"'
+    
+    part = value[:length]
+    if single_quote in value and double_quote not in value:
+        if single_quote not in part:
+            part += single_quote
+    elif single_quote in part and double_quote not in part:
+        part += double_quote
+    
+    return part
+
+
+def _get_numpy_repr(value, budget):
+    import numpy  # @UnresolvedImport
+    threshold = numpy.get_printoptions()["threshold"]
+    # numpy summarizes arrays having more than threshold elements
+    numpy.set_printoptions(threshold=min(threshold, budget))
+    try:
+        return repr(value)
+    finally:
+        numpy.set_printoptions(threshold=threshold)
+
+def _get_pandas_repr(value, budget):
+    import pandas  # @UnresolvedImport
+    # pandas shows head and tail when there are more than max_rows rows
+    max_rows = max(budget // 20, 2)
+    if pandas.get_option("display.max_rows"):
+        max_rows = min(max_rows, pandas.get_option("display.max_rows"))
+    max_columns = max(budget // 10, 2)
+    if pandas.get_option("display.max_columns"):
+        max_columns = min(max_columns, pandas.get_option("display.max_columns"))
+    
+    with pandas.option_context("display.max_rows", max_rows,
+                               "display.max_columns", max_columns):
+        return repr(value)
@@ -4,6 +4,11 @@
 Classes used both by front-end and back-end
 """
 import shlex
+import struct
+import pickle
+import builtins
+import io
+import threading
 
 class Record:
     def __init__(self, **kw):
@@ -106,6 +111,33 @@ class FrameInfo(Record):
         )
 
 
+def update_stack(stack, frame_exports, code_sources):
+    """
+    Backend sends only what has changed in the frames since previous message
+    (see FancyTracer._export_stack). Returns complete FrameInfo-s built from
+    previous complete stack and the exports. Frames which didn't change keep 
+    their FrameInfo object. code_sources (code_id -> source) gets updated.
+    """
+    old_frame_infos = {frame_info.id : frame_info for frame_info in stack}
+    result = []
+    
+    for frame_export in frame_exports:
+        frame_info = old_frame_infos.get(frame_export.id)
+        changes = frame_export.__dict__
+        
+        if hasattr(frame_export, "code_id"):
+            # new frame
+            if hasattr(frame_export, "source"):
+                code_sources[frame_export.code_id] = frame_export.source
+            frame_info = FrameInfo(**dict(changes, source=code_sources[frame_export.code_id]))
+        elif len(changes) > 1:
+            frame_info = FrameInfo(**dict(frame_info.__dict__, **changes))
+        
+        result.append(frame_info)
+    
+    return result
+
+
 class ToplevelCommand(Record):
     pass
 
@@ -161,6 +193,147 @@ def parse_message(msg_string):
     return eval(msg_string.encode("ASCII").decode("UTF-7"))
 
 
+# Message protocols.
+# Text protocol (one repr-line per message) is always available and is used
+# until the backend announces (in its first message) which protocol it chose
+# among the ones listed by the frontend in THONNY_MESSAGE_PROTOCOLS.
+# Binary protocol frames each message as 4-byte big-endian payload length
+# followed by pickle (protocol 4, understood by all supported Python versions)
+# of the message. Only Record subclasses from this module and few builtin types
+# can be unpickled.
+TEXT_PROTOCOL = "text"
+BINARY_PROTOCOL = "binary1"
+SUPPORTED_PROTOCOLS = [BINARY_PROTOCOL, TEXT_PROTOCOL]
+MESSAGE_PROTOCOLS_ENV_VAR = "THONNY_MESSAGE_PROTOCOLS"
+
+_FRAME_HEADER = struct.Struct(">I")
+_PICKLE_PROTOCOL = 4
+_ALLOWED_BUILTINS = {"complex", "set", "frozenset", "bytearray", "slice", "range"}
+
+
+class _MessageUnpickler(pickle.Unpickler):
+    def find_class(self, module, name):
+        # common lives in different packages in frontend and backend
+        if (module in ("thonny.common", "thonny.shared.thonny.common")
+            and isinstance(globals().get(name), type)
+            and issubclass(globals()[name], Record)):
+            return globals()[name]
+        elif module == "builtins" and name in _ALLOWED_BUILTINS:
+            return getattr(builtins, name)
+        else:
+            raise pickle.UnpicklingError("Forbidden type in message: %s.%s" % (module, name))
+
+
+def choose_message_protocol(offered_protocols):
+    """Returns first protocol from comma-separated offer, which is supported here"""
+    for protocol in offered_protocols.split(","):
+        if protocol.strip() in SUPPORTED_PROTOCOLS:
+            return protocol.strip()
+
+    return TEXT_PROTOCOL
+
+def encode_message(msg, protocol):
+    """Returns bytes representing one message in the stream"""
+    if protocol == BINARY_PROTOCOL:
+        payload = pickle.dumps(msg, protocol=_PICKLE_PROTOCOL)
+        return _FRAME_HEADER.pack(len(payload)) + payload
+    else:
+        return (serialize_message(msg) + "\n").encode("ASCII")
+
+def write_message(stream, msg, protocol):
+    """Writes the message to a binary stream"""
+    stream.write(encode_message(msg, protocol))
+    stream.flush()
+
+def read_message(stream, protocol):
+    """Reads next message from a binary stream. Returns None on EOF"""
+    data = read_message_bytes(stream, protocol)
+    if data is None:
+        return None
+    else:
+        return decode_message(data, protocol)
+
+def read_message_bytes(stream, protocol):
+    """Reads bytes of next message from a binary stream without decoding. 
+    Returns None on EOF"""
+    if protocol == BINARY_PROTOCOL:
+        header = _read_exactly(stream, _FRAME_HEADER.size)
+        if header is None:
+            return None
+
+        return _read_exactly(stream, _FRAME_HEADER.unpack(header)[0])
+    else:
+        line = stream.readline()
+        if line == b"":
+            return None
+
+        return line
+
+def decode_message(data, protocol):
+    if protocol == BINARY_PROTOCOL:
+        return _MessageUnpickler(io.BytesIO(data)).load()
+    else:
+        return parse_message(data.decode("ASCII"))
+
+def _read_exactly(stream, size):
+    data = stream.read(size)
+    while data and len(data) < size:
+        # pipes may return less than asked
+        more = stream.read(size - len(data))
+        if not more:
+            break
+        data += more
+
+    if len(data) < size:
+        return None
+    else:
+        return data
+
+
+class ChannelStats:
+    """Collects counts, sizes and durations of operations in the 
+    frontend-backend channel, grouped by operation and message kind"""
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._data = {}
+    
+    def record(self, operation, key, size=0, duration=0.0):
+        with self._lock:
+            entries = self._data.setdefault(operation, {})
+            if key not in entries:
+                entries[key] = {"count" : 0, "bytes" : 0, "time" : 0.0, "max_time" : 0.0}
+            entry = entries[key]
+            entry["count"] += 1
+            entry["bytes"] += size
+            entry["time"] += duration
+            if duration > entry["max_time"]:
+                entry["max_time"] = duration
+    
+    def get_data(self):
+        """Returns {operation : {key : {count, bytes, time, max_time}}}"""
+        with self._lock:
+            return {operation : {key : entry.copy() for key, entry in entries.items()}
+                    for operation, entries in self._data.items()}
+    
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+
+def get_message_stats_key(msg):
+    """Message type (or command class) combined with command name"""
+    if isinstance(msg, Record):
+        kind = type(msg).__name__
+        command = getattr(msg, "command", None)
+    else:
+        kind = msg.get("message_type")
+        command = msg.get("command")
+    
+    if command:
+        return "{}/{}".format(kind, command)
+    else:
+        return kind
+
 
 def quote_path_for_shell(path):
     for c in path:
@@ -19,6 +19,8 @@ from thonny.tktextext import index2line
 class ShellView (ttk.Frame):
     def __init__(self, master, **kw):
         ttk.Frame.__init__(self, master, **kw)
+        # older lines get removed when shell grows bigger than this (0 means no limit)
+        get_workbench().set_default("shell.max_lines", 0)
         
         self.vert_scrollbar = ttk.Scrollbar(self, orient=tk.VERTICAL)
         self.vert_scrollbar.grid(row=0, column=2, sticky=tk.NSEW)
@@ -78,6 +80,7 @@ class ShellText(EnhancedTextWithLogging, PythonText):
         self.bindtags(self.bindtags() + ('ShellText',))
         
         self._before_io = True
+        self._discarded_lines = 0 # removed by _discard_old_content
         self._command_history = [] # actually not really history, because each command occurs only once
         self._command_history_current_index = None
         
@@ -123,6 +126,7 @@ class ShellText(EnhancedTextWithLogging, PythonText):
         self.tag_configure("stdin", foreground="Blue")
         self.tag_configure("stdout", foreground="Black")
         self.tag_configure("stderr", foreground="Red")
+        self.tag_configure("elided", foreground="DarkGray")
         self.tag_configure("hyperlink", foreground="#3A66DD", underline=True)
         self.tag_bind("hyperlink", "<ButtonRelease-1>", self._handle_hyperlink)
         self.tag_bind("hyperlink", "<Enter>", self._hyperlink_enter)
@@ -183,16 +187,43 @@ class ShellText(EnhancedTextWithLogging, PythonText):
     def _handle_program_output(self, msg):
         self["font"] = get_workbench().get_font("IOFont")
         
+        if hasattr(msg, "elided_chars"):
+            # Backend produced output faster than it could be shown
+            msg.data = "\n[... {} characters of output skipped ...]\n".format(msg.elided_chars)
+            stream_tags = ("io", "elided")
+        else:
+            stream_tags = ("io", msg.stream_name)
+        
         # mark first line of io
         if self._before_io:
-            self._insert_text_directly(msg.data[0], ("io", msg.stream_name, "vertically_spaced"))
+            self._insert_text_directly(msg.data[0], stream_tags + ("vertically_spaced",))
             self._before_io = False
-            self._insert_text_directly(msg.data[1:], ("io", msg.stream_name))
+            self._insert_text_directly(msg.data[1:], stream_tags)
         else:
-            self._insert_text_directly(msg.data, ("io", msg.stream_name))
+            self._insert_text_directly(msg.data, stream_tags)
         
         self.mark_set("output_end", self.index("end-1c"))
+        self._discard_old_content()
         self.see("end")
+    
+    def _discard_old_content(self):
+        max_lines = get_workbench().get_option("shell.max_lines")
+        if not max_lines:
+            return
+        
+        # remove in bigger chunks, so that it doesn't need to be done after each message
+        proposed_cut = index2line(self.index("output_end")) - max_lines
+        if proposed_cut > max_lines // 10:
+            if self._discarded_lines:
+                # first line is the marker of earlier removal
+                self._discarded_lines -= 1
+            self._discarded_lines += proposed_cut - 1
+            self.direct_delete("1.0", str(proposed_cut) + ".0")
+            self.direct_insert("1.0", 
+                               "[... {} older lines removed ...]\n".format(self._discarded_lines),
+                               ("io", "elided"))
+            # undo stack would keep the removed text in memory
+            self.edit_reset()
             
     def _handle_toplevel_result(self, msg):
         self["font"] = get_workbench().get_font("EditorFont")
@@ -590,6 +621,7 @@ class ShellText(EnhancedTextWithLogging, PythonText):
     def _clear_shell(self):
         end_index = self.index("output_end")
         self.direct_delete("1.0", end_index)
+        self._discarded_lines = 0
 
     def compute_smart_home_destination_index(self):
         """Is used by EnhancedText"""
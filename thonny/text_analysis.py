@@ -0,0 +1,187 @@
+"""
+Shared analysis of the code in a text widget.
+
+Several plugins need the code of an editor in parsed form (tokens, ast,
+Jedi's parse tree). TextAnalysis computes tokens and ast lazily and at most
+once per revision of the text, so that plugins don't need to fetch and parse
+the code separately.
+
+Analysis which is too slow for Tk thread (including everything which needs
+Jedi's parse tree) is done in another thread with the CodeSnapshot of the
+revision (see SnapshotWorker), which doesn't refer to the text widget.
+"""
+
+import ast
+import io
+import logging
+import threading
+import tokenize
+
+import thonny.jedi_utils as jedi_utils
+
+# how often the Tk thread checks whether the computation in SnapshotWorker is done (ms)
+_POLL_INTERVAL = 20
+
+
+class TextAnalysis:
+    def __init__(self, text):
+        self.text = text
+        self.revision = 0 # increased with each change of the text
+        self._results = {}
+        self.text.bind("<<TextChange>>", self._on_text_change, True)
+
+    def get_cached(self, key, compute):
+        """Returns compute(self), which is computed at most once per revision.
+        Results of different computations are distinguished by key."""
+        if key not in self._results:
+            self._results[key] = compute(self)
+
+        return self._results[key]
+
+    def get_source(self):
+        """Returns the code including the final newline, which Tk text always has"""
+        return self.get_cached("source", lambda analysis: analysis.text.get("1.0", "end"))
+
+    def get_tokens(self):
+        """Returns the tokens of the code (up to the first tokenizing error)"""
+        return self.get_cached("tokens", lambda analysis: tokenize_source(analysis.get_source()))
+
+    def get_ast(self):
+        """Returns the ast of the code or None if the code has syntax errors"""
+        def parse(analysis):
+            try:
+                return ast.parse(analysis.get_source())
+            except SyntaxError:
+                return None
+
+        return self.get_cached("ast", parse)
+
+    def get_snapshot(self):
+        """Returns CodeSnapshot of current revision"""
+        return self.get_cached("snapshot",
+            lambda analysis: CodeSnapshot(analysis.revision, analysis.get_source()))
+
+    def _on_text_change(self, event):
+        self.revision += 1
+        self._results = {}
+
+
+class CodeSnapshot:
+    """Code of one revision of the text. Can be used in any thread."""
+    def __init__(self, revision, source):
+        self.revision = revision
+        self.source = source
+        self._jedi_module = None
+        self._jedi_module_lock = threading.Lock()
+
+    def get_jedi_module(self):
+        """Returns the root of Jedi's parse tree of the code. 
+        
+        The code gets parsed once, all users of the snapshot share the tree
+        and therefore must not modify it."""
+        with self._jedi_module_lock:
+            if self._jedi_module is None:
+                self._jedi_module = parse_jedi_module(self.source)
+
+            return self._jedi_module
+
+
+class SnapshotWorker:
+    """Computes compute(snapshot, *args) for the snapshot of the current revision
+    of the text in a background thread and passes the result to 
+    handle_result(result, snapshot, *args) in Tk thread.
+    
+    Only the latest request gets processed, the results of earlier requests 
+    and of old revisions of the text are discarded."""
+    def __init__(self, text, compute, handle_result):
+        self.text = text
+        self._compute = compute
+        self._handle_result = handle_result
+        self._request_serial = 0
+        self._poll_job = None
+        self._lock = threading.Lock() # protects the fields below, used by the thread
+        self._request = None # (serial, snapshot, args) waiting for the thread
+        self._result = None # (serial, snapshot, args, result)
+        self._thread = None
+    
+    def request(self, *args):
+        self._request_serial += 1
+        snapshot = get_text_analysis(self.text).get_snapshot()
+        with self._lock:
+            self._request = (self._request_serial, snapshot, args)
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._process_requests, daemon=True)
+                self._thread.start()
+        
+        if self._poll_job is None:
+            self._poll_job = self.text.after(_POLL_INTERVAL, self._poll_result)
+    
+    def cancel(self):
+        """Makes the results of earlier requests get discarded"""
+        self._request_serial += 1
+    
+    def is_busy(self):
+        return self._thread is not None or self._poll_job is not None
+    
+    def _process_requests(self):
+        while True:
+            with self._lock:
+                request = self._request
+                self._request = None
+                if request is None:
+                    self._thread = None
+                    return
+            
+            serial, snapshot, args = request
+            try:
+                result = self._compute(snapshot, *args)
+            except:
+                logging.exception("Problem when analysing code")
+                continue
+            
+            with self._lock:
+                self._result = (serial, snapshot, args, result)
+    
+    def _poll_result(self):
+        self._poll_job = None
+        if not self.text.winfo_exists():
+            return
+        
+        with self._lock:
+            result = self._result
+            self._result = None
+            busy = self._thread is not None
+        
+        if result is not None:
+            serial, snapshot, args, value = result
+            if (serial == self._request_serial 
+                and snapshot.revision == get_text_analysis(self.text).revision):
+                self._handle_result(value, snapshot, *args)
+        
+        if busy:
+            self._poll_job = self.text.after(_POLL_INTERVAL, self._poll_result)
+
+
+def get_text_analysis(text):
+    if not hasattr(text, "text_analysis"):
+        text.text_analysis = TextAnalysis(text)
+
+    return text.text_analysis
+
+def parse_jedi_module(source):
+    """Returns the root of Jedi's parse tree of source"""
+    from jedi import Script
+    with jedi_utils.jedi_lock:
+        script = Script(source + ")") # https://github.com/davidhalter/jedi/issues/897
+        return jedi_utils.get_module_node(script)
+
+def tokenize_source(source):
+    tokens = []
+    try:
+        for token in tokenize.tokenize(io.BytesIO(source.encode('utf-8')).readline):
+            tokens.append(token)
+    except Exception:
+        # happens eg when parens are unbalanced or there is indentation error or ...
+        pass
+
+    return tokens
@@ -786,6 +786,88 @@ def index2line(index):
 def line2index(line):
     return str(float(line))
 
+def set_tag_ranges(text, ranges_by_tag, start="1.0", end="end"):
+    """Makes each tag in ranges_by_tag cover exactly given ranges between start and end.
+
+    Ranges are pairs of indices in line.col form. Only differences from current
+    tagging are applied, each tag gets at most one remove and one add command."""
+    if start == "1.0" and end == "end":
+        old_ranges_by_tag = {tag : _pair_up(text.tag_ranges(tag)) for tag in ranges_by_tag}
+    else:
+        old_ranges_by_tag = _get_tag_ranges_in_region(text, ranges_by_tag, start, end)
+
+    for tag, ranges in ranges_by_tag.items():
+        ranges_to_remove, ranges_to_add = get_tag_range_changes(old_ranges_by_tag[tag], ranges)
+        if ranges_to_remove:
+            remove_tag_ranges(text, tag, ranges_to_remove)
+        if ranges_to_add:
+            text.tag_add(tag, *[index for rng in ranges_to_add for index in rng])
+
+def remove_tag_ranges(text, tag, ranges):
+    """Removes tag from all given ranges with one command
+    (Text.tag_remove accepts only one range)"""
+    text.tk.call(text._w, "tag", "remove", tag,
+                 *[index for rng in ranges for index in rng])
+
+def get_tag_range_changes(old_ranges, new_ranges):
+    """Returns ranges which need to be removed from and added to a tag covering
+    old_ranges so that it covers new_ranges"""
+    old_ranges = merge_ranges(old_ranges)
+    new_ranges = merge_ranges(new_ranges)
+    old_range_set = set(old_ranges)
+    new_range_set = set(new_ranges)
+    return ([rng for rng in old_ranges if rng not in new_range_set],
+            [rng for rng in new_ranges if rng not in old_range_set])
+
+def merge_ranges(ranges):
+    """Sorts ranges (pairs of indices in line.col form), drops empty ones and
+    joins the ones which overlap or touch, like Tk does with tag ranges"""
+    def to_tuple(index):
+        line, col = index.split(".")
+        return int(line), int(col)
+
+    result = []
+    last_end = None
+    for start_pos, end_pos, start, end in sorted((to_tuple(start), to_tuple(end), start, end)
+                                                 for start, end in ranges):
+        if end_pos <= start_pos:
+            continue
+        elif result and start_pos <= last_end:
+            if end_pos > last_end:
+                result[-1] = (result[-1][0], end)
+                last_end = end_pos
+        else:
+            result.append((start, end))
+            last_end = end_pos
+
+    return result
+
+def _pair_up(indices):
+    return [(str(indices[i]), str(indices[i+1])) for i in range(0, len(indices), 2)]
+
+def _get_tag_ranges_in_region(text, tags, start, end):
+    """Returns ranges of given tags clipped to the region"""
+    start = text.index(start)
+    end = text.index(end)
+    result = {tag : [] for tag in tags}
+    range_starts = {tag : start for tag in text.tag_names(start) if tag in result}
+
+    # dump gives only the toggles inside the region
+    items = text.tk.splitlist(text.tk.call(text._w, "dump", "-tag", start, end))
+    for i in range(0, len(items), 3):
+        key, tag, index = str(items[i]), str(items[i+1]), str(items[i+2])
+        if tag not in result:
+            continue
+        elif key == "tagon":
+            range_starts.setdefault(tag, index)
+        elif tag in range_starts:
+            result[tag].append((range_starts.pop(tag), index))
+
+    for tag, range_start in range_starts.items():
+        result[tag].append((range_start, end))
+
+    return result
+
 def fixwordbreaks(root):
     # Adapted from idlelib.EditorWindow (Python 3.4.2)
     # Modified to include non-ascii chars
@@ -26,6 +26,10 @@ DQSTRING_CLOSED = STRINGPREFIX + r'"[^"\\\n]*(\\.[^"\\\n]*)*"'
 SQ3STRING = STRINGPREFIX + r"'''[^'\\]*((\\.|'(?!''))[^'\\]*)*(''')?"
 DQ3STRING = STRINGPREFIX + r'"""[^"\\]*((\\.|"(?!""))[^"\\]*)*(""")?'
 
+# Rest of a triple-quoted string (after the opening delimiter or a line break)
+SQ3STRING_REST = r"[^'\\]*((\\.|'(?!''))[^'\\]*)*(?P<CLOSING3>''')?"
+DQ3STRING_REST = r'[^"\\]*((\\.|"(?!""))[^"\\]*)*(?P<CLOSING3>""")?'
+
 SQ3DELIMITER = STRINGPREFIX + "'''"
 DQ3DELIMITER = STRINGPREFIX + '"""'
 